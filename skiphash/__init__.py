@@ -1,5 +1,11 @@
+import os
 import socket
 
+# The environment variable that, if set, overrides the detected host address
+HOST_ENVIRONMENT_VARIABLE = "SKIPHASH_HOST"
+
+_thisHost = None
+
 def get_ip():
     """
     Returns the local machine's primary IP address.
@@ -14,4 +20,28 @@ def get_ip():
         s.close()
     return ip
 
-thisHost = get_ip()
+def getThisHost() -> str:
+    """
+    Returns the address under which the local nodes are reachable by other hosts.
+    It is determined on first use: set by setThisHost, taken from the
+    SKIPHASH_HOST environment variable or detected by get_ip, in that order.
+    """
+    global _thisHost
+    if _thisHost is None:
+        _thisHost = os.environ.get(HOST_ENVIRONMENT_VARIABLE) or get_ip()
+    return _thisHost
+
+def setThisHost(host: str) -> None:
+    """
+    Sets the address under which the local nodes are reachable by other hosts.
+    Has to be called before the first node is created.
+    """
+    global _thisHost
+    _thisHost = host
+
+def __getattr__(name: str):
+    # `thisHost` is computed lazily, so importing skiphash does not need the network
+    # (module level __getattr__ needs python 3.7, see PEP 562)
+    if name == "thisHost":
+        return getThisHost()
+    raise AttributeError("module 'skiphash' has no attribute '{}'".format(name))
@@ -7,18 +7,7 @@ import logging
 import sys
 
 from twisted.application.internet import TimerService
-
-import gi
-gi.require_version('Gtk', '3.0')
-from twisted.internet import gtk3reactor
-gtk3reactor.install() # If this does not happen right here, importing the reactor won't work.
-from twisted.internet import reactor
-
-from skiphash.skipplus import SkipNode, SkipNodeFactory
-from skiphash.view import Visualizer
-
-# For twisted reactor method calls:
-# pylint: disable=maybe-no-member
+from twisted.python.failure import Failure
 
 # setup stdout logging
 
@@ -38,25 +27,167 @@ parser.add_argument('-n', '--nodes', type=int, default=1,
                     help='The number of nodes to be run locally. Defaults to 1.')
 parser.add_argument('-p', '--port', type=int, default=33000,
                     help='The port to be used by the first local node. Defaults to 33000.')
+parser.add_argument('--hash', action='store_true',
+                    help=('Runs hash nodes forming a distributed hash table instead of plain Skip+ nodes. '
+                          'They hand their entries over to the remaining nodes when they are shut down.'))
 parser.add_argument('-c', '--connect', type=str, default="",
                     help='If set, the local nodes will be connected to the host:port tuple specified after this flag.')
 parser.add_argument('-v', '--visualize', action='store_true',
                     help='Runs a graphic user interface with a visualization of the skip graph formed by the local nodes.')
+parser.add_argument('-r', '--render', type=str, default="",
+                    help=('If set, snapshots of the skip graph formed by the local nodes will periodically be rendered '
+                          'into files named by this pattern, e.g. "graph-{counter}.png" (.svg and .pdf work too). '
+                          'Does not need a display.'))
+parser.add_argument('--render-interval', type=float, default=10,
+                    help='The number of seconds between two rendered snapshots. Defaults to 10.')
+parser.add_argument('-s', '--snapshot', type=str, default="",
+                    help='If set, a topology snapshot of the local nodes will periodically be written to this file.')
+parser.add_argument('--snapshot-interval', type=float, default=60,
+                    help='The number of seconds between two topology snapshots. Defaults to 60.')
+parser.add_argument('--restore', type=str, default="",
+                    help=('If set, the local nodes will be restored from the topology snapshot in this file '
+                          'instead of creating new ones. Use the same port as for the snapshot.'))
+parser.add_argument('--asyncio', action='store_true',
+                    help='Runs the nodes on an asyncio event loop, e.g. for embedding them into asyncio applications.')
+parser.add_argument('--uvloop', action='store_true',
+                    help='Like --asyncio, but using the uvloop event loop (needs the uvloop package).')
+parser.add_argument('-P', '--processes', type=int, default=1,
+                    help=('The number of worker processes the local nodes will be distributed among, '
+                          'e.g. the number of cores. Defaults to 1.'))
+parser.add_argument('--offload', action='store_true',
+                    help=('Computes the nodes\' ranges and introductions in a thread pool, '
+                          'so large neighborhoods do not delay network I/O.'))
+parser.add_argument('--vectorized', action='store_true',
+                    help='Computes the nodes\' ranges using NumPy (needs the numpy package).')
+parser.add_argument('--rs-bytes', type=int, default=None,
+                    help=('The length of the nodes\' random bit strings in bytes. Defaults to a length '
+                          'suitable for the number of nodes (at least 2 bytes), or to the length '
+                          'used by the node specified by -c.'))
+parser.add_argument('--fast-join', action='store_true',
+                    help=('New nodes collect their neighborhood from the overlay in a few round trips '
+                          'instead of being moved to their place timeout by timeout.'))
+parser.add_argument('--host', type=str, default="",
+                    help=('The address under which the local nodes are reachable by other hosts. '
+                          'Defaults to the SKIPHASH_HOST environment variable or the primary IP address.'))
+parser.add_argument('--bind', type=str, default="",
+                    help='The address of the network interface the local nodes listen on. Defaults to all interfaces.')
+parser.add_argument('--last-port', type=int, default=None,
+                    help='The highest port that may be used by a local node. By default, there is no limit.')
+parser.add_argument('--unix-sockets', type=str, default="",
+                    help=('If set, the local nodes additionally listen on Unix sockets in this directory, '
+                          'and nodes on this machine using the same directory connect via these sockets.'))
 args = parser.parse_args()
 
-# Setup nodes
-if not args.connect:
-    factory = SkipNodeFactory(args.port)
-else:
-    host, port = args.connect.split(':')
-    factory = SkipNodeFactory(args.port, host, int(port))
+if args.last_port is not None and args.port + args.nodes - 1 > args.last_port:
+    parser.error("The ports from {} to {} do not suffice for {} nodes.".format(args.port, args.last_port, args.nodes))
 
-for _ in range(args.nodes):
-    factory.newNode()
+if args.processes > 1 and (args.visualize or args.render or args.snapshot or args.restore):
+    parser.error("Visualization, rendering and snapshots are not supported with multiple processes.")
 
-# Setup visualization
-if args.visualize:
-    Visualizer(factory)
+if (args.asyncio or args.uvloop) and args.visualize:
+    parser.error("The visualization needs the Gtk event loop and cannot be combined with --asyncio or --uvloop.")
+
+# Install the reactor. If this does not happen before importing
+# the reactor (or any skiphash module), importing the reactor won't work.
+# Without --visualize (or --asyncio and --uvloop), the platform's default reactor is used,
+# so Gtk does not need to be installed.
+
+if args.asyncio or args.uvloop:
+    import asyncio
+    if args.uvloop:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    from twisted.internet import asyncioreactor
+    asyncioreactor.install(asyncio.get_event_loop())
+elif args.visualize:
+    import gi
+    gi.require_version('Gtk', '3.0')
+    from twisted.internet import gtk3reactor
+    gtk3reactor.install()
+from twisted.internet import reactor
+
+from skiphash import setThisHost
+from skiphash.core import NetworkConfig, NodeReference
+from skiphash.skipplus import SkipNodeFactory, rsByteLengthFor
+from skiphash.snapshot import readSnapshotStates, writeSnapshot
+
+# For twisted reactor method calls:
+# pylint: disable=maybe-no-member
+
+if args.host:
+    setThisHost(args.host)
+
+def start(rsByteLength: int):
+    """Starts the worker processes or the local nodes using random bit strings of rsByteLength bytes."""
+    # Setup worker processes - they run the nodes instead of this process
+    if args.processes > 1:
+        from skiphash.cluster import ProcessPool
+        host, port = args.connect.split(':') if args.connect else (None, None)
+        workerArguments = ['--uvloop'] if args.uvloop else ['--asyncio'] if args.asyncio else []
+        for flag, value in (('--host', args.host), ('--bind', args.bind), ('--unix-sockets', args.unix_sockets)):
+            if value:
+                workerArguments += [flag, value]
+        workerArguments += ['--rs-bytes', str(rsByteLength)]
+        workerArguments += [flag for flag, isSet in (('--hash', args.hash), ('--offload', args.offload),
+                                                     ('--vectorized', args.vectorized), ('--fast-join', args.fast_join)) if isSet]
+        # each worker gets its own share of the ports up to --last-port
+        pool = ProcessPool(args.nodes, args.processes, args.port, host, port and int(port), workerArguments, args.last_port)
+        pool.start()
+        reactor.addSystemEventTrigger('before', 'shutdown', pool.shutdown)
+        return
+
+    # Setup nodes
+    nodeOptions = {"offloadComputation": args.offload, "vectorized": args.vectorized, "rsByteLength": rsByteLength}
+    networkConfig = NetworkConfig(args.bind, lastPort=args.last_port, unixSocketDirectory=args.unix_sockets or None)
+    factoryClass = SkipNodeFactory
+    if args.hash:
+        from skiphash.distrhash import HashNodeFactory
+        factoryClass = HashNodeFactory
+    if not args.connect:
+        factory = factoryClass(args.port, nodeOptions=nodeOptions, networkConfig=networkConfig, fastJoin=args.fast_join)
+    else:
+        host, port = args.connect.split(':')
+        factory = factoryClass(args.port, host, int(port), nodeOptions=nodeOptions, networkConfig=networkConfig,
+                               fastJoin=args.fast_join)
+
+    if args.restore:
+        with open(args.restore) as snapshotFile:
+            factory.restoreSnapshot(readSnapshotStates(snapshotFile))
+    else:
+        factory.newNodes(args.nodes)
+
+    # Shut the nodes down properly when the reactor is stopped (e.g. by SIGTERM)
+    reactor.addSystemEventTrigger('before', 'shutdown', factory.shutdown)
+
+    # Setup topology snapshots
+    if args.snapshot:
+        TimerService(args.snapshot_interval, writeSnapshot, factory, args.snapshot).startService()
+
+    # Setup visualization
+    if args.visualize:
+        from skiphash.view import Visualizer
+        Visualizer(factory)
+
+    # Setup headless rendering
+    if args.render:
+        from skiphash.render import HeadlessRenderer
+        HeadlessRenderer(factory).startSnapshots(args.render, args.render_interval)
+
+def startWithEntryNodeRs(rs):
+    """Starts with the random bit string length of the cluster being joined."""
+    if rs is None or isinstance(rs, Failure):
+        logging.error("Failed to get the random bit string of %s. Pass --rs-bytes to join anyway.", args.connect)
+        reactor.stop()
+        return
+    start(len(rs) // 8)
+
+if args.connect and args.rs_bytes is None:
+    # the random bit strings have to be as long as the ones of the cluster being joined,
+    # so their length is taken from the entry node instead of the local number of nodes
+    entryHost, entryPort = args.connect.split(':')
+    reactor.callWhenRunning(lambda: NodeReference(entryHost, int(entryPort)).getRs().addBoth(startWithEntryNodeRs))
+else:
+    start(args.rs_bytes if args.rs_bytes is not None else rsByteLengthFor(args.nodes))
 
 # Starting the Twisted reactor, runs everything
 reactor.run()
@@ -0,0 +1,98 @@
+# Load balancing by moving lightly loaded local nodes next to heavily loaded nodes.
+
+import logging
+from typing import Dict
+
+from twisted.application.internet import TimerService
+from twisted.internet import defer
+
+from skiphash.core import ID_BIT_LENGTH
+from skiphash.distrhash import HashNode, HashNodeFactory
+from skiphash.skipplus import SkipNodeReference
+
+logger = logging.getLogger(__name__)
+
+def loadScores(loads: Dict[SkipNodeReference, dict]) -> Dict[SkipNodeReference, float]:
+    """
+    Rates the loads returned by HashNode.getLoad: a node's score is the sum of its
+    number of entries and its request rate, each relative to their mean among all nodes.
+    A score of 2 thus means average load.
+    """
+    scores = dict((ref, 0.0) for ref in loads)
+    for metric in ("entries", "requestRate"):
+        mean = sum(load[metric] for load in loads.values()) / len(loads)
+        if mean > 0:
+            for ref, load in loads.items():
+                scores[ref] += load[metric] / mean
+    return scores
+
+class LoadBalancer:
+    """
+    Periodically compares the loads of a factory's local nodes and their neighbors.
+    If the most loaded of them has a score (see loadScores) of at least `threshold` times
+    the score of the least loaded local node, the latter leaves its position and
+    rejoins next to the former, taking over half of its entries.
+    At most one node is moved per interval, so the overlay can stabilize in between.
+    """
+
+    MINIMUM_SCORE = 0.1 # lower scores are rounded up, so idle nodes can be compared
+
+    def __init__(self, factory: HashNodeFactory, interval: float = 30, threshold: float = 4.0):
+        self.factory = factory
+        self.interval = interval
+        self.threshold = threshold
+        self._timer = None
+
+    def start(self) -> None:
+        self.stop()
+        self._timer = TimerService(self.interval, self.balance)
+        self._timer.startService()
+
+    def stop(self):
+        """Stops balancing and returns a (maybe deferred) value when done."""
+        if self._timer is not None:
+            timer, self._timer = self._timer, None
+            return timer.stopService()
+
+    @defer.inlineCallbacks
+    def balance(self):
+        """
+        Runs a single balancing round. Returns a deferred that fires with the
+        (moved local node, overloaded node reference) tuple, or None if no node was moved.
+        """
+        localNodes = [n for n in self.factory.nodes if isinstance(n, HashNode)]
+        if len(localNodes) == 0:
+            return None
+        references = set(n.reference for n in localNodes)
+        for n in localNodes:
+            references.update(n.N)
+        references = list(references)
+        results = yield defer.gatherResults([defer.maybeDeferred(ref.getLoad) for ref in references])
+        loads = dict((ref, load) for ref, load in zip(references, results) if load is not None)
+        if len(loads) < 2:
+            return None
+
+        scores = loadScores(loads)
+        for hot in sorted(loads, key=lambda ref: scores[ref], reverse=True):
+            candidates = [n for n in localNodes if n.reference in scores and n.reference != hot]
+            if len(candidates) == 0:
+                continue
+            light = min(candidates, key=lambda n: scores[n.reference])
+            if scores[hot] < self.threshold * max(scores[light.reference], self.MINIMUM_SCORE):
+                return None # neither this nor any less loaded node is overloaded
+            splitPosition = yield hot.getSplitPosition()
+            if splitPosition is None:
+                continue # the hot node has failed
+            nodeId = int(splitPosition * 2**ID_BIT_LENGTH)
+            # the moved node has to become the hot node's successor in order to take over entries
+            if hot.id < nodeId < 2**ID_BIT_LENGTH:
+                yield self._move(light, nodeId, hot, scores)
+                return light, hot
+        return None
+
+    @defer.inlineCallbacks
+    def _move(self, light: HashNode, nodeId: int, hot: SkipNodeReference, scores: Dict[SkipNodeReference, float]):
+        logger.info("Moving %s (score %.2f) next to %s (score %.2f).", light, scores[light.reference], hot, scores[hot])
+        formerId = light.id
+        yield light.reposition(nodeId, hot)
+        self.factory.reindexNode(light, formerId)
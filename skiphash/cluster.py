@@ -0,0 +1,138 @@
+# Running the local nodes in several worker processes,
+# each of them running its own reactor (e.g. one per core).
+
+import logging
+import os
+import signal
+import sys
+from typing import List, Tuple
+
+from twisted.internet import defer, error, protocol, reactor
+
+from skiphash import getThisHost
+from skiphash.core import sleep
+
+logger = logging.getLogger(__name__)
+
+# For twisted reactor method calls:
+# pylint: disable=maybe-no-member
+
+def distributeNodes(nodeCount: int, workerCount: int, startPort: int, lastPort: int = None) -> List[Tuple[int, int, int]]:
+    """
+    Distributes nodeCount nodes as evenly as possible among workerCount workers.
+    Returns a list of (start port, number of nodes, last port) tuples, one for each worker,
+    where the ports of all workers form a single contiguous range without overlaps.
+    If lastPort is given, the ports from startPort to lastPort are shared out among the workers
+    as evenly as possible, otherwise each worker gets the ports of its nodes and the last
+    worker's range is open (its last port is None).
+    """
+    distribution = []
+    port = startPort
+    portCount = nodeCount if lastPort is None else lastPort - startPort + 1
+    for index in range(workerCount):
+        count = nodeCount // workerCount + (1 if index < nodeCount % workerCount else 0)
+        ports = portCount // workerCount + (1 if index < portCount % workerCount else 0)
+        last = port + ports - 1 if lastPort is not None or index < workerCount - 1 else None
+        distribution.append((port, count, last))
+        port += ports
+    return distribution
+
+class WorkerProtocol(protocol.ProcessProtocol):
+    """
+    Forwards a worker process' output line by line, prefixed by the worker's index,
+    and fires the `ended` deferred with the exit code once the process has ended.
+    """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.ended = defer.Deferred()
+        self.exitCode = None
+        self._buffers = {}
+
+    def childDataReceived(self, childFD: int, data: bytes):
+        lines = (self._buffers.get(childFD, b"") + data).split(b"\n")
+        self._buffers[childFD] = lines.pop()
+        output = sys.stdout if childFD == 1 else sys.stderr
+        for line in lines:
+            print("[worker {}] {}".format(self.index, line.decode("utf-8", "replace")), file=output)
+
+    def processEnded(self, reason):
+        self.exitCode = reason.value.exitCode
+        logger.info("Worker %d ended with exit code %s.", self.index, self.exitCode)
+        self.ended.callback(self.exitCode)
+
+class ProcessPool:
+    """
+    Runs nodeCount nodes in workerCount worker processes, each of them running
+    `python -m skiphash` with its share of the nodes and its own range of ports,
+    the ranges dividing the ports from startPort to lastPort (see distributeNodes).
+    The first worker connects to the specified entry node (if any), all other
+    workers use the first worker's first node as their entry node.
+    `workerArguments` are passed to each worker, e.g. ["--asyncio"] or ["--hash"].
+    """
+
+    def __init__(self, nodeCount: int, workerCount: int, startPort: int,
+                 entryNodeHost: str = None, entryNodePort: int = None, workerArguments: List[str] = (),
+                 lastPort: int = None):
+        self.distribution = distributeNodes(nodeCount, workerCount, startPort, lastPort)
+        self.startPort = startPort
+        self.entryNodeHost = entryNodeHost
+        self.entryNodePort = entryNodePort
+        self.workerArguments = list(workerArguments)
+        self.workers = [] # (WorkerProtocol, IProcessTransport) tuples
+
+    @defer.inlineCallbacks
+    def start(self, startupDelay: float = 1):
+        """
+        Spawns the worker processes. The first worker is given startupDelay
+        seconds to start its nodes before the other workers connect to it.
+        Returns a deferred that fires when all workers have been spawned.
+        """
+        for index, (port, count, lastPort) in enumerate(self.distribution):
+            if count == 0:
+                continue
+            arguments = [sys.executable, "-m", "skiphash", "-n", str(count), "-p", str(port)] + self.workerArguments
+            if lastPort is not None:
+                arguments += ["--last-port", str(lastPort)]
+            if index == 0:
+                if self.entryNodeHost is not None and self.entryNodePort is not None:
+                    arguments += ["-c", "{}:{}".format(self.entryNodeHost, self.entryNodePort)]
+            else:
+                arguments += ["-c", "{}:{}".format(getThisHost(), self.startPort)]
+            workerProtocol = WorkerProtocol(index)
+            environment = dict(os.environ, PYTHONUNBUFFERED="1") # forward the output right away
+            transport = reactor.spawnProcess(workerProtocol, sys.executable, arguments, env=environment)
+            self.workers.append((workerProtocol, transport))
+            logger.info("Started worker %d (pid %d) with %d nodes on ports %d-%d.",
+                            index, transport.pid, count, port, port + count - 1)
+            if index == 0 and len(self.distribution) > 1:
+                yield sleep(startupDelay)
+
+    def status(self) -> dict:
+        """
+        Returns aggregated information on the workers: the number of `workers`,
+        how many of them are `running`, the number of `nodes` run by the running
+        workers and the `exitCodes` of the ended workers, indexed by worker index.
+        """
+        running = [p for p, _ in self.workers if not p.ended.called]
+        return {
+            "workers": len(self.workers),
+            "running": len(running),
+            "nodes": sum(self.distribution[p.index][1] for p in running),
+            "exitCodes": dict((p.index, p.exitCode) for p, _ in self.workers if p.ended.called),
+        }
+
+    def shutdown(self) -> defer.Deferred:
+        """
+        Asks all workers to shut down their nodes (by sending SIGTERM) and
+        returns a deferred that fires with the list of exit codes when all
+        workers have ended. Workers running hash nodes (see the --hash option)
+        drain them before they exit (see HashNode.drain).
+        """
+        for workerProtocol, transport in self.workers:
+            if not workerProtocol.ended.called:
+                try:
+                    transport.signalProcess(signal.SIGTERM)
+                except error.ProcessExitedAlready:
+                    pass
+        return defer.gatherResults([p.ended for p, _ in self.workers])
@@ -1,20 +1,43 @@
+import asyncio
+import inspect
+import json
 import logging
+import os
 import random
 import sys
-from functools import total_ordering
+import time
+import weakref
+from collections import deque
+from functools import total_ordering, wraps
 from ipaddress import IPv4Address
-from typing import Any, Union
+from typing import Any, Callable, Dict, Tuple, Union
 
 from bitarray import bitarray
 from twisted.application.internet import TimerService
-from twisted.internet import defer, error, reactor
+from twisted.internet import defer, error, reactor, task
 from twisted.spread import flavors, pb
 
 from cityhash import CityHash64 as CityHash
-from skiphash import thisHost
+from skiphash import getThisHost
 
 ID_BIT_LENGTH = 64
 
+# identification of the topology snapshot files written by NodeFactory.exportSnapshot
+SNAPSHOT_FORMAT = "skiphash-snapshot"
+SNAPSHOT_VERSION = 1
+
+# the priorities of incoming remote calls (see priority and CallScheduler), lower values first
+PRIORITY_USER = 0 # user operations, e.g. lookups
+PRIORITY_TRANSFER = 1 # transfers of entries between nodes
+PRIORITY_MAINTENANCE = 2 # overlay maintenance, e.g. linearise
+
+# the number of calls of each priority a CallScheduler executes per round
+DEFAULT_PRIORITY_WEIGHTS = {PRIORITY_USER: 8, PRIORITY_TRANSFER: 4, PRIORITY_MAINTENANCE: 1}
+# the maximum number of calls a CallScheduler executes per reactor iteration
+DEFAULT_SCHEDULER_BATCH_SIZE = 64
+# (calls per second, burst size) of the remote methods whose calls are limited per connection and node
+DEFAULT_RATE_LIMITS = {"linearise": (500, 1000)}
+
 logger = logging.getLogger(__name__)
 
 # For twisted reactor method calls:
@@ -53,6 +76,19 @@ def linkedDeferred(d: Union[defer.Deferred, Any]):
         return newDeferred
     return d
 
+def asFuture(d: Union[defer.Deferred, Any]) -> asyncio.Future:
+    """
+    Returns an asyncio future for a (maybe deferred) value, e.g. the result of a
+    remote call or of HashNode.lookup, so it can be awaited by asyncio code.
+    Requires Twisted's asyncio reactor (twisted.internet.asyncioreactor) to be installed.
+    """
+    loop = asyncio.get_event_loop()
+    if isinstance(d, defer.Deferred):
+        return d.asFuture(loop)
+    future = loop.create_future()
+    future.set_result(d)
+    return future
+
 def projectOntoUnitInterval(input: int, inputBitLength: int) -> float:
     """
     Projects any integer consisting of inputBitLength bits onto the [0,1) interval.
@@ -121,6 +157,33 @@ class ComparableById:
         """The object's integer id projected onto the unit interval"""
         return projectOntoUnitInterval(self.id, ID_BIT_LENGTH)
 
+class NetworkConfig:
+    """
+    Network settings for the nodes of a NodeFactory:
+    `bindAddress` is the address of the interface the nodes listen on (all interfaces by default),
+    `advertisedHost` is the IPv4 address the nodes tell other nodes to connect to
+    (skiphash.getThisHost() by default), `lastPort` is the highest port the factory
+    may assign to a node (no limit by default). If `unixSocketDirectory` is set, the nodes
+    additionally listen on Unix sockets in that directory, and connections to nodes
+    having a socket there (i.e. nodes on the same machine) use the socket instead of TCP.
+    """
+
+    def __init__(self, bindAddress: str = "", advertisedHost: str = None, lastPort: int = None,
+                 unixSocketDirectory: str = None):
+        self.bindAddress = bindAddress
+        self.advertisedHost = advertisedHost
+        self.lastPort = lastPort
+        self.unixSocketDirectory = unixSocketDirectory
+
+    @property
+    def host(self) -> str:
+        """The advertised host address"""
+        return self.advertisedHost if self.advertisedHost is not None else getThisHost()
+
+def unixSocketPath(directory: str, host: str, port: int) -> str:
+    """Returns the path of the Unix socket of the node with the provided host and port."""
+    return os.path.join(directory, "node-{}-{}.sock".format(host, port))
+
 class NodeReference(ComparableById, flavors.Copyable, flavors.RemoteCopy):
     """
     A NodeReference stores a host (IPv4Address, provided as string)
@@ -131,17 +194,22 @@ class NodeReference(ComparableById, flavors.Copyable, flavors.RemoteCopy):
     the remote method's result.
     As NodeReference is a subclass of ComparableById,
     each NodeReference object has a unique uniformly random
-    integer id which is a hash of its host and port.
+    integer id which is a hash of its host and port, unless
+    another id has explicitly been assigned (see nodeId).
     Comparing NodeReference objects will compare their ids.
     """
 
     _remoteReferenceDict = {}
     """A dictionary for storing existing RemoteReference instances, indexed by their host and port"""
 
-    def __init__(self, host: str = None, port: int = None):
+    unixSocketDirectory = None
+    """If set, nodes having a Unix socket in this directory are connected to via that socket"""
+
+    def __init__(self, host: str = None, port: int = None, nodeId: int = None):
         if host is not None:
             self._host = IPv4Address(host)
         self._port = port
+        self._explicitId = nodeId
         self.postInit()
         # CAUTION: For some reasons, this is not called when
         # the object is copied by the perspective broker.
@@ -149,7 +217,10 @@ class NodeReference(ComparableById, flavors.Copyable, flavors.RemoteCopy):
     
     def postInit(self):
         self._remoteReference = None
-        self._id = CityHash("{}:{}".format(self.host, self.port))
+        if self._explicitId is not None:
+            self._id = self._explicitId
+        else:
+            self._id = CityHash("{}:{}".format(self.host, self.port))
     
     def __getattr__(self, attrName: str):
         """
@@ -176,11 +247,10 @@ class NodeReference(ComparableById, flavors.Copyable, flavors.RemoteCopy):
                                 "No connection to remote host.").format(self, attrName))
                 return
             # make the remote call
-            deferred = remote.callRemote(attrName, *args, **kwargs)
             try:
-                returnValue = yield deferred
+                returnValue = yield remote.callRemote(attrName, *args, **kwargs)
                 return returnValue
-            except pb.PBConnectionLost as err:
+            except (pb.PBConnectionLost, pb.DeadReferenceError) as err:
                 logger.warn("%s: Remote call '%s' failed: Connection to remote node lost.", self, attrName)
             except pb.RemoteError as err:
                 logger.warn("%s: Remote call '%s' failed: %s", self, attrName, err)
@@ -194,10 +264,13 @@ class NodeReference(ComparableById, flavors.Copyable, flavors.RemoteCopy):
         return "NodeReference({},{})".format(self.host, self.port)
     
     def getStateToCopy(self):
+        if self._explicitId is not None:
+            return (self.host, self.port, self._explicitId)
         return (self.host, self.port)
         
     def setCopyableState(self, state):
-        host, self._port = state
+        host, self._port = state[:2]
+        self._explicitId = state[2] if len(state) > 2 else None
         self._host = IPv4Address(host)
         self.postInit()
     
@@ -218,21 +291,35 @@ class NodeReference(ComparableById, flavors.Copyable, flavors.RemoteCopy):
     @property
     def id(self):
         return self._id
+
+    @property
+    def explicitId(self):
+        """The id assigned to the referenced node, or None if its id is the hash of its host and port"""
+        return self._explicitId
     
     @property
     def remote(self):
         """
         A (maybe deferred) pb.Reference to the corresponding remote node.
+        If the connection has been lost or could not be established, a new one is made,
+        e.g. as the node has been restarted.
         """
+        if self._isStale(self._remoteReference):
+            self._remoteReference = None
         if self._remoteReference is None:
-            if (self.host, self.port) in self._remoteReferenceDict:
+            remoteReference = self._remoteReferenceDict.get((self.host, self.port))
+            if remoteReference is not None and not self._isStale(remoteReference):
                 # Reference already exists on this host
-                self._remoteReference = self._remoteReferenceDict[self.host, self.port]
+                self._remoteReference = remoteReference
             else:
                 # RemoteReference does not yet exist on this host
                 logger.info("%s: Requesting remote reference from %s:%d", self, self.host, self.port)
                 factory = pb.PBClientFactory()
-                reactor.connectTCP(self.host, self.port, factory)
+                socketPath = self._unixSocketPath()
+                if socketPath is not None:
+                    reactor.connectUNIX(socketPath, factory)
+                else:
+                    reactor.connectTCP(self.host, self.port, factory)
                 deferred = factory.getRootObject()
                 deferred.addCallbacks(self._gotRemoteReference, self._failedGettingRemoteReference)
                 self._remoteReference = deferred
@@ -240,11 +327,23 @@ class NodeReference(ComparableById, flavors.Copyable, flavors.RemoteCopy):
 
         return linkedDeferred(self._remoteReference) # for simultaneous use in multiple generators
         
+    @staticmethod
+    def _isStale(remoteReference) -> bool:
+        """Whether remoteReference is a pb.RemoteReference whose connection has been lost."""
+        return isinstance(remoteReference, pb.RemoteReference) and remoteReference.broker.disconnected
+
+    def _unixSocketPath(self) -> Union[str, None]:
+        """The path of the referenced node's Unix socket, or None if it does not have one."""
+        if self.unixSocketDirectory is None:
+            return None
+        path = unixSocketPath(self.unixSocketDirectory, self.host, self.port)
+        return path if os.path.exists(path) else None
+
     def _failedGettingRemoteReference(self, reason):
         logger.warn("%s: Error getting remote node reference: %s", self, reason)
         self._remoteReference = None
         self._remoteReferenceDict[self.host, self.port] = None
-        return reason # pass reason to next callback
+        return None # the next call will try to connect again
     
     def _gotRemoteReference(self, instance: pb.RemoteReference):
         logger.info("%s: Got remote node reference %s", self, instance)
@@ -317,24 +416,133 @@ def remoteMethod(method):
     """
     A decorator allowing methods to be called remotely.
     It also maintains a set of names of the methods it has been used for.
+    Coroutine functions (`async def`) are supported: calling them returns a deferred
+    for the coroutine's result, so they can be used like @defer.inlineCallbacks methods
+    and may await deferreds, e.g. the results of remote calls.
     """
+    if inspect.iscoroutinefunction(method):
+        coroutineFunction = method
+        @wraps(coroutineFunction)
+        def method(*args, **kwargs):
+            return defer.ensureDeferred(coroutineFunction(*args, **kwargs))
     method.is_remote_method = True
     remoteMethod.methodNames.add(method.__name__)
     return method
 
 remoteMethod.methodNames = set()
 
+def priority(level: int):
+    """
+    A decorator setting the priority (e.g. PRIORITY_MAINTENANCE) with which incoming
+    calls of a remote method are scheduled (see CallScheduler). Remote methods without
+    a priority are scheduled as user operations (PRIORITY_USER).
+    As overriding methods do not inherit it, it has to be repeated for them.
+    """
+    def decorator(method):
+        method.priority = level
+        return method
+    return decorator
+
+class CallScheduler:
+    """
+    Schedules the incoming remote calls of nodes by priority instead of executing them
+    in the order of their arrival. There is a queue for each priority, and in each round,
+    up to weights[p] calls of priority p are executed, higher priorities (lower values)
+    first. Thus, a flood of maintenance calls delays user operations only slightly,
+    while it is still worked off. At most batchSize calls are executed per reactor
+    iteration, so that newly arrived calls are queued according to their priority.
+    `rateLimits` maps method names to (calls per second, burst size) tuples. Calls of
+    such a method exceeding its limit on a connection are dropped, returning None.
+    The limits apply per node a call is about (see schedule), as the nodes of a
+    process share their connections. Dropped calls are counted in `droppedCalls`.
+    """
+
+    def __init__(self, weights: Dict[int, int] = None, batchSize: int = DEFAULT_SCHEDULER_BATCH_SIZE,
+                 rateLimits: Dict[str, Tuple[float, float]] = None):
+        self.weights = dict(weights if weights is not None else DEFAULT_PRIORITY_WEIGHTS)
+        self.batchSize = batchSize
+        self.rateLimits = dict(rateLimits if rateLimits is not None else DEFAULT_RATE_LIMITS)
+        self._queues = dict((level, deque()) for level in self.weights)
+        self._buckets = weakref.WeakKeyDictionary() # connection -> (method name, node) -> (tokens, time, dropping)
+        self._delayedRun = None
+        self.droppedCalls = 0
+
+    def __len__(self):
+        """The number of queued calls."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def schedule(self, call: Callable[[], Any], level: int = PRIORITY_USER, methodName: str = None,
+                 connection=None, node: 'NodeReference' = None) -> defer.Deferred:
+        """
+        Queues call, a function without arguments, with the priority level and returns a
+        deferred that fires with its (maybe deferred) result once it has been executed.
+        If the calls of methodName about node on connection (e.g. a pb.Broker) exceed their
+        rate limit, the call is dropped and the deferred fires with None right away.
+        """
+        if connection is not None and methodName in self.rateLimits and not self._takeToken(connection, methodName, node):
+            self.droppedCalls += 1
+            return defer.succeed(None)
+        deferred = defer.Deferred()
+        self._queues.setdefault(level, deque()).append((call, deferred))
+        if self._delayedRun is None:
+            self._delayedRun = reactor.callLater(0, self._run)
+        return deferred
+
+    def _takeToken(self, connection, methodName: str, node: 'NodeReference' = None) -> bool:
+        """
+        Returns whether a call of methodName about node on connection is within its rate limit,
+        using a token bucket. The first call dropped after calls have been let through is logged.
+        """
+        rate, burst = self.rateLimits[methodName]
+        now = time.monotonic()
+        buckets = self._buckets.setdefault(connection, {})
+        tokens, lastTime, dropping = buckets.get((methodName, node), (burst, now, False))
+        tokens = min(burst, tokens + (now - lastTime) * rate)
+        if tokens < 1:
+            if not dropping:
+                logger.warning("Dropping calls of %s about %s exceeding its rate limit of %s calls per second.",
+                               methodName, node, rate)
+            buckets[(methodName, node)] = (tokens, now, True)
+            return False
+        buckets[(methodName, node)] = (tokens - 1, now, False)
+        return True
+
+    def _run(self) -> None:
+        self._delayedRun = None
+        executed = 0
+        while executed < self.batchSize and len(self) > 0:
+            for level in sorted(self._queues):
+                queue = self._queues[level]
+                for _ in range(min(self.weights.get(level, 1), len(queue), self.batchSize - executed)):
+                    call, deferred = queue.popleft()
+                    defer.maybeDeferred(call).chainDeferred(deferred)
+                    executed += 1
+        if len(self) > 0:
+            self._delayedRun = reactor.callLater(0, self._run)
+
 class Node(pb.Root, ComparableById):
     """
     A local node that offers methods for both local and remote callers.
     In order to make a method callable by a remote caller, it has to be
     decorated with the @remoteMethod decorator.
+    Incoming remote calls are executed by the `callScheduler` according to the
+    priorities of the called methods (see priority). By default, all nodes of a
+    process share a scheduler, as they share the reactor.
     Note: Do not initialize nodes yourself, use a NodeFactory for that!
     """
 
-    def __init__(self, port: int, timeoutInterval: int = 1):
-        self.reference = NodeReference(thisHost, port)
-        self._portObject = reactor.listenTCP(port, pb.PBServerFactory(self))
+    callScheduler = CallScheduler()
+
+    def __init__(self, port: int, timeoutInterval: int = 1, networkConfig: NetworkConfig = None):
+        if networkConfig is None:
+            networkConfig = NetworkConfig()
+        self.reference = NodeReference(networkConfig.host, port)
+        self._portObject = reactor.listenTCP(port, pb.PBServerFactory(self), interface=networkConfig.bindAddress)
+        self._unixPortObject = None
+        self._brokers = weakref.WeakSet() # the connections of remote callers
+        if networkConfig.unixSocketDirectory is not None:
+            self._unixPortObject = reactor.listenUNIX(unixSocketPath(networkConfig.unixSocketDirectory, self.host, port),
+                                                        pb.PBServerFactory(self), wantPID=True)
         
         # Creating a twisted TimerService to call the timeout method periodically
         # Cheat to not call timeout right away (self is probably not ready now)
@@ -362,6 +570,36 @@ class Node(pb.Root, ComparableById):
         
         # raising an attribute error for all other requests
         raise AttributeError("No such member: '{}'".format(attrName))
+
+    def rootObject(self, broker):
+        """Called by the perspective broker for each incoming connection."""
+        self._brokers.add(broker)
+        return self
+
+    def remoteMessageReceived(self, broker, message, args, kw):
+        """
+        Queues an incoming remote call in the callScheduler, with the priority of the called method.
+        The rate limits of the scheduler apply per connection and node reference passed as the
+        first argument (e.g. the node introduced by linearise), if any. Otherwise, like
+        pb.Root.remoteMessageReceived.
+        """
+        if not isinstance(message, str):
+            message = message.decode("utf8")
+        args = broker.unserialize(args)
+        kw = broker.unserialize(kw)
+        if any(isinstance(key, bytes) for key in kw):
+            kw = dict((key.decode("utf8") if isinstance(key, bytes) else key, value) for key, value in kw.items())
+        level = getattr(getattr(self, message, None), "priority", PRIORITY_USER)
+        if not isinstance(level, int):
+            level = PRIORITY_USER
+        node = args[0] if len(args) > 0 and isinstance(args[0], NodeReference) else None
+
+        def call():
+            method = getattr(self, "remote_" + message, None)
+            if method is None:
+                raise pb.NoSuchMethod("No such method: remote_{}".format(message))
+            return broker.serialize(method(*args, **kw), self.perspective)
+        return self.callScheduler.schedule(call, level, message, broker, node)
     
     def __hash__(self):
         return hash(self.id)
@@ -388,8 +626,28 @@ class Node(pb.Root, ComparableById):
         successfully when shutdown is completed.
         """
         yield self._timer.stopService()
+        if self._unixPortObject is not None:
+            yield self._unixPortObject.stopListening()
         returnValue = yield self._portObject.loseConnection()
+        # the callers have to notice that we are gone, e.g. to reconnect to a restarted node
+        for broker in list(self._brokers):
+            broker.transport.loseConnection()
         return returnValue
+
+    def snapshotState(self) -> dict:
+        """
+        Returns a JSON-serializable dict describing the node's state for a
+        topology snapshot. Subclasses extend it by their own state.
+        """
+        return {"host": self.host, "port": self.port}
+
+    def restoreSnapshotState(self, state: dict) -> None:
+        """
+        Restores the node's state from a dict returned by snapshotState.
+        The node's port is assigned by its factory, not by the snapshot.
+        """
+        if state["port"] != self.port:
+            logger.warning("%s: Restoring the state of the node that used port %d.", self, state["port"])
     
     def timeout(self):
         """
@@ -406,27 +664,100 @@ class NodeFactory:
     localNodes attribute.
     When subclassing, you can override the initNode() method to gain control
     of node initialization.
+    The topology of all local nodes can be exported to a JSON lines snapshot
+    (see exportSnapshot) from which nodes can be restored (see restoreSnapshot).
+    `nodeOptions` are keyword arguments that _initNode passes to each node's constructor.
+    `networkConfig` configures the nodes' addresses and ports (see NetworkConfig).
     """
 
-    def __init__(self, startPort: int):
+    def __init__(self, startPort: int, nodeOptions: dict = None, networkConfig: NetworkConfig = None):
         self._startPort = startPort
+        self.nodeOptions = dict(nodeOptions or {})
+        self.networkConfig = networkConfig if networkConfig is not None else NetworkConfig()
+        self.nodeOptions["networkConfig"] = self.networkConfig
+        if self.networkConfig.unixSocketDirectory is not None:
+            os.makedirs(self.networkConfig.unixSocketDirectory, exist_ok=True)
+            NodeReference.unixSocketDirectory = self.networkConfig.unixSocketDirectory
         self._nextPort = startPort
         self.registry = {}
         self.nodes = []
         self.idToNodeMap = {}
 
     def newNode(self):
-        # get new port
-        port = self._nextPort
-        self._nextPort += 1
+        port = self._assignPort()
         isFirstNode = (port == self._startPort)
         node = self._initNode(port, isFirstNode)
         self._postInitNode(node, isFirstNode)
-        self.registry[port] = node
+        self._registerNode(node)
+        return node
+
+    def newNodes(self, count: int) -> list:
+        """
+        Creates count nodes and returns them as a list.
+        Subclasses may connect nodes created at once more efficiently than one by one.
+        """
+        return [self.newNode() for _ in range(count)]
+
+    def restoreSnapshot(self, states) -> list:
+        """
+        Creates a new node for each of the provided snapshot states (e.g. read by
+        skiphash.snapshot.readSnapshotStates) and restores its state instead of
+        introducing it to the other nodes. Ports are assigned in the order of the
+        states, so restoring a snapshot of a factory with the same start port
+        recreates the exported nodes.
+        Returns the list of restored nodes.
+        """
+        restoredNodes = []
+        for state in states:
+            port = self._assignPort()
+            node = self._initNode(port, port == self._startPort)
+            node.restoreSnapshotState(state)
+            self._registerNode(node)
+            restoredNodes.append(node)
+        return restoredNodes
+
+    def exportSnapshot(self, file) -> defer.Deferred:
+        """
+        Writes a snapshot of all local nodes' states to the text file object `file`,
+        as a header line followed by one JSON object per node.
+        The nodes are written one at a time, cooperating with the reactor.
+        Returns a deferred that fires when all nodes have been written.
+        """
+        def writeLines():
+            file.write(json.dumps({"format": SNAPSHOT_FORMAT, "version": SNAPSHOT_VERSION}) + "\n")
+            for node in list(self.nodes):
+                file.write(json.dumps(node.snapshotState(), separators=(',', ':')) + "\n")
+                yield
+        return task.cooperate(writeLines()).whenDone()
+
+    def _assignPort(self) -> int:
+        """Returns the port for the next node."""
+        if self.networkConfig.lastPort is not None and self._nextPort > self.networkConfig.lastPort:
+            raise RuntimeError("All ports from {} to {} have been assigned.".format(self._startPort, self.networkConfig.lastPort))
+        port = self._nextPort
+        self._nextPort += 1
+        return port
+
+    def reindexNode(self, node: Node, oldId: int) -> None:
+        """Has to be called when a node's id has changed."""
+        self.idToNodeMap.pop(oldId, None)
+        self.idToNodeMap[node.id] = node
+
+    def _registerNode(self, node: Node) -> None:
+        self.registry[node.port] = node
         self.nodes.append(node)
         self.idToNodeMap[node.id] = node
-        return node
     
+    def shutdownNode(self, node: Node) -> defer.Deferred:
+        """
+        Removes a single local node from the factory and shuts it down, e.g. for a rolling restart.
+        Returns the deferred returned by the node's shutdown method.
+        """
+        self.nodes.remove(node)
+        self.registry.pop(node.port, None)
+        self.idToNodeMap.pop(node.id, None)
+        return node.shutdown()
+
     def shutdown(self) -> defer.Deferred:
         deferreds = []
         for n in self.nodes:
@@ -435,7 +766,7 @@ class NodeFactory:
     
     def _initNode(self, port: int, isFirstNode: bool) -> Node:
         """Override this to control node initialization."""
-        return Node(port)
+        return Node(port, **self.nodeOptions)
     
     def _postInitNode(self, node: Node, isFirstNode: bool) -> None:
         """Will be called after each _initNode call, providing the new node."""
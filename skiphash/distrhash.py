@@ -1,29 +1,85 @@
-from typing import Dict
+import bisect
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Iterable, List, Set, Tuple, Union
 
-from twisted.internet import defer
+from twisted.internet import defer, reactor
+from twisted.python.failure import Failure
 from twisted.spread import flavors, pb
 
 import skiphash.skipplus as skip
 from cityhash import CityHash128
-from skiphash.core import projectOntoUnitInterval, remoteMethod
+from skiphash.core import (PRIORITY_MAINTENANCE, PRIORITY_TRANSFER,
+                           PRIORITY_USER, NetworkConfig, priority,
+                           remoteMethod, sleep)
+from skiphash.expiry import TimingWheel
+from skiphash.placement import HashPlacement, unitKeyHash
+from skiphash.storage import ArenaStore, LogStore
 
+# the default number of entries per page of a scan
+DEFAULT_SCAN_PAGE_SIZE = 100
+
+# the weight of the latest second in a node's request rate, which is a moving average
+REQUEST_RATE_SMOOTHING = 0.2
+
+# the defaults for transferring the entries of a draining node: the number of entries per batch,
+# the seconds between batches and the seconds requests are forwarded to the new owner after leaving
+DEFAULT_DRAIN_BATCH_SIZE = 500
+DEFAULT_DRAIN_BATCH_INTERVAL = 0.05
+DEFAULT_DRAIN_GRACE_PERIOD = 1.0
+
+# the seconds the origin of a directly replied request waits for the reply, see HashNode.route
+DEFAULT_REPLY_TIMEOUT = 10.0
+
+# the defaults for iterative searches: the number of nodes queried in parallel per step,
+# the seconds to wait for each of them and the number of owners remembered, see HashNode.routeStep
+DEFAULT_PARALLELISM = 3
+DEFAULT_HOP_TIMEOUT = 2.0
+DEFAULT_OWNER_CACHE_SIZE = 1024
+
+# the defaults for buffering writes: the seconds writes are held back at most and the
+# number of buffered writes that triggers sending them right away, see HashNode.flushWrites
+DEFAULT_WRITE_BUFFER_INTERVAL = 0.01
+DEFAULT_WRITE_BUFFER_SIZE = 500
+
+logger = logging.getLogger(__name__)
 
 class Entry(flavors.Copyable, flavors.RemoteCopy):
     """
     A simple key value pair data class for strings.
     It is copyable by Twisted's perspective broker and provides
     non-cryptographic hasing methods.
+    `expiresAt` is the time (as returned by time.time()) after which the entry
+    is dropped, or None if it does not expire.
+    `version` is assigned by the key's owner on every write (see HashNode.compareAndSet),
+    0 for entries that have not been stored yet, e.g. those of requests.
     """
 
-    def __init__(self, key: str, value: str):
+    def __init__(self, key: str, value: str, expiresAt: float = None, version: int = 0):
         self.key = key
         self.value = value
+        self.expiresAt = expiresAt
+        self.version = version
 
     def getStateToCopy(self):
+        if self.version != 0:
+            return (self.key, self.value, self.expiresAt, self.version)
+        if self.expiresAt is not None:
+            return (self.key, self.value, self.expiresAt)
         return (self.key, self.value)
         
     def setCopyableState(self, state):
-        self.key, self.value = state
+        self.key, self.value = state[:2]
+        self.expiresAt = state[2] if len(state) > 2 else None
+        self.version = state[3] if len(state) > 3 else 0
+
+    def expired(self, now: float = None) -> bool:
+        """Whether the entry has expired at the time now, the current time by default."""
+        return self.expiresAt is not None and self.expiresAt <= (time.time() if now is None else now)
     
     def keyHash(self):
         """
@@ -35,102 +91,824 @@ class Entry(flavors.Copyable, flavors.RemoteCopy):
         """
         Returns the projection of keyHash onto the [0,1) interval.
         """
-        return projectOntoUnitInterval(self.keyHash(), 128)
+        return unitKeyHash(self.key)
 
 pb.setUnjellyableForClass('skiphash.distrhash.Entry', Entry)
+
+class OwnerCache:
+    """
+    Remembers up to `size` nodes that have been responsible for a key, evicting the least
+    recently used one, so that later searches of the same or a nearby key can start there.
+    """
+
+    def __init__(self, size: int = DEFAULT_OWNER_CACHE_SIZE):
+        self.size = size
+        self._nodes = OrderedDict() # by unitId, in the order of their last use
+        self._unitIds = [] # ascending
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add(self, v: skip.SkipNodeReference) -> None:
+        if v.unitId in self._nodes:
+            self._nodes.move_to_end(v.unitId)
+        else:
+            bisect.insort(self._unitIds, v.unitId)
+        self._nodes[v.unitId] = v
+        if len(self._nodes) > self.size:
+            self.remove(next(iter(self._nodes.values())))
+
+    def remove(self, v: skip.SkipNodeReference) -> None:
+        if self._nodes.pop(v.unitId, None) is not None:
+            del self._unitIds[bisect.bisect_left(self._unitIds, v.unitId)]
+
+    def closest(self, unitKey: float) -> Union[skip.SkipNodeReference, None]:
+        """
+        Returns the cached node with the highest position not above unitKey
+        (the lowest cached node if there is none), or None if the cache is empty.
+        """
+        if len(self._unitIds) == 0:
+            return None
+        index = max(bisect.bisect_right(self._unitIds, unitKey) - 1, 0)
+        return self._nodes[self._unitIds[index]]
     
 class HashNode(skip.SkipNode):
     """
     Extends the SkipNode class by adding distributed hash table methods.
+    The node's entries are kept in `store` (see skiphash.storage),
+    or in a compact in-memory ArenaStore if no store is provided.
+    `placement` maps keys onto the key space (see skiphash.placement). It defaults to
+    a HashPlacement and has to be the same for all nodes of the overlay.
+    If `directReply` is set, the requests this node delegates are routed by `route`
+    and answered by the responsible node directly, waiting at most `replyTimeout` seconds.
+    If `iterative` is set (which takes precedence over directReply), this node drives the
+    searches it delegates itself, querying `parallelism` nodes at a time by `routeStep`
+    and waiting at most `hopTimeout` seconds for each, and sends the request to the
+    responsible node it has found. The last `ownerCacheSize`
+    responsible nodes are remembered as starting points.
+    If `bufferWrites` is set, insertions and removals are buffered for up to
+    `writeBufferInterval` seconds or `writeBufferSize` writes and then sent in
+    one call per next hop (see flushWrites). As the batches are forwarded hop by hop,
+    bufferWrites cannot be combined with iterative. It can be combined with directReply,
+    as no node waits for the next hop of a batch either.
+    See SkipNode for offloadComputation, vectorized and rsByteLength.
     """
 
-    def __init__(self, port):
-        super(HashNode, self).__init__(port)
-        self.localHashTable = {}
+    def __init__(self, port, store: MutableMapping = None, offloadComputation: bool = False, vectorized: bool = False,
+                 networkConfig: NetworkConfig = None, placement=None, rsByteLength: int = skip.RS_BYTE_LENGTH,
+                 directReply: bool = False, replyTimeout: float = DEFAULT_REPLY_TIMEOUT, iterative: bool = False,
+                 parallelism: int = DEFAULT_PARALLELISM, hopTimeout: float = DEFAULT_HOP_TIMEOUT,
+                 ownerCacheSize: int = DEFAULT_OWNER_CACHE_SIZE, bufferWrites: bool = False,
+                 writeBufferInterval: float = DEFAULT_WRITE_BUFFER_INTERVAL, writeBufferSize: int = DEFAULT_WRITE_BUFFER_SIZE):
+        if bufferWrites and iterative:
+            raise ValueError("Buffered writes are forwarded hop by hop and cannot be combined with iterative searches.")
+        super(HashNode, self).__init__(port, offloadComputation, vectorized, networkConfig, rsByteLength)
+        self.localHashTable = store if store is not None else ArenaStore(Entry)
+        self.placement = placement if placement is not None else HashPlacement()
         # predecessor and successor references
         self.pred = skip.lowest
         self.succ = skip.highest
+        # the (position, key) tuples of the localHashTable in ascending order, built on demand
+        # and kept up to date by _insert, _delete and handOff, see _getScanIndex
+        self._scanIndex = None
+        # the number of requests processed since the last timeout and their moving average per second
+        self._requestCounter = 0
+        self.requestRate = 0.0
+        # while leaving, the keys of the entries that have yet to be transferred resp. deleted at the new owner
+        self._pendingKeys = None
+        self._deletedKeys = None
+        # the node requests are forwarded to after our entries have been transferred to it
+        self._drainTarget = None
+        # the deferreds waiting for the result of the lookup of a key that is in flight, by key
+        self._inFlightLookups = {}
+        self.directReply = directReply
+        self.replyTimeout = replyTimeout
+        # the (deferred, timeout call) tuples of the routed requests awaiting their reply, by request id
+        self._pendingReplies = {}
+        self._requestIds = itertools.count()
+        self.iterative = iterative
+        self.parallelism = parallelism
+        self.hopTimeout = hopTimeout
+        self.ownerCache = OwnerCache(ownerCacheSize)
+        self.bufferWrites = bufferWrites
+        self.writeBufferInterval = writeBufferInterval
+        self.writeBufferSize = writeBufferSize
+        # the buffered (entry, operation name) tuples in the order of the writes, and their keys
+        self._writeBuffer = []
+        self._bufferedKeys = set()
+        self._flushCall = None
+        # the keys of the entries that expire, by their expiry time
+        self._expiryWheel = TimingWheel(time.time())
+        self._scheduleExpiry(self.localHashTable.values())
+        # the version of the last write, see _nextVersion
+        self._lastVersion = 0
+        # the keys of the recovered entries that had been handed over to a new owner when the node left
+        # (see drain). They are not served until they have been compared with the new owner's, see _reconcile
+        self._handedOverKeys = set(store.markedKeys) if isinstance(store, LogStore) else set()
+        self._reconciling = False
+        # whether entries outside of our slice of the key space are being relocated, see _relocate
+        self._relocating = False
 
     # Local public operations
 
-    def insert(self, key: str, value: str):
-        """Inserts the entry d into the distributed hash table."""
-        entry = Entry(key, value)
-        self.search(entry, "insert")
+    def insert(self, key: str, value: str, ttl: float = None):
+        """
+        Inserts the entry d into the distributed hash table.
+        If ttl is given, the entry expires after ttl seconds.
+        """
+        entry = Entry(key, value, None if ttl is None else time.time() + ttl)
+        self._write(entry, "insert")
     
     def remove(self, key: str):
         keyOnlyEntry = Entry(key, "")
         """Removes the entry specified by `key` from the distributed hash table."""
-        self.search(keyOnlyEntry, "delete")
+        self._write(keyOnlyEntry, "delete")
+
+    def flushWrites(self) -> None:
+        """
+        Sends the buffered writes (see bufferWrites) by calling searchBatch,
+        which delegates them in a single call per next hop.
+        """
+        if self._flushCall is not None and self._flushCall.active():
+            self._flushCall.cancel()
+        self._flushCall = None
+        writes, self._writeBuffer = self._writeBuffer, []
+        self._bufferedKeys = set()
+        if len(writes) > 0:
+            self.searchBatch(writes)
+    
+    def _write(self, d: Entry, operationName: str):
+        if not self.bufferWrites:
+            self.search(d, operationName)
+            return
+        self._writeBuffer.append((d, operationName))
+        self._bufferedKeys.add(d.key)
+        if len(self._writeBuffer) >= self.writeBufferSize:
+            self.flushWrites()
+        elif self._flushCall is None:
+            self._flushCall = reactor.callLater(self.writeBufferInterval, self.flushWrites)
     
     @defer.inlineCallbacks
     def lookup(self, key: str):
-        """Executes a lookup against the provided `key` on the distributed hash table."""
+        """
+        Executes a lookup against the provided `key` on the distributed hash table.
+        Concurrent lookups of the same key share a single request (see search).
+        """
         keyOnlyEntry = Entry(key, "")
         result = yield self.search(keyOnlyEntry, "lookup")
         return result
+
+    # Atomic operations, executed by the node responsible for the key
+
+    @defer.inlineCallbacks
+    def compareAndSet(self, key: str, value: str, version: int, ttl: float = None):
+        """
+        Sets the value of `key` if its entry's version is `version` (0 if there is no entry),
+        i.e. if it has not been written since it was read. Every write of a key gives it a
+        version it has never had before (see _nextVersion), so this also holds for
+        plain inserts and for keys deleted and inserted again. Returns a deferred that fires with a
+        (swapped, entry) tuple, entry being the entry stored after the operation.
+        """
+        entry = Entry(key, value, None if ttl is None else time.time() + ttl, version)
+        result = yield self.search(entry, "compareAndSet")
+        return result
+
+    @defer.inlineCallbacks
+    def increment(self, key: str, delta: int = 1, ttl: float = None):
+        """
+        Adds delta to the integer value of `key` (0 if there is no entry) and returns a deferred
+        that fires with the new value, or with None if the value is not an integer.
+        ttl only applies if the entry is created.
+        """
+        entry = Entry(key, str(delta), None if ttl is None else time.time() + ttl)
+        result = yield self.search(entry, "increment")
+        return None if result is None else int(result.value)
+
+    @defer.inlineCallbacks
+    def append(self, key: str, suffix: str, ttl: float = None):
+        """
+        Appends suffix to the value of `key` (the empty string if there is no entry) and
+        returns a deferred that fires with the new entry. ttl only applies if the entry is created.
+        """
+        entry = Entry(key, suffix, None if ttl is None else time.time() + ttl)
+        result = yield self.search(entry, "append")
+        return result
+
+    @defer.inlineCallbacks
+    def getAndSet(self, key: str, value: str, ttl: float = None):
+        """Sets the value of `key` and returns a deferred that fires with the former entry (or None)."""
+        entry = Entry(key, value, None if ttl is None else time.time() + ttl)
+        result = yield self.search(entry, "getAndSet")
+        return result
+
+    @defer.inlineCallbacks
+    def scan(self, pageCallback: Callable[[List[Entry]], None], a: float = 0.0, b: float = 1.0,
+             pageSize: int = DEFAULT_SCAN_PAGE_SIZE):
+        """
+        Retrieves all entries of the distributed hash table whose position in the key space
+        is in [a,b) (all entries by default) from the responsible nodes.
+        The entries are passed to pageCallback in pages of at most pageSize entries,
+        ordered by their positions. If pageCallback returns a deferred, the next
+        page is not passed before it has fired.
+        The nodes are found by following the successors returned with their first pages,
+        so the first pages of up to `parallelism` nodes ahead are requested concurrently,
+        while the pages of the current node are retrieved. Of each node, the next page is
+        requested before the current one is passed, so retrieving and processing pages overlap.
+        Returns a deferred that fires with the number of entries when the scan is complete.
+        """
+        node = yield self.locate(a)
+        if node is None:
+            raise RuntimeError("Scanning failed: The node responsible for {} could not be located.".format(a))
+        # the (node, deferred first page) tuples of the nodes requested so far, in order
+        nodes = []
+        # the index of the node whose pages are passed, and the successor that has
+        # not been requested yet, as it would be more than parallelism nodes ahead
+        progress = {"index": 0, "succ": None}
+
+        def requestFirstPage(v: skip.SkipNodeReference):
+            deferred = v.scanPage(a, b, None, pageSize)
+            deferred.addCallback(followSucc)
+            nodes.append((v, deferred))
+
+        def followSucc(page):
+            # called with the first page of the last node requested
+            if page is not None and page[2] is not None and page[2] < b:
+                if len(nodes) - progress["index"] <= self.parallelism:
+                    requestFirstPage(page[2])
+                else:
+                    progress["succ"] = page[2]
+            return page
+
+        requestFirstPage(node)
+        count = 0
+        while True:
+            if progress["succ"] is not None and len(nodes) - progress["index"] <= self.parallelism:
+                succ, progress["succ"] = progress["succ"], None
+                requestFirstPage(succ)
+            if progress["index"] == len(nodes):
+                break
+            node, nextPage = nodes[progress["index"]]
+            while nextPage is not None:
+                page = yield nextPage
+                if page is None:
+                    raise RuntimeError("Scanning {} failed: The node did not respond.".format(node))
+                entries, cursor, _ = page
+                # prefetch the next page
+                nextPage = node.scanPage(a, b, cursor, pageSize) if cursor is not None else None
+                count += len(entries)
+                if len(entries) > 0:
+                    yield pageCallback(entries)
+            progress["index"] += 1
+        return count
+
+    def prefixScan(self, prefix: str, pageCallback: Callable[[List[Entry]], None], pageSize: int = DEFAULT_SCAN_PAGE_SIZE):
+        """
+        Like scan, but retrieves the entries whose keys start with prefix.
+        With a PrefixPlacement, only the nodes owning the prefix's interval of the key space
+        are visited, otherwise all nodes are.
+        Pages may contain less than pageSize entries.
+        """
+        def filterPage(entries: List[Entry]):
+            matchingEntries = [e for e in entries if e.key.startswith(prefix)]
+            counter[0] += len(matchingEntries)
+            if len(matchingEntries) > 0:
+                return pageCallback(matchingEntries)
+
+        counter = [0]
+        a, b = self.placement.prefixRange(prefix)
+        deferred = self.scan(filterPage, a, b, pageSize)
+        deferred.addCallback(lambda _: counter[0])
+        return deferred
     
     # Local private operations
 
     def _insert(self, entry: Entry):
+        if self._scanIndex is not None and entry.key not in self.localHashTable:
+            bisect.insort(self._scanIndex, (self.placement.position(entry.key), entry.key))
         self.localHashTable[entry.key] = entry
+        self._handedOverKeys.discard(entry.key)
+        self._scheduleExpiry((entry,))
+        if self._pendingKeys is not None:
+            self._pendingKeys.add(entry.key)
+            self._deletedKeys.discard(entry.key)
     
     def _delete(self, entry: Entry):
-        self.localHashTable.pop(entry.key)
+        if entry.key in self.localHashTable:
+            del self.localHashTable[entry.key]
+            if self._scanIndex is not None:
+                indexEntry = (self.placement.position(entry.key), entry.key)
+                del self._scanIndex[bisect.bisect_left(self._scanIndex, indexEntry)]
+        self._handedOverKeys.discard(entry.key)
+        if self._pendingKeys is not None:
+            self._pendingKeys.discard(entry.key)
+            self._deletedKeys.add(entry.key)
     
     def _lookup(self, entry: Entry):
-        return self.localHashTable.get(entry.key, None)
+        if entry.key in self._handedOverKeys:
+            return None
+        localEntry = self.localHashTable.get(entry.key, None)
+        if localEntry is not None and localEntry.expired():
+            self._delete(localEntry)
+            return None
+        return localEntry
+
+    def _update(self, d: Entry, operationName: str):
+        """
+        Executes the atomic operation on d's key (see compareAndSet, increment, append
+        and getAndSet) and returns its result.
+        """
+        current = self._lookup(d)
+        if operationName == "compareAndSet":
+            if (0 if current is None else current.version) != d.version:
+                return False, current
+            entry = Entry(d.key, d.value, d.expiresAt, self._nextVersion(current))
+            self._insert(entry)
+            return True, entry
+        if operationName == "getAndSet":
+            self._insert(Entry(d.key, d.value, d.expiresAt, self._nextVersion(current)))
+            return current
+        expiresAt = d.expiresAt if current is None else current.expiresAt
+        if operationName == "increment":
+            try:
+                value = str((0 if current is None else int(current.value)) + int(d.value))
+            except ValueError:
+                return None
+        else: # append
+            value = ("" if current is None else current.value) + d.value
+        entry = Entry(d.key, value, expiresAt, self._nextVersion(current))
+        self._insert(entry)
+        return entry
+
+    def _nextVersion(self, current: Entry) -> int:
+        """
+        The version of the next write of current's key (current being None if there is no entry).
+        Versions are timestamps in microseconds, raised above both the key's current version and the
+        node's last version if necessary. Thus, a key is not given a version it had before, neither
+        when it is deleted and written again nor when its owner changes, and stale versions
+        do not match in compareAndSet.
+        """
+        version = max(int(time.time() * 1000000), self._lastVersion + 1, 0 if current is None else current.version + 1)
+        self._lastVersion = version
+        return version
+
+    def _scheduleExpiry(self, entries: Iterable[Entry]):
+        for entry in entries:
+            if entry.expiresAt is not None:
+                self._expiryWheel.add(entry.key, entry.expiresAt)
+
+    def _evictExpired(self, now: float):
+        """Deletes the local entries that have expired at the time now."""
+        for key in self._expiryWheel.advance(now):
+            # the entry might have been deleted, replaced or handed off in the meantime
+            entry = self.localHashTable.get(key, None)
+            if entry is not None and entry.expired(now):
+                self._delete(entry)
 
     # Remote operations
 
+    @priority(PRIORITY_USER)
     @remoteMethod
     def search(self, d: Entry, operationName: str):
         """
         Delegates the search method call to the node that is responsible
         for the key specified in entry d. If a node is responsible, it will
-        executes an operation according to `operationName`, providing d.
+        executes an operation according to `operationName`, providing d:
+        "lookup", "insert", "delete" or one of the atomic operations
+        "compareAndSet", "increment", "append" and "getAndSet".
         Depending on the operation, a (maybe deferred) value might be
         returned by this method.
+        Lookups of a key that is already being looked up through this node
+        are not delegated again but wait for the result of the pending one.
+        With directReply, the request is delegated by `route` instead, with
+        iterative, this node drives the search by `routeStep`. Buffered writes of
+        the key are flushed first.
         """
-
-        def processLocally():
-            if operationName == "lookup":
-                return self._lookup(d)
-            elif operationName == "insert":
-                self._insert(d)
-            elif operationName == "delete":
-                self._delete(d)
+        if d.key in self._bufferedKeys:
+            self.flushWrites()
         
         @defer.inlineCallbacks
         def delegateTo(v: skip.SkipNodeReference):
-            returnValue = yield v.search(d, operationName)
+            if self.iterative:
+                returnValue = yield self._searchIteratively(v, d, operationName)
+            elif self.directReply:
+                returnValue = yield self._routeTo(v, d, operationName)
+            else:
+                returnValue = yield v.search(d, operationName)
             return returnValue
         
-        unitKey = d.unitKeyHash()
+        nextNode = self._nextHop(self.placement.position(d.key))
+        if nextNode is None:
+            return self._process(d, operationName)
+        if operationName != "lookup":
+            # lookups issued after this write must not receive the result of an earlier one
+            self._inFlightLookups.pop(d.key, None)
+            return delegateTo(nextNode)
+        return self._coalesceLookup(d.key, lambda: delegateTo(nextNode))
+
+    @priority(PRIORITY_USER)
+    @remoteMethod
+    def searchBatch(self, operations: List[Tuple[Entry, str]]):
+        """
+        Executes the write operations given by (entry, operation name) tuples like search,
+        except that those with the same next hop are delegated by a single searchBatch call,
+        without waiting for it. The operations concerning the same key are executed in the order given.
+        """
+        batches = {} # by next hop
+        for d, operationName in operations:
+            self._inFlightLookups.pop(d.key, None)
+            nextNode = self._nextHop(self.placement.position(d.key))
+            if nextNode is None:
+                self._process(d, operationName)
+            else:
+                batches.setdefault(nextNode, []).append((d, operationName))
+        for nextNode, batch in batches.items():
+            nextNode.searchBatch(batch)
+
+    def _process(self, d: Entry, operationName: str):
+        """Executes the operation on the local hash table, see search."""
+        self._requestCounter += 1
+        if self._drainTarget is not None:
+            if operationName != "lookup" or self._pendingKeys is None or d.key not in self._pendingKeys:
+                # we have left, the entry is the new owner's
+                return self._drainTarget.search(d, operationName)
+        if operationName == "lookup":
+            return self._lookup(d)
+        elif operationName == "insert":
+            self._insert(Entry(d.key, d.value, d.expiresAt, self._nextVersion(self.localHashTable.get(d.key, None))))
+        elif operationName == "delete":
+            self._delete(d)
+        elif operationName in ("compareAndSet", "increment", "append", "getAndSet"):
+            return self._update(d, operationName)
+
+    def _routeTo(self, v: skip.SkipNodeReference, d: Entry, operationName: str) -> defer.Deferred:
+        """
+        Routes the request to v by `route` and returns a deferred that fires with the
+        reply of the responsible node, or with None if there is none within replyTimeout.
+        """
+        requestId = next(self._requestIds)
+        reply = defer.Deferred()
+        timeoutCall = reactor.callLater(self.replyTimeout, self.deliverResult, requestId, None)
+        self._pendingReplies[requestId] = (reply, timeoutCall)
+        v.route(d, operationName, self.reference, requestId)
+        return reply
+
+    @defer.inlineCallbacks
+    def _searchIteratively(self, v: skip.SkipNodeReference, d: Entry, operationName: str):
+        """
+        Searches the node responsible for d's key, starting at v and the closest node of the
+        owner cache, by querying the `parallelism` closest known nodes not queried yet by
+        routeStep until one of them is responsible. Nodes that do not reply within hopTimeout
+        are skipped. The operation is then sent to the responsible node by a single search call,
+        so it is executed once even if several nodes consider themselves responsible.
+        If no node is found to be responsible, the deferred fires with None.
+        """
+        unitKey = self.placement.position(d.key)
+        distance = lambda w: abs(w.unitId - unitKey)
+        candidates = {v}
+        cached = self.ownerCache.closest(unitKey)
+        if cached is not None:
+            candidates.add(cached)
+        queried = {self.reference}
+        owner = None
+        while owner is None:
+            nodes = sorted(candidates - queried, key=distance)[:self.parallelism]
+            if len(nodes) == 0:
+                logger.warning("%s: Iterative search for key %s found no responsible node.", self, d.key)
+                return None
+            queried.update(nodes)
+            replies = yield defer.gatherResults([self._queryStep(w, unitKey) for w in nodes])
+            for w, reply in zip(nodes, replies):
+                if reply is None:
+                    self.ownerCache.remove(w) # failed or timed out
+                    continue
+                responsible, closest = reply
+                if responsible:
+                    owner = w
+                    break
+                candidates.update(closest)
+        self.ownerCache.add(owner)
+        result = yield owner.search(d, operationName)
+        return result
+
+    def _queryStep(self, v: skip.SkipNodeReference, unitKey: float) -> defer.Deferred:
+        """Calls v's routeStep, the returned deferred fires with None after hopTimeout seconds."""
+        step = defer.Deferred()
+        timeoutCall = reactor.callLater(self.hopTimeout, step.callback, None)
+        
+        def reply(value):
+            if timeoutCall.active():
+                timeoutCall.cancel()
+                step.callback(value)
+        
+        v.routeStep(unitKey, self.parallelism).addCallbacks(reply, lambda _: reply(None))
+        return step
+
+    @priority(PRIORITY_USER)
+    @remoteMethod
+    def routeStep(self, unitKey: float, count: int):
+        """
+        A step of an iterative search (see HashNode's iterative option). Returns (True, None)
+        if this node is responsible for unitKey, otherwise (False, nodes), nodes being the
+        count neighbors closest to unitKey. The operation itself is not executed here,
+        see _searchIteratively.
+        """
+        if self._nextHop(unitKey) is None:
+            return True, None
+        closest = sorted(self.N, key=lambda w: abs(w.unitId - unitKey))[:count]
+        return False, closest
+
+    @priority(PRIORITY_USER)
+    @remoteMethod
+    def route(self, d: Entry, operationName: str, origin: skip.SkipNodeReference, requestId: int):
+        """
+        Like search, but the request is forwarded without waiting for the next hop:
+        the responsible node sends the result to `origin` by calling its deliverResult
+        method with `requestId`. Intermediate nodes thus keep no state for the request.
+        """
+        nextNode = self._nextHop(self.placement.position(d.key))
+        if nextNode is not None:
+            nextNode.route(d, operationName, origin, requestId)
+            return
+        def failed(failure):
+            logger.warning("Processing the routed request %s of %s failed: %s", requestId, origin, failure.getErrorMessage())
+            return None
+        
+        result = defer.maybeDeferred(self._process, d, operationName).addErrback(failed)
+        if origin == self.reference:
+            result.addCallback(lambda value: self.deliverResult(requestId, value))
+        else:
+            result.addCallback(lambda value: origin.deliverResult(requestId, value))
+
+    @priority(PRIORITY_USER)
+    @remoteMethod
+    def deliverResult(self, requestId: int, result):
+        """Fires the deferred of the routed request with the id requestId, see route."""
+        pending = self._pendingReplies.pop(requestId, None)
+        if pending is None:
+            return # timed out before or delivered twice
+        reply, timeoutCall = pending
+        if timeoutCall.active():
+            timeoutCall.cancel()
+        reply.callback(result)
 
+    def _coalesceLookup(self, key: str, delegate: Callable[[], defer.Deferred]) -> defer.Deferred:
+        """
+        Returns a deferred that fires with the result of the lookup of key. If no lookup
+        of key is in flight, delegate is called to start one, otherwise its result is shared.
+        """
+        waiter = defer.Deferred()
+        waiters = self._inFlightLookups.get(key)
+        if waiters is not None:
+            waiters.append(waiter)
+            return waiter
+        waiters = self._inFlightLookups[key] = [waiter]
+
+        def notify(result):
+            if self._inFlightLookups.get(key) is waiters:
+                del self._inFlightLookups[key]
+            for w in waiters:
+                if isinstance(result, Failure):
+                    w.errback(result)
+                else:
+                    w.callback(result)
+
+        defer.maybeDeferred(delegate).addBoth(notify)
+        return waiter
+
+    def _nextHop(self, unitKey: float) -> Union[skip.SkipNodeReference, None]:
+        """
+        Returns the neighbor a request concerning unitKey is to be delegated to,
+        or None if this node is responsible for unitKey.
+        """
         # our position in the [o,1) interval is self.unitId
         if self.pred is skip.lowest and unitKey < self.unitId:
             # We do not have cyclic edges in this implementation, so we have to process the request
-            return processLocally()
+            return None
         if self.succ is skip.highest and unitKey > self.unitId:
             # The entry is ours
-            return processLocally()
+            return None
         
         # if we reach this line, both pred and succ are references to real nodes
         if not self.pred <= unitKey <= self.succ:
             # determining the node next to unitKey (by id) without overstepping unitKey
-            nextNode = None
             if unitKey < self.pred:
-                nextNode = min(x for x in self.N if x > unitKey)
+                return min(x for x in self.N if x > unitKey)
             else:
-                nextNode = max(x for x in self.N if x < unitKey)
-            return delegateTo(nextNode)
+                return max(x for x in self.N if x < unitKey)
         else:
             if unitKey < self.unitId:
-                return delegateTo(self.pred) # entry belongs to our predecessor
+                return self.pred # entry belongs to our predecessor
             else:
-                return processLocally() # entry belongs to us
+                return None # entry belongs to us
+
+    @priority(PRIORITY_USER)
+    @remoteMethod
+    def locate(self, unitKey: float):
+        """
+        Returns a (maybe deferred) reference to the node that is responsible for unitKey.
+        """
+        nextNode = self._nextHop(unitKey)
+        if nextNode is None:
+            return self.reference
+        return nextNode.locate(unitKey)
+
+    @priority(PRIORITY_USER)
+    @remoteMethod
+    def scanPage(self, a: float, b: float, cursor: Union[Tuple[float, str], None], limit: int):
+        """
+        Returns a page of at most `limit` local entries whose position is in [a,b),
+        ordered by (position, key), as an (entries, cursor, succ) tuple.
+        Expired entries are left out, so pages might have less than `limit` entries.
+        If `cursor` is given, the page starts after the entry it refers to.
+        The returned cursor refers to the page's last entry, or is None if there
+        are no more matching local entries. `succ` is the node's successor,
+        or None if it has none.
+        """
+        scanIndex = self._getScanIndex()
+        if cursor is None:
+            start = bisect.bisect_left(scanIndex, (a,))
+        else:
+            start = bisect.bisect_right(scanIndex, tuple(cursor))
+        end = bisect.bisect_left(scanIndex, (b,))
+        keys = [key for _, key in scanIndex[start:min(end, start+limit)]]
+        now = time.time()
+        entries = [entry for entry in (self.localHashTable[key] for key in keys if key not in self._handedOverKeys)
+                    if not entry.expired(now)]
+        cursor = scanIndex[start+limit-1] if start+limit < end else None
+        succ = self.succ if self.succ is not skip.highest else None
+        return entries, cursor, succ
     
+    def _getScanIndex(self) -> List[Tuple[float, str]]:
+        """
+        Returns the ascending (position, key) tuples of the local entries. The index is
+        built from scratch when it is first needed and after entries have been taken over,
+        single writes and hand-offs update it in place.
+        """
+        if self._scanIndex is None:
+            self._scanIndex = sorted((self.placement.position(key), key) for key in self.localHashTable.keys())
+        return self._scanIndex
+
+    @priority(PRIORITY_MAINTENANCE)
+    @remoteMethod
+    def getLoad(self) -> dict:
+        """
+        Returns a dict describing the node's load: the number of `entries`
+        and the `requestRate` (processed requests per second).
+        """
+        return {"entries": len(self.localHashTable), "requestRate": self.requestRate}
+
+    @priority(PRIORITY_MAINTENANCE)
+    @remoteMethod
+    def getSplitPosition(self) -> float:
+        """
+        Returns the position in the key space that divides the node's entries in two halves,
+        or the middle of the node's slice of the key space if it has no entries.
+        Unlike getLoad, this needs the scan index (see _getScanIndex).
+        """
+        scanIndex = self._getScanIndex()
+        if len(scanIndex) > 0:
+            return scanIndex[len(scanIndex) // 2][0]
+        return (self.unitId + (self.succ.unitId if self.succ is not skip.highest else 1.0)) / 2
+
+    def timeout(self):
+        self.requestRate = ((1 - REQUEST_RATE_SMOOTHING) * self.requestRate +
+                                REQUEST_RATE_SMOOTHING * self._requestCounter / self._timer.step)
+        self._requestCounter = 0
+        self._evictExpired(time.time())
+        if len(self._handedOverKeys) > 0 and not self._reconciling and not self.leaving:
+            self._reconcile()
+        super(HashNode, self).timeout()
+
+    @defer.inlineCallbacks
+    def reposition(self, nodeId: int, introducer: skip.SkipNodeReference,
+                   batchSize: int = DEFAULT_DRAIN_BATCH_SIZE, batchInterval: float = DEFAULT_DRAIN_BATCH_INTERVAL):
+        """
+        Moves the node to the position nodeId in the overlay: its entries are handed over
+        to the node taking over its slice of the key space (see drain), its neighbors forget it and
+        it rejoins under its new id via introducer, receiving the entries of its new slice
+        from its new predecessor.
+        Returns a deferred that fires when the node has left its former position.
+        """
+        yield self._leave(batchSize, batchInterval)
+        # the entries handed over are not ours anymore, wherever we rejoin
+        for key in list(self._handedOverKeys):
+            self._delete(Entry(key, ""))
+        self._drainTarget = None
+        self.pred = skip.lowest
+        self.succ = skip.highest
+        self.changeId(nodeId)
+        self.N.discard(introducer) # so that linearise considers it
+        self.linearise(introducer)
+
+    @defer.inlineCallbacks
+    def drain(self, batchSize: int = DEFAULT_DRAIN_BATCH_SIZE, batchInterval: float = DEFAULT_DRAIN_BATCH_INTERVAL,
+              gracePeriod: float = DEFAULT_DRAIN_GRACE_PERIOD):
+        """
+        Prepares the node for leaving the overlay without losing entries or failing requests.
+        The entries are transferred in batches of at most batchSize entries, batchInterval
+        seconds apart, to the node taking over our slice of the key space: the nearest
+        remaining node below us or, if we are the lowest node, above us. Entries written
+        in the meantime are transferred again. Once the new owner has confirmed all entries,
+        our neighbors forget us, our predecessor and successor are introduced to each other,
+        and the requests still reaching us are forwarded to the new owner for gracePeriod seconds.
+        A persistent store (LogStore) keeps the entries taken over, so a node restarted on it
+        can compare them with the new owner's when it is back (see _reconcile).
+        Returns a deferred that fires with the new owner when the node may be shut down,
+        or with None if no node took over the entries, which are kept then.
+        """
+        target = yield self._leave(batchSize, batchInterval)
+        if self.pred is not skip.lowest and self.succ is not skip.highest:
+            self.pred.linearise(self.succ)
+            self.succ.linearise(self.pred)
+        if target is not None:
+            yield sleep(gracePeriod)
+        return target
+
+    @defer.inlineCallbacks
+    def _leave(self, batchSize: int, batchInterval: float):
+        """
+        Transfers our entries to the new owner of our slice of the key space (see drain)
+        and makes our neighbors forget us. From then on, requests are forwarded to the new owner.
+        Returns a deferred that fires with the new owner, or with None if there is none.
+        """
+        self._pendingKeys = set(self.localHashTable.keys())
+        self._deletedKeys = set()
+        try:
+            target = yield self._transferEntries(batchSize, batchInterval)
+            if target is None:
+                if len(self.localHashTable) > 0:
+                    logger.warning("%s: No node took over the remaining %d entries.", self, len(self.localHashTable))
+            formerReference = self.reference
+            yield defer.gatherResults([defer.maybeDeferred(n.forget, formerReference) for n in set(self.N)])
+            if target is not None:
+                # the new owner is responsible for our entries now, so we forward requests to it
+                # and only transfer the entries that have been written while our neighbors were notified
+                self._drainTarget = target
+                target = yield self._transferEntries(batchSize, batchInterval, target)
+                if target is not None:
+                    self._drainTarget = target
+                    # the entries are the target's now. A persistent store keeps them, but
+                    # marks them, so they are not served before they have been reconciled
+                    if isinstance(self.localHashTable, LogStore):
+                        self.localHashTable.mark()
+                        self._handedOverKeys = set(self.localHashTable.markedKeys)
+                    else:
+                        self.localHashTable.clear()
+                        self._scanIndex = None
+        finally:
+            self._pendingKeys = None
+            self._deletedKeys = None
+        return target
+
+    @defer.inlineCallbacks
+    def _transferEntries(self, batchSize: int, batchInterval: float, target: skip.SkipNodeReference = None):
+        """
+        Transfers the pending entries and deletions to target, or the new owner of our slice
+        of the key space if no target is given, in throttled batches, each of them being
+        confirmed by the receiving node. If a node fails or refuses a batch (e.g. because it
+        is leaving as well), all entries are transferred to the next candidate instead.
+        Returns a deferred that fires with the node that took over the entries,
+        or with None if there is no node to take them over.
+        """
+        excluded = set()
+        if target is None:
+            target = self._newOwner(excluded)
+        while target is not None and (len(self._pendingKeys) > 0 or len(self._deletedKeys) > 0):
+            keys = set(itertools.islice(self._pendingKeys, batchSize))
+            deletedKeys = set(itertools.islice(self._deletedKeys, batchSize))
+            # entries written while the batch is in transit are pending again
+            self._pendingKeys.difference_update(keys)
+            self._deletedKeys.difference_update(deletedKeys)
+            hashTable = dict((key, self.localHashTable[key]) for key in keys if key in self.localHashTable)
+            taken = yield target.takeOver(hashTable, list(deletedKeys))
+            if taken != len(hashTable) + len(deletedKeys):
+                logger.info("%s: %s did not take over our entries, trying the next node.", self, target)
+                excluded.add(target)
+                target = self._newOwner(excluded)
+                self._pendingKeys = set(self.localHashTable.keys())
+                self._deletedKeys.update(key for key in deletedKeys if key not in self.localHashTable)
+            elif len(self._pendingKeys) > 0 or len(self._deletedKeys) > 0:
+                yield sleep(batchInterval)
+        return target
+
+    def _newOwner(self, excluded: set) -> Union[skip.SkipNodeReference, None]:
+        """
+        Returns the node that owns our slice of the key space once we have left:
+        the nearest neighbor below us or, if there is none, above us, ignoring excluded nodes.
+        """
+        candidates = self.N - excluded
+        lower = [x for x in candidates if x < self.reference]
+        if len(lower) > 0:
+            return max(lower)
+        higher = [x for x in candidates if x > self.reference]
+        return min(higher) if len(higher) > 0 else None
+
+    @property
+    def leaving(self) -> bool:
+        """Whether the node is transferring its entries in order to leave (see drain)."""
+        return self._pendingKeys is not None or self._drainTarget is not None
+
+    @priority(PRIORITY_TRANSFER)
     @remoteMethod
     def handOff(self, v: skip.SkipNodeReference):
         """
@@ -138,36 +916,200 @@ class HashNode(skip.SkipNode):
         to be transferred to a new successor v.
         """
         local = self.localHashTable
-        keysToHandOff = [key for key in local.keys() if local[key].unitKeyHash() >= v]
+        if self._scanIndex is not None:
+            # the entries to hand off are the index's tail
+            start = bisect.bisect_left(self._scanIndex, (v.unitId,))
+            keysToHandOff = [key for _, key in self._scanIndex[start:]]
+            del self._scanIndex[start:]
+        else:
+            keysToHandOff = [key for key in local.keys() if self.placement.position(key) >= v]
         return {key: local.pop(key) for key in keysToHandOff}
     
+    @priority(PRIORITY_TRANSFER)
     @remoteMethod
-    def takeOver(self, hashTable: Dict[str, str]):
+    def takeOver(self, hashTable: Dict[str, Entry], deletedKeys: List[str] = ()):
+        """
+        Integrates the passed hashTable dictionary of a leaving node into the localHashTable
+        and deletes the entries specified by deletedKeys, which have been deleted meanwhile.
+        Returns the number of entries and deletions taken over, which is 0 if we are
+        leaving ourselves.
+        """
+        if self.leaving:
+            return 0
+        self._integrate(hashTable)
+        for key in deletedKeys:
+            self.localHashTable.pop(key, None)
+            self._handedOverKeys.discard(key)
+        self._scanIndex = None
+        # entries relocated by a neighbor (see _relocate) might not be ours either
+        self._relocate(hashTable.keys())
+        return len(hashTable) + len(deletedKeys)
+
+    def _integrate(self, hashTable: Dict[str, Entry]) -> None:
+        """
+        Integrates the entries of another node (see handOff and takeOver) into the localHashTable.
+        Local entries are only replaced by entries of the same or a newer version.
+        """
+        local = self.localHashTable
+        newer = dict((key, entry) for key, entry in hashTable.items()
+                        if key not in local or local[key].version <= entry.version)
+        local.update(newer)
+        self._handedOverKeys.difference_update(hashTable)
+        self._scheduleExpiry(newer.values())
+        if len(newer) > 0:
+            self._scanIndex = None
+
+    @defer.inlineCallbacks
+    def _relocate(self, keys: Iterable[str] = None):
+        """
+        Hands the entries outside of our slice of the key space to our predecessor resp.
+        successor, which relocates them further if they are not its own either (see takeOver).
+        Such entries have been stored while we did not know the node owning them yet,
+        e.g. while the overlay had not converged. Entries the neighbor does not take over
+        (e.g. because it is leaving) are kept.
+        Only the entries of the given keys are checked, all entries by default.
         """
-        Integrates the passed hashTable dictionary of a leaving node into the localHashTable.
+        if self._relocating or self.leaving:
+            return
+        self._relocating = True
+        try:
+            lower, higher = {}, {}
+            for key in list(self.localHashTable.keys() if keys is None else keys):
+                if key not in self.localHashTable:
+                    continue
+                position = self.placement.position(key)
+                if self.pred is not skip.lowest and position < self.unitId:
+                    lower[key] = self.localHashTable[key]
+                elif self.succ is not skip.highest and position >= self.succ.unitId:
+                    higher[key] = self.localHashTable[key]
+            for neighbor, entries in ((self.pred, lower), (self.succ, higher)):
+                if len(entries) == 0:
+                    continue
+                for key in entries:
+                    self._delete(entries[key])
+                taken = yield neighbor.takeOver(entries)
+                if taken != len(entries):
+                    self._integrate(dict((key, entry) for key, entry in entries.items() if key not in self.localHashTable))
+        finally:
+            self._relocating = False
+
+    @defer.inlineCallbacks
+    def _reconcile(self):
+        """
+        Compares the recovered entries we had handed over when we left (see drain) with those
+        of the node that took them over, i.e. our predecessor once its successor is us:
+        newer entries replace ours (see _integrate), and the handed over keys it does not
+        have anymore have been deleted in the meantime.
+        While there is no predecessor, the entries stay hidden.
         """
-        self.localHashTable.update(hashTable)
+        self._reconciling = True
+        try:
+            pred = self.pred
+            if pred is skip.lowest:
+                return
+            predSucc = yield pred.getSucc()
+            if predSucc != self.reference:
+                return # the predecessor does not know that we are back yet, or it is not ours
+            hashTable = yield pred.handOff(self.reference)
+            if hashTable is None or self.pred != pred:
+                return
+            self._integrate(hashTable)
+            if len(self._handedOverKeys) > 0:
+                logger.info("%s: Dropping %d recovered entries that have been deleted meanwhile.",
+                            self, len(self._handedOverKeys))
+                for key in list(self._handedOverKeys):
+                    self._delete(Entry(key, ""))
+        finally:
+            self._reconciling = False
+
+    @priority(PRIORITY_MAINTENANCE)
+    @remoteMethod
+    def getSucc(self) -> skip.SkipNodeReference:
+        """The node's successor, e.g. for checking whether a node is its predecessor."""
+        return self.succ
     
+    @priority(PRIORITY_MAINTENANCE)
     @remoteMethod
-    @defer.inlineCallbacks
     def linearise(self, u: skip.SkipNodeReference):
         skip.SkipNode.linearise(self, u)
-        # update predecessor and successor
-        oldPred = self.pred
+        return self._updatePredAndSucc()
+
+    def setNeighborhood(self, N: Set[skip.SkipNodeReference], introduce: bool = True):
+        """
+        Like SkipNode.setNeighborhood, but also fetches the node's entries from its new predecessor.
+        Returns a deferred that fires when they have arrived.
+        """
+        skip.SkipNode.setNeighborhood(self, N, introduce)
+        return self._updatePredAndSucc()
+
+    @defer.inlineCallbacks
+    def _updatePredAndSucc(self):
+        oldPred, oldSucc = self.pred, self.succ
         self.pred = skip.pred(self.reference, self.N)
         self.succ = skip.succ(self.reference, self.N)
         if self.pred != oldPred and self.pred is not skip.lowest:
             # get our entries from our new predecessor
             hashTable = yield self.pred.handOff(self.reference)
-            self.localHashTable.update(hashTable)
+            if hashTable is not None:
+                self._integrate(hashTable)
+        if self.pred != oldPred or self.succ != oldSucc:
+            # a new neighbor might own some of our entries
+            self._relocate()
     
+    @priority(PRIORITY_MAINTENANCE)
+    @remoteMethod
+    def probe(self):
+        """Like SkipNode.probe, but a node that is leaving or has left (see drain) does not answer."""
+        if self.leaving:
+            return None
+        return self.reference
+
+    @priority(PRIORITY_MAINTENANCE)
+    @remoteMethod
+    def forget(self, u: skip.SkipNodeReference):
+        skip.SkipNode.forget(self, u)
+        self.pred = skip.pred(self.reference, self.N)
+        self.succ = skip.succ(self.reference, self.N)
+
+    def snapshotState(self) -> dict:
+        state = super(HashNode, self).snapshotState()
+        state["pred"] = skip.referenceToSnapshot(self.pred)
+        state["succ"] = skip.referenceToSnapshot(self.succ)
+        return state
+
+    def restoreSnapshotState(self, state: dict) -> None:
+        super(HashNode, self).restoreSnapshotState(state)
+        self.pred = skip.referenceFromSnapshot(state["pred"])
+        self.succ = skip.referenceFromSnapshot(state["succ"])
+
     @defer.inlineCallbacks
-    def shutdown(self):
-        if self.pred is not skip.lowest:
-            yield self.pred.takeOver(self.localHashTable)
+    def shutdown(self, batchSize: int = DEFAULT_DRAIN_BATCH_SIZE, batchInterval: float = DEFAULT_DRAIN_BATCH_INTERVAL):
+        """Drains the node (see drain) before shutting it down."""
+        self.flushWrites()
+        yield self.drain(batchSize, batchInterval)
         yield super(HashNode, self).shutdown()
+        for requestId in list(self._pendingReplies):
+            self.deliverResult(requestId, None)
+        if isinstance(self.localHashTable, LogStore):
+            self.localHashTable.close()
 
 class HashNodeFactory(skip.SkipNodeFactory):
+    """
+    A SkipNodeFactory for HashNodes.
+    If storageDirectory is specified, each node stores its entries in a
+    persistent LogStore in that directory, named after the node's port.
+    Nodes restarted on the same port recover their entries from there.
+    """
+
+    def __init__(self, startPort: int, entryNodeHost: str = None, entryNodePort: int = None, storageDirectory: str = None,
+                 nodeOptions: dict = None, networkConfig: NetworkConfig = None, fastJoin: bool = False):
+        super(HashNodeFactory, self).__init__(startPort, entryNodeHost, entryNodePort, nodeOptions, networkConfig, fastJoin)
+        self.storageDirectory = storageDirectory
+        if storageDirectory is not None:
+            os.makedirs(storageDirectory, exist_ok=True)
 
     def _initNode(self, port: int, isFirstNode: bool) -> HashNode:
-        return HashNode(port)
+        store = None
+        if self.storageDirectory is not None:
+            store = LogStore(os.path.join(self.storageDirectory, "node-{}.log".format(port)), Entry)
+        return HashNode(port, store, **self.nodeOptions)
@@ -0,0 +1,71 @@
+# A hierarchical timing wheel for expiring entries without scanning them.
+# Each level is a ring of slots, a slot of level l covering slots**l ticks. Items are put
+# into the lowest level whose ring spans their deadline. Whenever the wheel has advanced
+# by a whole slot of a higher level, the items of the next slot of that level are moved
+# down to the levels below, so adding an item and expiring it are O(1) operations.
+
+import math
+from typing import Any, List
+
+DEFAULT_SLOT_BITS = 6 # 64 slots per level
+DEFAULT_LEVELS = 4 # 64**4 ticks, i.e. about 194 days at a resolution of one second
+
+class TimingWheel:
+    """
+    Collects items by their deadline (in seconds, like time.time()) with a precision
+    of `resolution` seconds. `advance` returns the items whose deadline has passed.
+    Items cannot be removed: callers have to check whether a returned item is still
+    due (e.g. whether the entry has been replaced in the meantime).
+    Deadlines beyond the wheel's span are postponed to its end and rescheduled from there.
+    """
+
+    def __init__(self, start: float, resolution: float = 1.0, slotBits: int = DEFAULT_SLOT_BITS,
+                 levels: int = DEFAULT_LEVELS):
+        self.resolution = resolution
+        self._slotBits = slotBits
+        self._mask = (1 << slotBits) - 1
+        self._wheels = [[[] for _ in range(1 << slotBits)] for _ in range(levels)]
+        self._tick = self._toTick(start)
+        self._due = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _toTick(self, time: float) -> int:
+        return math.floor(time / self.resolution)
+
+    def add(self, item: Any, deadline: float) -> None:
+        """Adds item to be returned by `advance` once deadline has passed."""
+        self._count += 1
+        self._place(math.ceil(deadline / self.resolution), item)
+
+    def _place(self, tick: int, item: Any) -> None:
+        delta = tick - self._tick
+        if delta <= 0:
+            self._due.append(item)
+            return
+        levels = len(self._wheels)
+        # postponing deadlines beyond the wheel's span to its last tick
+        slotTick = min(tick, self._tick + (1 << (self._slotBits * levels)) - 1)
+        for level in range(levels):
+            if slotTick - self._tick < 1 << (self._slotBits * (level + 1)):
+                self._wheels[level][(slotTick >> (self._slotBits * level)) & self._mask].append((tick, item))
+                return
+
+    def advance(self, now: float) -> List[Any]:
+        """Advances the wheel to the time now and returns the items that have become due."""
+        target = self._toTick(now)
+        while self._tick < target:
+            self._tick += 1
+            # emptying the slots starting at this tick, the higher levels' first, as their items
+            # might move to a lower level's slot starting at this tick as well
+            for level in range(len(self._wheels) - 1, -1, -1):
+                if self._tick & ((1 << (self._slotBits * level)) - 1) == 0:
+                    index = (self._tick >> (self._slotBits * level)) & self._mask
+                    slot, self._wheels[level][index] = self._wheels[level][index], []
+                    for tick, item in slot:
+                        self._place(tick, item) # due items are added to self._due
+        due, self._due = self._due, []
+        self._count -= len(due)
+        return due
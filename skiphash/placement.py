@@ -0,0 +1,124 @@
+# Placement strategies mapping keys onto positions in the [0,1) key space of a HashNode overlay.
+# All nodes of an overlay have to use the same strategy (with the same parameters).
+
+import bisect
+from typing import Iterable, List, Tuple, Union
+
+from cityhash import CityHash128
+from skiphash.core import projectOntoUnitInterval
+
+
+def unitKeyHash(key: str) -> float:
+    """
+    Returns the projection of the key's CityHash128 hash onto the [0,1) interval.
+    """
+    return projectOntoUnitInterval(CityHash128(key), 128)
+
+def _successor(data: bytes) -> Union[bytes, None]:
+    """
+    Returns the smallest byte string that is greater than all byte strings starting with data,
+    e.g. b"ac" for b"ab", or None if there is none.
+    """
+    data = data.rstrip(b"\xff")
+    if len(data) == 0:
+        return None
+    return data[:-1] + bytes([data[-1] + 1])
+
+class HashPlacement:
+    """
+    Spreads keys uniformly over the key space by hashing them with CityHash128.
+    Keys with a common prefix end up on arbitrary nodes, so prefix scans
+    have to visit all nodes.
+    """
+
+    def position(self, key: str) -> float:
+        return unitKeyHash(key)
+
+    def prefixRange(self, prefix: str) -> Tuple[float, float]:
+        """
+        Returns an interval [a,b) of the key space containing the positions of all keys starting with prefix.
+        """
+        return 0.0, 1.0
+
+class PrefixPlacement:
+    """
+    Maps keys monotonically onto the key space, so that lexicographically adjacent keys
+    are stored on adjacent nodes and a prefix scan only visits the nodes owning
+    the prefix's interval. Keys are ordered by their UTF-8 bytes.
+    The key space is divided into equally sized segments, each of them holding the keys
+    from one boundary key up to the next one. Within a segment, a key's position is
+    interpolated from the INTERPOLATION_BYTES bytes following the common prefix of the
+    segment's boundary keys. As keys are rarely spread uniformly, use fromSample to
+    choose boundary keys that split a sample of keys evenly.
+    `boundaries` is the ascending list of boundary keys (as bytes), the first one being b"".
+    """
+
+    INTERPOLATION_BYTES = 6 # more bytes could not be represented exactly by float positions
+    PRECISION = 2**-40 # positions closer than this may be rounded together
+
+    def __init__(self, boundaries: List[bytes] = None):
+        if boundaries is None:
+            boundaries = [b""]
+        if boundaries[0] != b"" or any(x >= y for x, y in zip(boundaries, boundaries[1:])):
+            raise ValueError("The boundaries have to ascend strictly, starting with b\"\".")
+        self.boundaries = boundaries
+
+    @classmethod
+    def fromSample(cls, keys: Iterable[str], segments: int = 64) -> "PrefixPlacement":
+        """
+        Returns a PrefixPlacement whose `segments` segments between the sample's first
+        and last key hold about the same number of keys from the sample.
+        Keys may appear repeatedly in the sample, e.g. weighted by their request rates,
+        in order to balance load instead of entries.
+        """
+        sortedKeys = sorted(key.encode("utf-8") for key in keys)
+        if len(sortedKeys) == 0:
+            return cls()
+        # Bounding the sample by boundaries, too, keeps the keys before its first and
+        # after its last key from sharing a segment with dissimilar keys, which would
+        # leave only few bytes for interpolation.
+        boundaries = [b""]
+        for i in range(segments):
+            key = sortedKeys[i * len(sortedKeys) // segments]
+            if key > boundaries[-1]:
+                boundaries.append(key)
+        successor = _successor(sortedKeys[-1])
+        if successor is not None:
+            boundaries.append(successor)
+        return cls(boundaries)
+
+    def _value(self, data: bytes) -> float:
+        """Returns the base-256 fraction of the first INTERPOLATION_BYTES bytes of data."""
+        return int.from_bytes(data[:self.INTERPOLATION_BYTES].ljust(self.INTERPOLATION_BYTES, b"\0"), "big") \
+                / 2**(8 * self.INTERPOLATION_BYTES)
+
+    def _position(self, data: bytes) -> float:
+        segment = bisect.bisect_right(self.boundaries, data) - 1
+        low = self.boundaries[segment]
+        if segment + 1 < len(self.boundaries):
+            high = self.boundaries[segment+1]
+            # all keys between low and high start with their common prefix
+            common = 0
+            while common < len(low) and low[common] == high[common]:
+                common += 1
+            lowValue, highValue = self._value(low[common:]), self._value(high[common:])
+        else:
+            common = 0
+            lowValue, highValue = self._value(low), 1.0
+        fraction = (self._value(data[common:]) - lowValue) / (highValue - lowValue)
+        return (segment + min(fraction, 1.0)) / len(self.boundaries)
+
+    def position(self, key: str) -> float:
+        return self._position(key.encode("utf-8"))
+
+    def prefixRange(self, prefix: str) -> Tuple[float, float]:
+        """
+        Returns an interval [a,b) of the key space containing the positions of all keys starting with prefix.
+        """
+        prefixBytes = prefix.encode("utf-8")
+        # the keys starting with prefix are smaller than prefix's successor
+        successor = _successor(prefixBytes)
+        if successor is None:
+            return self._position(prefixBytes), 1.0
+        # keys differing from the successor only in later bytes may share its position
+        return self._position(prefixBytes), min(1.0, self._position(successor) + self.PRECISION)
@@ -0,0 +1,148 @@
+# Headless rendering of the Skip+ graph formed by a factory's local nodes.
+# Unlike view.py, this does not need Gtk or a display server, only cairo.
+
+import logging
+import math
+import os
+import time
+from typing import List, Tuple
+
+import cairo
+from twisted.application.internet import TimerService
+
+from skiphash.drawing import ElementDrawer
+
+logger = logging.getLogger(__name__)
+
+# The width and height of the screen a rendering is laid out for.
+# Node sizes are calculated relative to this, as in the Gtk visualization.
+DEFAULT_SCREEN_WIDTH = 1920
+DEFAULT_SCREEN_HEIGHT = 1080
+
+# cairo image surfaces must not exceed this size in either dimension
+MAXIMUM_IMAGE_SIZE = 32767
+
+class HeadlessRenderer:
+    """
+    Renders the Skip+ graph formed by a factory's local nodes into PNG, SVG
+    or PDF files, using the ElementDrawer of the Gtk visualization.
+    `factory` may be any object providing a `nodes` list and a
+    `getLocalNodeByReference` method, e.g. a NodeFactory or a topology
+    loaded from a dump.
+    Renderings can be made on demand (render, renderTiles) or periodically
+    (startSnapshots).
+    """
+
+    def __init__(self, factory, screenWidth: int = DEFAULT_SCREEN_WIDTH, screenHeight: int = DEFAULT_SCREEN_HEIGHT):
+        self.factory = factory
+        self.screenWidth = screenWidth
+        self.screenHeight = screenHeight
+        self._snapshotTimer = None
+        self._snapshotCounter = 0
+
+    def _newDrawer(self) -> ElementDrawer:
+        """
+        Returns a prepared ElementDrawer for the factory's current nodes.
+        A new drawer is needed for each rendering, as the nodes may have changed.
+        """
+        if len(self.factory.nodes) == 0:
+            raise ValueError("There are no nodes to be rendered.")
+        drawer = ElementDrawer(self.screenWidth, self.screenHeight, self.factory)
+        # measure the canvas using a dummy surface
+        drawer.prepare(cairo.Context(cairo.ImageSurface(cairo.FORMAT_RGB24, 1, 1)))
+        return drawer
+
+    def canvasSize(self, scale: float = 1) -> Tuple[int, int]:
+        """Returns the width and height (in pixels) a complete rendering would currently have."""
+        drawer = self._newDrawer()
+        return math.ceil(drawer.canvasWidth*scale), math.ceil(drawer.canvasHeight*scale)
+
+    def render(self, path: str, fileFormat: str = None, scale: float = 1) -> None:
+        """
+        Renders the complete graph into the file at `path`.
+        `fileFormat` is one of "png", "svg" and "pdf". If it is not given,
+        it is derived from the path's file extension.
+        `scale` zooms the rendering. Zoomed out far enough, nodes are drawn as
+        clusters and rs texts are left out (see the ElementDrawer's level of detail).
+        Graphs exceeding the maximum PNG size can be rendered with renderTiles().
+        """
+        if fileFormat is None:
+            fileFormat = os.path.splitext(path)[1][1:]
+        fileFormat = fileFormat.lower()
+
+        drawer = self._newDrawer()
+        width, height = math.ceil(drawer.canvasWidth*scale), math.ceil(drawer.canvasHeight*scale)
+
+        if fileFormat == "png":
+            if max(width, height) > MAXIMUM_IMAGE_SIZE:
+                raise ValueError(("The rendering would have {}x{} pixels, which exceeds the maximum "
+                                    "image size. Use renderTiles() instead.").format(width, height))
+            surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+        elif fileFormat == "svg":
+            surface = cairo.SVGSurface(path, width, height)
+        elif fileFormat == "pdf":
+            surface = cairo.PDFSurface(path, width, height)
+        else:
+            raise ValueError("Unsupported file format: '{}'. Use 'png', 'svg' or 'pdf'.".format(fileFormat))
+
+        cr = cairo.Context(surface)
+        cr.scale(scale, scale)
+        drawer.draw(cr)
+        if fileFormat == "png":
+            surface.write_to_png(path)
+        else:
+            surface.finish()
+        logger.info("Rendered %d nodes into %s", len(drawer.nodes), path)
+
+    def renderTiles(self, pathPattern: str, tileWidth: int = 4096, tileHeight: int = 4096, scale: float = 1) -> List[str]:
+        """
+        Renders the complete graph into PNG tiles of at most tileWidth x tileHeight pixels.
+        `pathPattern` is formatted with the tile's `row` and `column`, e.g. "graph-{row}-{column}.png".
+        Only the elements visible in a tile are drawn for it.
+        Returns the paths of the files that have been written, row by row.
+        """
+        drawer = self._newDrawer()
+        width, height = math.ceil(drawer.canvasWidth*scale), math.ceil(drawer.canvasHeight*scale)
+        paths = []
+        for row in range(math.ceil(height / tileHeight)):
+            for column in range(math.ceil(width / tileWidth)):
+                x = column * tileWidth
+                y = row * tileHeight
+                surface = cairo.ImageSurface(cairo.FORMAT_RGB24, min(tileWidth, width - x), min(tileHeight, height - y))
+                cr = cairo.Context(surface)
+                # move the tile's area into the surface, everything else is clipped
+                cr.translate(-x, -y)
+                cr.scale(scale, scale)
+                drawer.draw(cr)
+                path = pathPattern.format(row=row, column=column)
+                surface.write_to_png(path)
+                paths.append(path)
+        logger.info("Rendered %d nodes into %d tiles", len(drawer.nodes), len(paths))
+        return paths
+
+    # Periodic snapshots
+
+    def startSnapshots(self, pathPattern: str, interval: float = 10) -> None:
+        """
+        Renders a snapshot every `interval` seconds, using the reactor.
+        `pathPattern` is formatted with a running `counter` and the current unix `time`,
+        e.g. "snapshots/graph-{counter:05d}.svg".
+        """
+        self.stopSnapshots()
+        self._snapshotTimer = TimerService(interval, self._takeSnapshot, pathPattern)
+        self._snapshotTimer.startService()
+
+    def stopSnapshots(self):
+        """Stops periodic snapshots and returns a (maybe deferred) value when done."""
+        if self._snapshotTimer is not None:
+            timer, self._snapshotTimer = self._snapshotTimer, None
+            return timer.stopService()
+
+    def _takeSnapshot(self, pathPattern: str) -> None:
+        path = pathPattern.format(counter=self._snapshotCounter, time=int(time.time()))
+        self._snapshotCounter += 1
+        try:
+            self.render(path)
+        except ValueError as err:
+            # e.g. no nodes yet - try again next time
+            logger.warning("Skipping snapshot %s: %s", path, err)
@@ -1,19 +1,31 @@
 import logging
+import time
 # general skip helper functions
-from typing import Set, Union
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Set, Tuple, Union
 
 from bitarray import bitarray
-from twisted.internet import defer
+from twisted.internet import defer, threads
 from twisted.spread import pb
 
-from skiphash.core import (CopyableBitArray, Node, NodeFactory, NodeReference,
-                       PseudoNodeReference, eprint, randomBitArray,
-                       remoteMethod)
+from skiphash.core import (PRIORITY_MAINTENANCE, CopyableBitArray,
+                           NetworkConfig, Node, NodeFactory, NodeReference,
+                           PseudoNodeReference, eprint, priority,
+                           randomBitArray, remoteMethod)
 
-# Define the length of the rs bit string
+# Define the default length of the rs bit string (see SkipNode for choosing another one)
 RS_BYTE_LENGTH = 2
 RS_BIT_LENGTH = RS_BYTE_LENGTH * 8
 
+# the number of ids of left nodes a node remembers (see SkipNode.forget)
+MAXIMUM_FORGOTTEN_IDS = 1000
+
+# the seconds introductions of a forgotten node are ignored before it is probed (see SkipNode.forget)
+FORGET_GRACE_PERIOD = 2.0
+
+# the maximum number of times a joining node asks the nodes in its ranges for their neighbors (see SkipNode.join)
+MAXIMUM_JOIN_ROUNDS = 4
+
 lowest = PseudoNodeReference("lowest")
 highest = PseudoNodeReference("highest")
 
@@ -24,8 +36,8 @@ class SkipNodeReference(NodeReference):
     Extends the NodeReference class by a node's random bit string (rs).
     """
     
-    def __init__(self, host: str = None, port: int = None, rs: CopyableBitArray = None):
-        super(SkipNodeReference, self).__init__(host, port)
+    def __init__(self, host: str = None, port: int = None, rs: CopyableBitArray = None, nodeId: int = None):
+        super(SkipNodeReference, self).__init__(host, port, nodeId)
         self._rs = rs
     
     def getStateToCopy(self):
@@ -48,6 +60,30 @@ class SkipNodeReference(NodeReference):
 
 pb.setUnjellyableForClass('skiphash.skipplus.SkipNodeReference', SkipNodeReference)
 
+def referenceToSnapshot(ref: SkipNodeReference) -> Union[str, list]:
+    """
+    Returns a JSON-serializable representation of a SkipNodeReference
+    (or of lowest or highest) for topology snapshots.
+    """
+    if ref == lowest:
+        return "lowest"
+    if ref == highest:
+        return "highest"
+    if ref.explicitId is not None:
+        return [ref.host, ref.port, ref.rs.to01(), ref.explicitId]
+    return [ref.host, ref.port, ref.rs.to01()]
+
+def referenceFromSnapshot(state: Union[str, list]) -> SkipNodeReference:
+    """
+    The inverse of referenceToSnapshot.
+    """
+    if state == "lowest":
+        return lowest
+    if state == "highest":
+        return highest
+    host, port, rs = state[:3]
+    return SkipNodeReference(host, port, CopyableBitArray(rs), state[3] if len(state) > 3 else None)
+
 
 def prefix(i: int, v: Union["SkipNode", SkipNodeReference, bitarray]) -> CopyableBitArray:
     """
@@ -144,23 +180,178 @@ def longestCommonPrefixNodes(w: SkipNodeReference, W: Set[SkipNodeReference]) ->
     longestCommonPrefix = prefix(longestCommonPrefixLength, w.rs)
     return set(filter(lambda x: prefix(longestCommonPrefixLength, x.rs) == longestCommonPrefix, W))
 
+def computeRanges(v: SkipNodeReference, N: Set[SkipNodeReference]) -> Tuple[Dict[int, Set[SkipNodeReference]], Set[SkipNodeReference]]:
+    """
+    Returns the ranges of v for each level i < len(v.rs) - 1 given the neighborhood N,
+    as well as the set of all nodes that are in at least one of these ranges.
+    The levels end with the first one where no node of N shares v's prefix, i.e. where
+    v is alone, as the ranges of this level and all higher levels are empty.
+    """
+    ranges = {}
+    nodesInRanges = set()
+    for i in range(len(v.rs)-1):
+        levelRange = skipRange(i, v, N)
+        if len(levelRange) == 0:
+            break
+        ranges[i] = levelRange
+        nodesInRanges.update(levelRange)
+    return ranges, nodesInRanges
+
+def rsByteLengthFor(networkSize: int) -> int:
+    """
+    Returns the rs length (in bytes) for an overlay of about networkSize nodes:
+    RS_BYTE_LENGTH or, for larger overlays, the number of bytes that leaves at least
+    8 bits beyond log2(networkSize), so that few nodes share their whole rs.
+    """
+    return max(RS_BYTE_LENGTH, (max(networkSize, 1).bit_length() + 8 + 7) // 8)
+
+def introductionPlan(v: SkipNodeReference, N: Set[SkipNodeReference],
+                     ranges: Dict[int, Set[SkipNodeReference]]) -> List[Tuple[SkipNodeReference, SkipNodeReference]]:
+    """
+    Returns the introductions a node v with the neighborhood N and the provided ranges
+    makes on timeout, as a list of (w, u) tuples, each meaning w.linearise(u).
+    """
+    # Introducing v to all of its neighbors - not mentioned on the slides.
+    # Still seems to be necessary in order to guarantee strong connectedness.
+    plan = [(n, v) for n in N]
+
+    # See Chapter 5, Slide 169 f.
+    for i in ranges:
+        # partition neighborhood of level i by left and right nodes
+        levelNeighborhood = filterByPrefix(i, v, ranges[i])
+        leftNodes = []
+        rightNodes = []
+        for x in levelNeighborhood:
+            if x < v:
+                leftNodes.append(x)
+            if x > v:
+                rightNodes.append(x)
+
+        # introduce nodes as shown below
+        # leftNodes: v1 -> v2 -> ... -> v
+        # rightNodes: v <- ... <- v(n-1) <- vn
+
+        leftNodes.sort()
+        rightNodes.sort(reverse=True)
+
+        # Part a: Linearizing
+        for r in (leftNodes, rightNodes):
+            for j in range(len(r)-1):
+                plan.append((r[j], r[j+1]))
+            if len(r) > 0:
+                # introduce closest node to v
+                plan.append((r[-1], v))
+
+        # Part b: Bridging (as on slide 170)
+        # - left nodes to closest right node
+        # - right nodes to closest left node
+
+        for side1, side2 in ((leftNodes, rightNodes), (rightNodes, leftNodes)):
+            if len(side2) > 0:
+                closestRange2Node = side2[-1] # last node in right resp. left nodes
+                for w in side1:
+                    if closestRange2Node in skipRange(i, w, N):
+                        # v thinks that closestRange2Node is in w's range
+                        plan.append((w, closestRange2Node))
+    return plan
+
+def idealNeighborhoods(references: Iterable[SkipNodeReference]) -> Dict[SkipNodeReference, Set[SkipNodeReference]]:
+    """
+    Computes the neighborhood each of the provided nodes has in the ideal Skip+ topology
+    of exactly these nodes, i.e. the nodes in its ranges (see computeRanges).
+    Instead of computing each node's ranges from all n nodes, the nodes sharing a prefix
+    are walked in the order of their ids once per level, up to the first level where
+    all nodes are alone, which takes O(n log n) time.
+    Returns a dict mapping each reference to its neighborhood.
+    """
+    nodes = sorted(references)
+    neighborhoods = dict((v, set()) for v in nodes)
+    i = 0
+    while True:
+        groups = {}
+        for v in nodes:
+            if len(v.rs) >= i:
+                groups.setdefault(prefix(i, v).to01(), []).append(v)
+        # only nodes that have a level i and are not alone at it have ranges
+        groups = [group for group in groups.values() if len(group) > 1 and any(i < len(v.rs)-1 for v in group)]
+        if len(groups) == 0:
+            return neighborhoods
+        for group in groups:
+            _addLevelRanges(i, group, neighborhoods)
+        i += 1
+
+def _addLevelRanges(i: int, group: List[SkipNodeReference], neighborhoods: Dict[SkipNodeReference, Set[SkipNodeReference]]) -> None:
+    """
+    Adds range(i, v, group) to the neighborhood of each node v of group,
+    the ascending list of the nodes sharing prefix(i, v).
+    """
+    # the indices of low(i, v, group) and high(i, v, group), lowest and highest being the group's ends
+    # (nodes whose rs ends after i bits are in the ranges, but not at a level of the next one)
+    lowIndices = []
+    levelPreds = [None, None] # the indices of the latest nodes whose i-th bit is 0 resp. 1
+    for index, v in enumerate(group):
+        lowIndices.append(0 if None in levelPreds else min(levelPreds))
+        if i < len(v.rs):
+            levelPreds[v.rs[i]] = index
+    highIndices = [0] * len(group)
+    levelSuccs = [None, None]
+    for index in range(len(group)-1, -1, -1):
+        highIndices[index] = len(group)-1 if None in levelSuccs else max(levelSuccs)
+        if i < len(group[index].rs):
+            levelSuccs[group[index].rs[i]] = index
+    for index, v in enumerate(group):
+        if i < len(v.rs)-1:
+            neighborhoods[v].update(group[lowIndices[index]:index])
+            neighborhoods[v].update(group[index+1:highIndices[index]+1])
+
 class SkipNode(Node):
+    """
+    A node of the Skip+ overlay network.
+    If offloadComputation is True, the node computes its ranges and the
+    introductions it makes on timeout in the reactor's thread pool, working
+    on snapshots of its neighborhood, and applies the results in the reactor
+    thread. This keeps large neighborhoods from delaying the node's network I/O.
+    If vectorized is True, ranges are computed by the NumPy kernel in
+    skiphash.vectorized (needs numpy) instead of comparing references one at a time,
+    keeping the arrays of the neighborhood between the computations (see RangeComputer).
+    rsByteLength is the length of the node's rs. It limits the number of levels, so
+    larger overlays need longer ones (see rsByteLengthFor). Nodes with different
+    lengths may be mixed, a node just being alone at the levels beyond its rs.
+    Only the levels up to the first one where the node is alone are considered.
+    """
     
-    def __init__(self, port: int):
-        super(SkipNode, self).__init__(port)
-        self._rs = CopyableBitArray(randomBitArray(RS_BYTE_LENGTH)) # random bitstring
+    def __init__(self, port: int, offloadComputation: bool = False, vectorized: bool = False,
+                 networkConfig: NetworkConfig = None, rsByteLength: int = RS_BYTE_LENGTH):
+        super(SkipNode, self).__init__(port, networkConfig=networkConfig)
+        self._rs = CopyableBitArray(randomBitArray(rsByteLength)) # random bitstring
         # the self.reference object will serve as the node's id
         # replacing the super constructor's NodeReference by a SkipNodeReference
         self.reference = SkipNodeReference(self.reference.host, port, self._rs)
         self.N = set() # outgoing neighborhood
 
-        # range for each level i < RS_BIT_LENGTH - 1
-        self.ranges = dict((i, set()) for i in range(RS_BIT_LENGTH-1)) 
+        # range for each level i < len(rs) - 1 at which the node is not alone
+        self.ranges = {}
 
         # a set of all nodes (SkipNodeReferences) that are currently
         # in at least one of this node's ranges
         self.nodesInRanges = set()
+
+        self.offloadComputation = offloadComputation
+        if vectorized:
+            from skiphash import vectorized as vectorizedComputations
+            self._computeRanges = vectorizedComputations.RangeComputer()
+        else:
+            self._computeRanges = computeRanges
+        self._rangeComputation = None # the deferred of a range computation running in a thread
+        self._timeoutComputation = None # the deferred of a timeout computation running in a thread
+
+        # the ids of nodes that have left (or moved) and the (monotonic) time they have been
+        # forgotten or last probed at, so that they are not re-added to N
+        self._forgottenIds = OrderedDict()
+        self._probedIds = set() # the forgotten ids being probed
+        self._lastCheckedId = -1 # the id of the neighbor probed on the last timeout (see _checkNextNeighbor)
     
+    @priority(PRIORITY_MAINTENANCE)
     @remoteMethod
     def getRs(self):
         """
@@ -173,82 +364,276 @@ class SkipNode(Node):
     @property
     def rs(self):
         return self._rs
+
+    def snapshotState(self) -> dict:
+        state = super(SkipNode, self).snapshotState()
+        # ranges are stored as indices into N
+        neighbors = sorted(self.N)
+        neighborIndices = dict((n, index) for index, n in enumerate(neighbors))
+        state["rs"] = self.rs.to01()
+        if self.reference.explicitId is not None:
+            state["id"] = self.reference.explicitId
+        state["N"] = [referenceToSnapshot(n) for n in neighbors]
+        state["ranges"] = [sorted(neighborIndices[n] for n in self.ranges[i] if n in neighborIndices)
+                            for i in range(len(self.ranges))]
+        return state
+
+    def restoreSnapshotState(self, state: dict) -> None:
+        """
+        Restores the node's random bit string and neighborhood.
+        The ranges are recomputed from the neighborhood.
+        """
+        super(SkipNode, self).restoreSnapshotState(state)
+        self._rs = CopyableBitArray(state["rs"])
+        self.reference = SkipNodeReference(self.host, self.port, self._rs, state.get("id"))
+        self.N = set(referenceFromSnapshot(n) for n in state["N"])
+        self.updateRanges()
     
     # "Build-Skip" methods
     
     def updateRanges(self):
-        nodesInRanges = set()
-        for i in range(RS_BIT_LENGTH-1):
-            currentLevelRange = skipRange(i, self.reference, self.N)
-            self.ranges[i] = currentLevelRange
-            nodesInRanges.union(currentLevelRange)
-        self.nodesInRanges = nodesInRanges
+        self.ranges, self.nodesInRanges = self._computeRanges(self.reference, self.N)
     
     def timeout(self):
-        # Introducing this node to all of our neighbors - not mentioned on the slides.
-        # Still seems to be necessary in order to guarantee strong connectedness.
-        for n in self.N:
-            n.linearise(self.reference)
-
-        # See Chapter 5, Slide 169 f.
-        for i in range(RS_BIT_LENGTH-1):
-            # partition neighborhood of level i by left and right nodes
-            levelNeighborhood = filterByPrefix(i, self.reference, self.ranges[i])
-            leftNodes = []
-            rightNodes = []
-            for x in levelNeighborhood:
-                if x < self.reference:
-                    leftNodes.append(x)
-                if x > self.reference:
-                    rightNodes.append(x)
-
-            # introduce nodes as shown below
-            # leftNodes: v1 -> v2 -> ... -> self
-            # rightNodes: self <- ... <- v(n-1) <- vn
-
-            leftNodes.sort()
-            rightNodes.sort(reverse=True)
-
-            # Part a: Linearizing
-            for r in (leftNodes, rightNodes):
-                for i in range(len(r)-1):
-                    r[i].linearise(r[i+1])
-                if len(r) > 0:
-                    # introduce closest node to self
-                    r[-1].linearise(self.reference)
-        
-            # Part b: Bridging (as on slide 170)
-            # - left nodes to closest right node
-            # - right nodes to closest left node
-
-            for side1, side2 in ((leftNodes, rightNodes), (rightNodes, leftNodes)):
-                if len(side2) > 0:
-                    closestRange2Node = side2[-1] # last node in right resp. left nodes
-                    for v in side1:
-                        if closestRange2Node in skipRange(i, v, self.N):
-                            # this node thinks that closestRange2Node is in v's range
-                            v.linearise(closestRange2Node)
+        self._checkNextNeighbor()
+        if not self.offloadComputation:
+            self._introduce(introductionPlan(self.reference, self.N, self.ranges))
+        elif self._timeoutComputation is None:
+            # the previous computation may still be running on a busy thread pool
+            self._timeoutComputation = threads.deferToThread(self._computeTimeout, frozenset(self.N))
+            self._timeoutComputation.addCallback(self._introduce)
+            self._timeoutComputation.addErrback(self._failedComputation, "timeout")
+            self._timeoutComputation.addBoth(self._timeoutComputationDone)
+
+    def _computeTimeout(self, N: Set[SkipNodeReference]) -> List[Tuple[SkipNodeReference, SkipNodeReference]]:
+        """Runs in a worker thread."""
+        ranges, _ = self._computeRanges(self.reference, N)
+        return introductionPlan(self.reference, N, ranges)
+
+    def _timeoutComputationDone(self, _):
+        self._timeoutComputation = None
+
+    def _introduce(self, plan: List[Tuple[SkipNodeReference, SkipNodeReference]]) -> None:
+        for w, u in plan:
+            w.linearise(u)
+
+    def _failedComputation(self, reason, computationName: str) -> None:
+        logger.error("%s: The %s computation failed: %s", self, computationName, reason.getErrorMessage())
     
+    def changeId(self, nodeId: int) -> None:
+        """
+        Assigns the node a new id, i.e. a new position in the overlay, keeping its
+        neighborhood for rejoining. The neighbors should be told to forget the node's
+        former reference beforehand. Nodes having it as a neighbor without being told
+        replace the former reference once they probe it (see _checkNextNeighbor).
+        The node's factory has to be informed as well (see NodeFactory.reindexNode).
+        """
+        self.reference = SkipNodeReference(self.host, self.port, self._rs, nodeId)
+        self.updateRanges()
+
+    @priority(PRIORITY_MAINTENANCE)
+    @remoteMethod
+    def forget(self, u: SkipNodeReference):
+        """
+        Removes u from the neighborhood, as the node it references has left or moved.
+        Introductions of u (e.g. by neighbors that have not been told yet) are ignored
+        for FORGET_GRACE_PERIOD seconds. After that, u is probed when it is introduced,
+        and only re-added if a node answers under u's id, e.g. after a restart.
+        """
+        self._forgetId(u.id)
+        if u in self.N:
+            self.N.discard(u)
+            self.updateRanges()
+
+    @defer.inlineCallbacks
+    def _checkNextNeighbor(self):
+        """
+        Probes the neighbor following the one probed on the previous timeout, in the order
+        of their ids, and replaces it by its current reference if it answers under another id,
+        i.e. if it has moved (see changeId). A moved node only knows the nodes in its own
+        neighborhood, so the other nodes having it as a neighbor learn about its move this way.
+        """
+        if len(self.N) == 0:
+            return
+        following = [w for w in self.N if w.id > self._lastCheckedId]
+        w = min(following) if len(following) > 0 else min(self.N)
+        self._lastCheckedId = w.id
+        reference = yield w.probe()
+        if reference is not None and reference.id != w.id and w in self.N:
+            logger.debug("%s: %s has moved to %s.", self, w, reference)
+            self.forget(w)
+            self.linearise(reference)
+
+    def _forgetId(self, nodeId: int) -> None:
+        self._forgottenIds.pop(nodeId, None)
+        self._forgottenIds[nodeId] = time.monotonic()
+        if len(self._forgottenIds) > MAXIMUM_FORGOTTEN_IDS:
+            self._forgottenIds.popitem(last=False)
+
+    def _isForgotten(self, u: SkipNodeReference) -> bool:
+        """
+        Whether introductions of u are to be ignored (see forget).
+        Once the grace period has passed, u is probed in the background.
+        """
+        forgottenAt = self._forgottenIds.get(u.id)
+        if forgottenAt is None:
+            return False
+        if time.monotonic() - forgottenAt >= FORGET_GRACE_PERIOD and u.id not in self._probedIds:
+            self._probe(u)
+        return True
+
+    @defer.inlineCallbacks
+    def _probe(self, u: SkipNodeReference):
+        """Re-adds the forgotten node u if it answers under its id (see probe)."""
+        self._probedIds.add(u.id)
+        try:
+            reference = yield u.probe()
+        finally:
+            self._probedIds.discard(u.id)
+        if u.id not in self._forgottenIds:
+            return
+        if reference is not None and reference.id == u.id:
+            del self._forgottenIds[u.id]
+            self.linearise(reference)
+        else:
+            # still gone (or moved), so waiting another grace period before probing again
+            self._forgetId(u.id)
+
+    @priority(PRIORITY_MAINTENANCE)
+    @remoteMethod
+    def probe(self):
+        """
+        Returns the node's reference, or None if it is about to leave the overlay.
+        Used for telling whether a forgotten node is back (see forget).
+        """
+        return self.reference
+
+    @priority(PRIORITY_MAINTENANCE)
+    @remoteMethod
+    def findNeighborhood(self, v: SkipNodeReference):
+        """
+        Routes towards v's position in the overlay, each hop moving on to the neighbor
+        whose id is closest to v's id, and returns a (maybe deferred) list of the nodes
+        known by the nodes on the way, for v to choose its neighbors from (see join).
+        """
+        candidates = set(self.N)
+        candidates.add(self.reference)
+        candidates.discard(v)
+        closest = min(candidates, key=lambda w: abs(w.id - v.id))
+        if closest == self.reference:
+            return list(candidates)
+        deferred = closest.findNeighborhood(v)
+        # if the next hop fails, the nodes known so far have to do
+        deferred.addCallback(lambda found: list(candidates) + (found or []))
+        return deferred
+
+    @priority(PRIORITY_MAINTENANCE)
+    @remoteMethod
+    def getNeighborhood(self) -> List[SkipNodeReference]:
+        """Returns a list of the node's neighbors, including the node itself."""
+        return list(self.N) + [self.reference]
+
+    @defer.inlineCallbacks
+    def join(self, entryNode: SkipNodeReference):
+        """
+        Joins the overlay via entryNode in a few round trips instead of being moved to
+        its place by the Skip+ rules timeout by timeout: the node collects the nodes known
+        on the way from entryNode to its position (see findNeighborhood), computes its ranges
+        and asks the nodes in them for their neighbors, which may be closer to it, until no
+        new nodes enter its ranges (at most MAXIMUM_JOIN_ROUNDS times). Then it adopts
+        the nodes in its ranges as its neighborhood (see setNeighborhood).
+        Returns a deferred that fires when the neighborhood has been set.
+        """
+        found = yield entryNode.findNeighborhood(self.reference)
+        candidates = set(found or [])
+        candidates.add(entryNode)
+        candidates.discard(self.reference)
+        asked = set()
+        for _ in range(MAXIMUM_JOIN_ROUNDS):
+            _, nodesInRanges = self._computeRanges(self.reference, candidates)
+            unasked = nodesInRanges.difference(asked)
+            if len(unasked) == 0:
+                break
+            asked.update(unasked)
+            results = yield defer.gatherResults([defer.maybeDeferred(w.getNeighborhood) for w in unasked])
+            for neighborhood in results:
+                candidates.update(neighborhood or [])
+            candidates.discard(self.reference)
+        yield self.setNeighborhood(candidates)
+
+    def setNeighborhood(self, N: Set[SkipNodeReference], introduce: bool = True):
+        """
+        Replaces the neighborhood by the nodes of N that are in the node's ranges regarding N,
+        e.g. for installing a precomputed or collected neighborhood instead of waiting for
+        the Skip+ rules to build it. If introduce is True, the node is introduced to its new neighbors.
+        """
+        N = set(w for w in N if w != self.reference and not self._isForgotten(w))
+        self.ranges, self.nodesInRanges = self._computeRanges(self.reference, N)
+        # like _applyRanges, keeping all nodes if none of them is in our ranges
+        self.N = set(self.nodesInRanges) if len(self.nodesInRanges) > 0 else N
+        if introduce:
+            for w in self.N:
+                w.linearise(self.reference)
+
+    @priority(PRIORITY_MAINTENANCE)
     @remoteMethod
     def linearise(self, u: SkipNodeReference):
         logger.debug("%s.linearise(%s) is called.", self, u)
+        if self._isForgotten(u):
+            return
         # See Chapter 5, Slide 171
         if u != self.reference and u not in self.N:
             self.N.add(u)
-            self.updateRanges()
-            if len(self.nodesInRanges) == 0:
-                # There are no nodes in our ranges.
-                # Let's better keep our current neighbors instead of destroying the connectedness!
-                pass
-            else:
-                undesirableNodes = self.N.difference(self.nodesInRanges) # nodes that are not in any range now
-                self.N = self.nodesInRanges # only keep the skip+ neighbors in our neighborhood
-                # delegate the undesirable nodes
-                for w in undesirableNodes:
-                    # use the longestCommonPrefixNodes with the minimum id difference (the "closest" ones)
-                    nodes = longestCommonPrefixNodes(w, self.N)
-                    delegationDestination = min(nodes, key=lambda x: abs(x.id - w.id))
-                    delegationDestination.linearise(w)
+            if not self.offloadComputation:
+                self.updateRanges()
+                self._applyRanges(self.ranges, self.nodesInRanges, set(self.N))
+            elif self._rangeComputation is None:
+                self._startRangeComputation()
+
+    def _startRangeComputation(self) -> None:
+        """
+        Computes the ranges for a snapshot of the neighborhood in a worker thread.
+        Nodes added to the neighborhood in the meantime are handled by another
+        computation once this one has been applied.
+        """
+        N = frozenset(self.N)
+        self._rangeComputation = threads.deferToThread(self._computeRanges, self.reference, N)
+        self._rangeComputation.addCallbacks(self._rangesComputed, self._failedRangeComputation, callbackArgs=(N,))
+
+    def _rangesComputed(self, result, N: Set[SkipNodeReference]) -> None:
+        self._rangeComputation = None
+        ranges, nodesInRanges = result
+        self.ranges = ranges
+        self.nodesInRanges = nodesInRanges
+        self._applyRanges(ranges, nodesInRanges, N)
+        if not self.N.issubset(N):
+            # there have been new neighbors in the meantime
+            self._startRangeComputation()
+
+    def _failedRangeComputation(self, reason) -> None:
+        self._rangeComputation = None
+        self._failedComputation(reason, "range")
+
+    def _applyRanges(self, ranges: Dict[int, Set[SkipNodeReference]], nodesInRanges: Set[SkipNodeReference],
+                     N: Set[SkipNodeReference]) -> None:
+        """
+        Reduces the neighborhood to the nodes in the ranges that have been computed for
+        the (maybe former) neighborhood N and delegates the other nodes of N.
+        Neighbors that have been added after N was taken are kept.
+        """
+        if len(nodesInRanges) == 0:
+            # There are no nodes in our ranges.
+            # Let's better keep our current neighbors instead of destroying the connectedness!
+            return
+        undesirableNodes = N.difference(nodesInRanges) # nodes that are not in any range now
+        # only keep the skip+ neighbors (and the nodes that have not been considered yet) in our neighborhood
+        self.N = nodesInRanges.union(self.N.difference(N))
+        # delegate the undesirable nodes
+        for w in undesirableNodes:
+            # use the longestCommonPrefixNodes with the minimum id difference (the "closest" ones)
+            nodes = longestCommonPrefixNodes(w, nodesInRanges)
+            delegationDestination = min(nodes, key=lambda x: abs(x.id - w.id))
+            delegationDestination.linearise(w)
 
 class SkipNodeFactory(NodeFactory):
     """
@@ -257,9 +642,13 @@ class SkipNodeFactory(NodeFactory):
     to the next node that will be created.
     If entryNodeHost and entryNodePort are specified, the specified
     remote node will be introduced to the first node that will be created.
+    If fastJoin is True, new nodes join via SkipNode.join, using the first
+    node (or the entry node) instead of being linearised with the previous node.
     """
-    def __init__(self, startPort: int, entryNodeHost: str = None, entryNodePort: int = None):
-        super(SkipNodeFactory, self).__init__(startPort)
+    def __init__(self, startPort: int, entryNodeHost: str = None, entryNodePort: int = None, nodeOptions: dict = None,
+                 networkConfig: NetworkConfig = None, fastJoin: bool = False):
+        super(SkipNodeFactory, self).__init__(startPort, nodeOptions, networkConfig)
+        self.fastJoin = fastJoin
         self._entryNodeHost = entryNodeHost
         self._entryNodePort = entryNodePort
         self.entryNodeReference = None # if configured, will store the SkipNodeReference, once the rs value has arrived
@@ -272,17 +661,48 @@ class SkipNodeFactory(NodeFactory):
     def _gotEntryNodeRs(self, rs: CopyableBitArray):
         self.entryNodeReference = SkipNodeReference(self._entryNodeHost, self._entryNodePort, rs)
         if len(self.nodes) > 0:
-            self.nodes[0].introduce(self.entryNodeReference)
+            self._connect(self.nodes[0], self.entryNodeReference)
     
     def _failedGettingEntryNodeRs(self, reason: str):
         logger.warn("Failed to get the entry node's random bit string! This host will not be connected to any other host.")
     
+    def newNodes(self, count: int) -> List[SkipNode]:
+        """
+        Creates count nodes and installs the neighborhoods of the ideal Skip+ topology of all
+        local nodes (see idealNeighborhoods) right away, so the nodes do not have to build it
+        timeout by timeout. If there have been local nodes before, the new nodes introduce
+        themselves to their neighbors. Otherwise, the first new node is connected to the entry node.
+        """
+        isFirstBatch = len(self.nodes) == 0
+        nodes = []
+        for _ in range(count):
+            port = self._assignPort()
+            node = self._initNode(port, port == self._startPort)
+            self._registerNode(node)
+            nodes.append(node)
+        neighborhoods = idealNeighborhoods(n.reference for n in self.nodes)
+        for node in nodes:
+            node.setNeighborhood(neighborhoods[node.reference], introduce=not isFirstBatch)
+        if isFirstBatch and len(nodes) > 0 and self.entryNodeReference is not None:
+            self._connect(nodes[0], self.entryNodeReference)
+        return nodes
+
     def _initNode(self, port: int, isFirstNode: bool) -> Node:
-        return SkipNode(port)
+        return SkipNode(port, **self.nodeOptions)
     
     def _postInitNode(self, node: Node, isFirstNode: bool) -> None:
         if isFirstNode:
             if self.entryNodeReference is not None:
-                node.linearise(self.entryNodeReference)
+                self._connect(node, self.entryNodeReference)
+        elif self.fastJoin:
+            # the first node has had the most time to find its neighbors
+            self._connect(node, self.nodes[0].reference)
+        else:
+            self._connect(node, self.nodes[-1].reference)
+
+    def _connect(self, node: SkipNode, entryNode: SkipNodeReference) -> None:
+        """Adds a new node to the overlay, entryNode being a node of the overlay."""
+        if self.fastJoin:
+            node.join(entryNode)
         else:
-            node.linearise(self.nodes[-1].reference)
+            node.linearise(entryNode)
@@ -0,0 +1,143 @@
+# Reading topology snapshots written by NodeFactory.exportSnapshot,
+# either for restoring nodes or for offline analysis.
+
+import json
+import os
+from typing import Dict, Iterator, List
+
+from twisted.internet import defer
+
+from skiphash.core import SNAPSHOT_FORMAT, SNAPSHOT_VERSION, ComparableById, NodeFactory
+from skiphash.skipplus import (SkipNodeReference, highest, lowest, pred,
+                               referenceFromSnapshot, succ)
+
+
+def readSnapshotStates(file) -> Iterator[dict]:
+    """
+    Yields the node states of the snapshot in the text file object `file`, one at a time.
+    They can be passed to NodeFactory.restoreSnapshot.
+    """
+    header = json.loads(file.readline())
+    if header.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError("Not a topology snapshot.")
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError("Unsupported snapshot version: {}".format(header.get("version")))
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+def writeSnapshot(factory: NodeFactory, path: str) -> defer.Deferred:
+    """
+    Exports a snapshot of the factory's nodes into the file at `path`.
+    The file is replaced only when the snapshot is complete.
+    Returns a deferred that fires when the file has been written.
+    """
+    temporaryPath = path + ".tmp"
+    file = open(temporaryPath, "w")
+
+    def done(result):
+        file.close()
+        os.replace(temporaryPath, path)
+        return result
+
+    def failed(reason):
+        file.close()
+        os.remove(temporaryPath)
+        return reason
+
+    deferred = factory.exportSnapshot(file)
+    deferred.addCallbacks(done, failed)
+    return deferred
+
+class NodeSnapshot(ComparableById):
+    """
+    The state of a single node in a snapshot: its `reference`, `rs`, neighborhood `N`
+    and `ranges`, as well as its `pred` and `succ`. For nodes that do not store the latter
+    (skip nodes), they are determined from the neighborhood.
+    Like nodes, instances are compared by their ids.
+    """
+
+    def __init__(self, state: dict):
+        self.reference = referenceFromSnapshot([state["host"], state["port"], state["rs"]] +
+                                                ([state["id"]] if "id" in state else []))
+        neighbors = [referenceFromSnapshot(n) for n in state["N"]]
+        self.N = set(neighbors)
+        self.ranges = dict((i, set(neighbors[index] for index in indices))
+                            for i, indices in enumerate(state["ranges"]))
+        if "pred" in state:
+            self.pred = referenceFromSnapshot(state["pred"])
+            self.succ = referenceFromSnapshot(state["succ"])
+        else:
+            self.pred = pred(self.reference, self.N)
+            self.succ = succ(self.reference, self.N)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return "NodeSnapshot({}:{})".format(self.host, self.port)
+
+    @property
+    def host(self):
+        return self.reference.host
+
+    @property
+    def port(self):
+        return self.reference.port
+
+    @property
+    def id(self):
+        return self.reference.id
+
+    @property
+    def rs(self):
+        return self.reference.rs
+
+class Topology:
+    """
+    An offline model of the nodes in one or more snapshots.
+    Like a NodeFactory, it provides a `nodes` list and getLocalNodeByReference,
+    so it can be rendered by skiphash.render.HeadlessRenderer.
+    """
+
+    def __init__(self, nodes: List[NodeSnapshot] = None):
+        self.nodes = []
+        self.idToNodeMap = {}
+        for node in nodes or []:
+            self.addNode(node)
+
+    def addNode(self, node: NodeSnapshot) -> None:
+        self.nodes.append(node)
+        self.idToNodeMap[node.id] = node
+
+    def getLocalNodeByReference(self, ref: SkipNodeReference):
+        return self.idToNodeMap.get(ref.id, None)
+
+    def inconsistentLinks(self) -> Dict[NodeSnapshot, List[str]]:
+        """
+        Returns a dict mapping nodes whose pred or succ do not match the
+        sorted order of all nodes in the topology to a list of the mismatching
+        attribute names. An empty dict means the linear list has converged.
+        Only meaningful if the topology contains all nodes of the overlay.
+        """
+        result = {}
+        sortedNodes = sorted(self.nodes)
+        for index, node in enumerate(sortedNodes):
+            expectedPred = sortedNodes[index-1].reference if index > 0 else lowest
+            expectedSucc = sortedNodes[index+1].reference if index+1 < len(sortedNodes) else highest
+            mismatches = [name for name, expected in (("pred", expectedPred), ("succ", expectedSucc))
+                            if getattr(node, name) != expected]
+            if len(mismatches) > 0:
+                result[node] = mismatches
+        return result
+
+def loadSnapshot(*files) -> Topology:
+    """
+    Reads the snapshots in the provided text file objects (e.g. one per host)
+    into a single Topology.
+    """
+    topology = Topology()
+    for file in files:
+        for state in readSnapshotStates(file):
+            topology.addNode(NodeSnapshot(state))
+    return topology
@@ -0,0 +1,271 @@
+# Storage backends for the entries of a HashNode's localHashTable.
+# A store is a mutable mapping of keys to entries, so a plain dict works as well.
+
+import json
+import logging
+import mmap
+import os
+import struct
+from collections.abc import MutableMapping
+
+logger = logging.getLogger(__name__)
+
+def encodeEntry(entry) -> bytes:
+    """
+    Encodes a copyable entry (see skiphash.distrhash.Entry) by its copyable state.
+    The state's first element, the key, is left out, as stores index entries by their keys.
+    """
+    return json.dumps(entry.getStateToCopy()[1:], separators=(',', ':'), ensure_ascii=False).encode("utf-8")
+
+def decodeEntry(entryClass, key: str, data: bytes):
+    """
+    Creates an instance of entryClass from its key and the output of encodeEntry,
+    like Twisted's perspective broker does for remote copies.
+    """
+    entry = entryClass.__new__(entryClass)
+    entry.setCopyableState((key,) + tuple(json.loads(data.decode("utf-8"))))
+    return entry
+
+class ArenaStore(MutableMapping):
+    """
+    An in-memory store that packs all encoded entries into one contiguous
+    bytearray (the arena) instead of keeping an entry object per key.
+    The index maps each key to a single int holding the offset and length of its
+    entry in the arena. Entry objects are only created when entries are read,
+    e.g. for lookups or for transferring them to other nodes.
+    The space of overwritten and deleted entries is reclaimed by compacting
+    the arena once it makes up more than half of it.
+    `entryClass` is the class of the stored entries, e.g. skiphash.distrhash.Entry.
+    """
+
+    MINIMUM_COMPACTION_SIZE = 2**16 # smaller arenas are not compacted
+
+    def __init__(self, entryClass):
+        self.entryClass = entryClass
+        self._arena = bytearray()
+        self._index = {} # key -> offset << 32 | length
+        self._garbageBytes = 0
+
+    def __getitem__(self, key: str):
+        position = self._index[key]
+        offset = position >> 32
+        return decodeEntry(self.entryClass, key, self._arena[offset:offset+(position & 0xffffffff)])
+
+    def __setitem__(self, key: str, entry) -> None:
+        if key in self._index:
+            self._garbageBytes += self._index[key] & 0xffffffff
+        data = encodeEntry(entry)
+        self._index[key] = len(self._arena) << 32 | len(data)
+        self._arena += data
+        self._compactIfNeeded()
+
+    def __delitem__(self, key: str) -> None:
+        self._garbageBytes += self._index.pop(key) & 0xffffffff
+        self._compactIfNeeded()
+
+    def __iter__(self):
+        return iter(list(self._index))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def clear(self) -> None:
+        self._arena = bytearray()
+        self._index = {}
+        self._garbageBytes = 0
+
+    def _compactIfNeeded(self) -> None:
+        if self._garbageBytes > self.MINIMUM_COMPACTION_SIZE and self._garbageBytes > len(self._arena) / 2:
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrites the arena so it only contains the current entries."""
+        arena = bytearray()
+        for key, position in self._index.items():
+            offset = position >> 32
+            length = position & 0xffffffff
+            self._index[key] = len(arena) << 32 | length
+            arena += self._arena[offset:offset+length]
+        self._arena = arena
+        self._garbageBytes = 0
+
+class LogStore(MutableMapping):
+    """
+    A persistent store that appends each insertion and deletion to a log file
+    and reads entries from a memory-mapped view of that file.
+    Only an index of the keys and the log positions of their entries is kept in memory.
+    When opening an existing log, the index is recovered from it.
+    `entryClass` is the class of the stored entries, e.g. skiphash.distrhash.Entry.
+    If `sync` is True, each write is flushed to disk (fsync) before returning.
+    The current entries can be marked (see mark), e.g. once they have been handed over
+    to another node. `markedKeys` are the keys whose entries have not been written since.
+    """
+
+    MAGIC = b"SKIPHASHLOG1"
+    HEADER = struct.Struct(">BII") # operation, key length, entry length
+    PUT = 1
+    DELETE = 2
+    MARK = 3
+
+    def __init__(self, path: str, entryClass, sync: bool = False):
+        self.path = path
+        self.entryClass = entryClass
+        self.sync = sync
+        self._index = {} # key -> (entry offset, entry length)
+        self._garbageBytes = 0 # bytes of records that have been overwritten or deleted
+        self.markedKeys = set()
+        self._map = None
+        self._file = open(path, "a+b")
+        self._recover()
+        if self._garbageBytes > self._size / 2:
+            self.compact()
+
+    def _recover(self) -> None:
+        """Rebuilds the index from the log, truncating an incomplete last record."""
+        self._file.seek(0)
+        data = self._file.read()
+        if len(data) == 0:
+            self._file.write(self.MAGIC)
+            self._file.flush()
+            self._size = len(self.MAGIC)
+            return
+        if not data.startswith(self.MAGIC):
+            raise ValueError("{} is not a skiphash log file.".format(self.path))
+
+        offset = len(self.MAGIC)
+        while offset + self.HEADER.size <= len(data):
+            operation, keyLength, entryLength = self.HEADER.unpack_from(data, offset)
+            keyOffset = offset + self.HEADER.size
+            entryOffset = keyOffset + keyLength
+            end = entryOffset + entryLength
+            if end > len(data):
+                break
+            key = data[keyOffset:entryOffset].decode("utf-8")
+            if operation == self.MARK:
+                self.markedKeys = set(self._index)
+                offset = end
+                continue
+            if key in self._index:
+                self._garbageBytes += self._recordLength(key)
+            if operation == self.PUT:
+                self._index[key] = (entryOffset, entryLength)
+            else:
+                self._index.pop(key, None)
+                self._garbageBytes += end - offset
+            self.markedKeys.discard(key)
+            offset = end
+
+        if offset < len(data):
+            logger.warning("%s: Truncating an incomplete record at the end of the log.", self.path)
+            self._file.truncate(offset)
+        self._size = offset
+        logger.info("%s: Recovered %d entries.", self.path, len(self._index))
+
+    def _recordLength(self, key: str) -> int:
+        return self.HEADER.size + len(key.encode("utf-8")) + self._index[key][1]
+
+    def _append(self, operation: int, key: str, data: bytes = b"") -> int:
+        """Appends a record to the log and returns the offset of its data."""
+        keyBytes = key.encode("utf-8")
+        self._file.seek(self._size)
+        self._file.write(self.HEADER.pack(operation, len(keyBytes), len(data)) + keyBytes + data)
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+        dataOffset = self._size + self.HEADER.size + len(keyBytes)
+        self._size = dataOffset + len(data)
+        return dataOffset
+
+    def _read(self, offset: int, length: int) -> bytes:
+        if self._map is None or offset + length > len(self._map):
+            # the log has grown since it has been mapped
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset+length]
+
+    def __getitem__(self, key: str):
+        offset, length = self._index[key]
+        return decodeEntry(self.entryClass, key, self._read(offset, length))
+
+    def __setitem__(self, key: str, entry) -> None:
+        if key in self._index:
+            self._garbageBytes += self._recordLength(key)
+        data = encodeEntry(entry)
+        self._index[key] = (self._append(self.PUT, key, data), len(data))
+        self.markedKeys.discard(key)
+
+    def __delitem__(self, key: str) -> None:
+        recordLength = self._recordLength(key) # raises a KeyError for unknown keys
+        self._append(self.DELETE, key)
+        del self._index[key]
+        self.markedKeys.discard(key)
+        self._garbageBytes += recordLength + self.HEADER.size + len(key.encode("utf-8"))
+
+    def mark(self) -> None:
+        """Marks the current entries, so they are in markedKeys, also after reopening the log."""
+        self._append(self.MARK, "")
+        self.markedKeys = set(self._index)
+
+    def __iter__(self):
+        return iter(list(self._index))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key) -> bool:
+        return key in self._index
+
+    def clear(self) -> None:
+        """Removes all entries by truncating the log."""
+        self._closeMap()
+        self._file.truncate(len(self.MAGIC))
+        self._file.flush()
+        self._size = len(self.MAGIC)
+        self._index = {}
+        self.markedKeys = set()
+        self._garbageBytes = 0
+
+    def compact(self) -> None:
+        """Rewrites the log so it only contains the current entries (and their mark)."""
+        temporaryPath = self.path + ".compact"
+        with open(temporaryPath, "wb") as file:
+            file.write(self.MAGIC)
+            newIndex = {}
+            offset = len(self.MAGIC)
+            # the marked entries are written before the mark, the other ones after it
+            markedKeys = [key for key in self._index if key in self.markedKeys]
+            unmarkedKeys = [key for key in self._index if key not in self.markedKeys]
+            for keys in (markedKeys, unmarkedKeys):
+                for key in keys:
+                    entryOffset, entryLength = self._index[key]
+                    keyBytes = key.encode("utf-8")
+                    file.write(self.HEADER.pack(self.PUT, len(keyBytes), entryLength) + keyBytes)
+                    file.write(self._read(entryOffset, entryLength))
+                    offset += self.HEADER.size + len(keyBytes)
+                    newIndex[key] = (offset, entryLength)
+                    offset += entryLength
+                if keys is markedKeys and len(markedKeys) > 0:
+                    file.write(self.HEADER.pack(self.MARK, 0, 0))
+                    offset += self.HEADER.size
+            file.flush()
+            os.fsync(file.fileno())
+        self._closeMap()
+        self._file.close()
+        os.replace(temporaryPath, self.path)
+        self._file = open(self.path, "a+b")
+        self._index = newIndex
+        self._size = offset
+        self._garbageBytes = 0
+
+    def close(self) -> None:
+        self._closeMap()
+        self._file.close()
+
+    def _closeMap(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
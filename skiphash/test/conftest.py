@@ -0,0 +1,23 @@
+import random
+
+import pytest
+
+from skiphash.core import CopyableBitArray, randomBitArray
+from skiphash.skipplus import (SkipNodeReference, computeRanges,
+                               idealNeighborhoods, referenceToSnapshot)
+from skiphash.snapshot import NodeSnapshot, Topology
+
+
+@pytest.fixture
+def topology():
+    """An offline topology of 64 nodes in the ideal Skip+ topology, to be drawn without running any nodes."""
+    random.seed(42)
+    references = [SkipNodeReference("192.0.2.1", 40000 + i, CopyableBitArray(randomBitArray(2))) for i in range(64)]
+    nodes = []
+    for v, N in idealNeighborhoods(references).items():
+        neighbors = sorted(N)
+        ranges, _ = computeRanges(v, N)
+        nodes.append(NodeSnapshot({"host": v.host, "port": v.port, "rs": v.rs.to01(),
+                                   "N": [referenceToSnapshot(n) for n in neighbors],
+                                   "ranges": [sorted(neighbors.index(n) for n in ranges[i]) for i in range(len(ranges))]}))
+    return Topology(nodes)
@@ -0,0 +1,57 @@
+import pytest_twisted
+
+from skiphash.balancing import LoadBalancer, loadScores
+from skiphash.core import sleep
+from skiphash.distrhash import HashNodeFactory
+from skiphash.skipplus import highest, lowest
+
+
+def test_load_scores():
+    scores = loadScores({"a": {"entries": 30, "requestRate": 0.0},
+                            "b": {"entries": 10, "requestRate": 0.0},
+                            "c": {"entries": 20, "requestRate": 3.0}})
+    assert scores == {"a": 1.5, "b": 0.5, "c": 4.0}
+
+@pytest_twisted.inlineCallbacks
+def test_repositioning():
+    factory = HashNodeFactory(33400)
+
+    for _ in range(5):
+        factory.newNode()
+    
+    yield sleep(5)
+
+    nodes = factory.nodes
+    keys = ["key" + str(i) for i in range(200)]
+    for key in keys:
+        nodes[0].insert(key, "value")
+    
+    yield sleep(2)
+
+    maximumEntries = max(len(n.localHashTable) for n in nodes)
+    assert sum(n.getLoad()["entries"] for n in nodes) == len(keys)
+    # polling the loads does not sort the nodes' entries, only finding a split position does
+    assert all(n._scanIndex is None for n in nodes)
+    result = yield LoadBalancer(factory, threshold=1.01).balance()
+    assert result is not None
+    light, hot = result
+    assert factory.getLocalNodeByReference(light.reference) is light
+
+    yield sleep(6)
+
+    # the moved node has taken over entries of the hot node
+    assert factory.getLocalNodeByReference(hot).localHashTable.keys().isdisjoint(light.localHashTable.keys())
+    assert light.pred == hot
+    assert sum(len(n.localHashTable) for n in nodes) == len(keys)
+    assert max(len(n.localHashTable) for n in nodes) <= maximumEntries
+
+    sortedNodes = sorted(nodes)
+    for index, node in enumerate(sortedNodes):
+        assert node.pred == (sortedNodes[index-1].reference if index > 0 else lowest)
+        assert node.succ == (sortedNodes[index+1].reference if index+1 < len(nodes) else highest)
+
+    for key in keys:
+        result = yield nodes[3].lookup(key)
+        assert result.key == key
+
+    yield factory.shutdown()
@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+import pytest_twisted
+from twisted.python import log
+
+from skiphash.cluster import ProcessPool, distributeNodes
+from skiphash.core import sleep
+
+observer = log.PythonLoggingObserver()
+observer.start()
+
+# pylint: disable=maybe-no-member
+
+def test_distribute_nodes():
+    assert distributeNodes(10, 3, 1000) == [(1000, 4, 1003), (1004, 3, 1006), (1007, 3, None)]
+    assert distributeNodes(2, 3, 1000) == [(1000, 1, 1000), (1001, 1, 1001), (1002, 0, None)]
+    assert distributeNodes(10, 3, 1000, 1019) == [(1000, 4, 1006), (1007, 3, 1013), (1014, 3, 1019)]
+
+@pytest_twisted.inlineCallbacks
+def test_process_pool(caplog):
+    caplog.set_level(logging.WARN, logger='twisted')
+
+    pool = ProcessPool(4, 2, 35000, workerArguments=["--asyncio"])
+    yield pool.start()
+    yield sleep(2)
+
+    status = pool.status()
+    assert status["workers"] == 2
+    assert status["running"] == 2
+    assert status["nodes"] == 4
+
+    exitCodes = yield pool.shutdown()
+    assert exitCodes == [0, 0]
+    assert pool.status()["running"] == 0
+
+@pytest_twisted.inlineCallbacks
+def test_hash_process_pool(caplog):
+    caplog.set_level(logging.WARN, logger='twisted')
+
+    pool = ProcessPool(4, 2, 35100, workerArguments=["--asyncio", "--hash"], lastPort=35109)
+    yield pool.start()
+    yield sleep(2)
+
+    assert pool.status()["nodes"] == 4
+
+    # the workers drain their hash nodes before exiting
+    exitCodes = yield pool.shutdown()
+    assert exitCodes == [0, 0]
@@ -5,11 +5,13 @@ import pytest
 import pytest_twisted
 from pytest_mock import mocker
 from twisted.internet import defer, reactor
-from twisted.internet.address import IPv4Address
+from twisted.internet.address import IPv4Address, UNIXAddress
 from twisted.python import log
 
 from skiphash import thisHost
-from skiphash.core import CopyableBitArray, Node, NodeFactory, NodeReference, randomBitArray, remoteMethod
+from skiphash.core import (PRIORITY_MAINTENANCE, PRIORITY_USER, CallScheduler,
+                           CopyableBitArray, NetworkConfig, Node, NodeFactory,
+                           NodeReference, randomBitArray, remoteMethod, sleep)
 
 observer = log.PythonLoggingObserver()
 observer.start()
@@ -93,3 +95,94 @@ def test_bytearray_copying(caplog, mocker, nodes):
     # implicitly call n2.test remotely via its NodeReference object
     returnValue = yield n.reference.test()
     assert returnValue == bitArray
+
+class AsyncNode(Node):
+
+    @remoteMethod
+    async def echoLater(self, value):
+        await sleep(0.1)
+        return value
+
+@pytest_twisted.inlineCallbacks
+def test_coroutine_remote_method(caplog):
+    caplog.set_level(logging.DEBUG, logger='twisted')
+
+    n = AsyncNode(30010)
+
+    # the local call returns a deferred
+    returnValue = yield n.echoLater("local")
+    assert returnValue == "local"
+
+    # remote call via the node's NodeReference object
+    returnValue = yield n.reference.echoLater("remote")
+    assert returnValue == "remote"
+
+    yield n.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_network_config(monkeypatch, tmpdir):
+    monkeypatch.setattr(NodeReference, "unixSocketDirectory", None)
+    config = NetworkConfig(bindAddress="127.0.0.1", advertisedHost="127.0.0.1", lastPort=30021,
+                            unixSocketDirectory=str(tmpdir))
+    factory = NodeFactory(30020, networkConfig=config)
+    n1 = factory.newNode()
+    n2 = factory.newNode()
+    with pytest.raises(RuntimeError):
+        factory.newNode()
+
+    assert n1.host == "127.0.0.1"
+    assert NodeReference.unixSocketDirectory == str(tmpdir)
+
+    # the nodes are connected via their unix sockets
+    remote = yield NodeReference("127.0.0.1", n2.port).remote
+    assert isinstance(remote.broker.transport.getPeer(), UNIXAddress)
+    remote = yield NodeReference("127.0.0.1", n1.port).remote
+    assert isinstance(remote.broker.transport.getPeer(), UNIXAddress)
+
+    yield factory.shutdown()
+
+def test_this_host(monkeypatch):
+    import skiphash
+    monkeypatch.setattr(skiphash, "_thisHost", None)
+    monkeypatch.setenv(skiphash.HOST_ENVIRONMENT_VARIABLE, "192.0.2.7")
+    assert skiphash.getThisHost() == "192.0.2.7"
+    assert skiphash.thisHost == "192.0.2.7"
+
+    skiphash.setThisHost("192.0.2.8")
+    assert skiphash.getThisHost() == "192.0.2.8"
+
+class Connection:
+    """Stands in for the broker of a connection."""
+
+@pytest_twisted.inlineCallbacks
+def test_call_scheduler(caplog):
+    scheduler = CallScheduler(weights={PRIORITY_USER: 2, PRIORITY_MAINTENANCE: 1}, rateLimits={"linearise": (1, 3)})
+    order = []
+    def call(kind, i):
+        order.append((kind, i))
+        return i
+
+    deferreds = [scheduler.schedule(lambda i=i: call("maintenance", i), PRIORITY_MAINTENANCE) for i in range(4)]
+    deferreds += [scheduler.schedule(lambda i=i: call("user", i), PRIORITY_USER) for i in range(4)]
+    results = yield defer.gatherResults(deferreds)
+    assert results == [0, 1, 2, 3] * 2
+    # the user calls are preferred 2:1 over the maintenance calls that were queued before them
+    assert order == [("user", 0), ("user", 1), ("maintenance", 0), ("user", 2), ("user", 3),
+                     ("maintenance", 1), ("maintenance", 2), ("maintenance", 3)]
+
+    connection = Connection()
+    results = yield defer.gatherResults([scheduler.schedule(lambda: True, PRIORITY_MAINTENANCE, "linearise", connection)
+                                            for _ in range(5)])
+    assert results == [True] * 3 + [None] * 2
+    assert scheduler.droppedCalls == 2
+    # other connections have their own limits
+    result = yield scheduler.schedule(lambda: True, PRIORITY_MAINTENANCE, "linearise", Connection())
+    assert result is True
+    # the first dropped call is logged
+    assert len([record for record in caplog.records if "rate limit" in record.getMessage()]) == 1
+    # the nodes sharing a connection have their own limits, too
+    node = NodeReference("127.0.0.1", 30000)
+    results = yield defer.gatherResults([scheduler.schedule(lambda: True, PRIORITY_MAINTENANCE, "linearise", connection, node)
+                                            for _ in range(4)])
+    assert results == [True] * 3 + [None]
+    assert scheduler.droppedCalls == 3
@@ -8,13 +8,32 @@ from twisted.internet import defer, reactor
 from twisted.python import log
 
 from skiphash.core import sleep
-from skiphash.distrhash import HashNode, HashNodeFactory
+from skiphash.distrhash import Entry, HashNode, HashNodeFactory, unitKeyHash
+from skiphash.placement import PrefixPlacement
+from skiphash.storage import LogStore
 
 observer = log.PythonLoggingObserver()
 observer.start()
 
 # pylint: disable=maybe-no-member
 
+@defer.inlineCallbacks
+def converged(nodes, timeout: float = 20):
+    """
+    Waits until the nodes' predecessors and successors form the sorted list
+    and every entry is stored by the node responsible for it.
+    """
+    deadline = time.time() + timeout
+    while True:
+        sortedNodes = sorted(nodes)
+        linked = all(v.succ == w.reference and w.pred == v.reference for v, w in zip(sortedNodes, sortedNodes[1:]))
+        placed = all(node._nextHop(node.placement.position(key)) is None
+                     for node in nodes for key in node.localHashTable.keys())
+        if linked and placed:
+            return
+        assert time.time() < deadline, "The overlay has not converged."
+        yield sleep(0.2)
+
 @pytest_twisted.inlineCallbacks
 def test_operations(caplog, mocker):
     caplog.set_level(logging.DEBUG, logger='vaud.core')
@@ -51,3 +70,479 @@ def test_operations(caplog, mocker):
         assert result == None
 
     yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_scan(mocker):
+    factory = HashNodeFactory(33100)
+
+    for _ in range(4):
+        factory.newNode()
+    
+    yield sleep(4)
+
+    nodes = factory.nodes
+    keys = ["key" + str(i) for i in range(50)]
+    for key in keys:
+        nodes[0].insert(key, "value")
+    
+    yield sleep(2)
+
+    pages = []
+    def collect(entries):
+        pages.append(entries)
+        return sleep(0.01) # the next page waits for this
+
+    count = yield nodes[1].scan(collect, pageSize=7)
+    scannedKeys = [e.key for page in pages for e in page]
+    assert count == 50
+    assert max(len(page) for page in pages) <= 7
+    assert scannedKeys == sorted(keys, key=unitKeyHash)
+
+    # the first pages of the following nodes are requested while the first node's pages are passed
+    spies = [mocker.spy(node, "_getScanIndex") for node in nodes]
+    requestedNodes = []
+    def countRequestedNodes(entries):
+        requestedNodes.append(sum(1 for spy in spies if spy.call_count > 0))
+        return sleep(0.1)
+    yield nodes[1].scan(countRequestedNodes, pageSize=7)
+    assert requestedNodes[1] == len(nodes)
+    mocker.stopall()
+
+    pages = []
+    count = yield nodes[2].scan(pages.append, 0.25, 0.75)
+    assert sorted(e.key for page in pages for e in page) == sorted(k for k in keys if 0.25 <= unitKeyHash(k) < 0.75)
+
+    # the scan indexes built by the scans are updated by later writes
+    nodes[0].remove(keys[0])
+    nodes[0].insert("key50", "value")
+    yield sleep(1)
+    for node in nodes:
+        assert node._scanIndex == sorted((unitKeyHash(k), k) for k in node.localHashTable.keys())
+    pages = []
+    count = yield nodes[3].scan(pages.extend)
+    assert [e.key for e in pages] == sorted(keys[1:] + ["key50"], key=unitKeyHash)
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_prefix_scan():
+    keys = ["{}/{:03d}".format(series, i) for series in ("cpu", "disk", "mem") for i in range(20)]
+    placement = PrefixPlacement.fromSample(keys, segments=8)
+    factory = HashNodeFactory(33200, nodeOptions={"placement": placement})
+
+    for _ in range(4):
+        factory.newNode()
+    
+    yield sleep(4)
+
+    nodes = factory.nodes
+    for key in keys:
+        nodes[0].insert(key, "value")
+    
+    yield sleep(2)
+
+    # with a monotone placement, the entries are stored in key order
+    pages = []
+    count = yield nodes[1].scan(pages.append, pageSize=6)
+    assert count == len(keys)
+    assert [e.key for page in pages for e in page] == keys
+
+    pages = []
+    count = yield nodes[2].prefixScan("disk/", pages.append)
+    assert count == 20
+    assert [e.key for page in pages for e in page] == [k for k in keys if k.startswith("disk/")]
+
+    result = yield nodes[3].lookup("mem/007")
+    assert result.key == "mem/007"
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_drain():
+    factory = HashNodeFactory(33300)
+
+    for _ in range(5):
+        factory.newNode()
+    
+    yield sleep(5)
+
+    keys = ["key" + str(i) for i in range(200)]
+    for key in keys:
+        factory.nodes[0].insert(key, "value")
+    
+    yield sleep(2)
+
+    # the lowest node hands its entries to its successor, the others to their predecessors
+    leaving = [min(factory.nodes), sorted(factory.nodes)[2]]
+    for node in leaving:
+        assert len(node.localHashTable) > 0
+        shutdown = factory.shutdownNode(node)
+        # entries written while draining are transferred as well
+        factory.nodes[0].insert("late" + str(node.port), "value")
+        keys.append("late" + str(node.port))
+        yield shutdown
+        assert len(node.localHashTable) == 0
+
+    for node in factory.nodes:
+        assert not any(n.port in (l.port for l in leaving) for n in node.N)
+    assert sum(len(node.localHashTable) for node in factory.nodes) == len(keys)
+    for key in keys:
+        result = yield factory.nodes[-1].lookup(key)
+        assert result.key == key
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_restart():
+    factory = HashNodeFactory(34300)
+
+    for _ in range(5):
+        factory.newNode()
+    
+    yield sleep(5)
+
+    keys = ["key" + str(i) for i in range(100)]
+    for key in keys:
+        factory.nodes[0].insert(key, "value")
+    
+    yield sleep(1)
+
+    # a drained node that is restarted on the same port rejoins its former neighbors
+    node = sorted(factory.nodes)[2]
+    yield factory.shutdownNode(node)
+    restartedFactory = HashNodeFactory(node.port, factory.nodes[0].host, factory.nodes[0].port)
+    restarted = restartedFactory.newNode()
+    assert restarted.reference == node.reference
+
+    yield sleep(6)
+
+    sortedNodes = sorted(factory.nodes + [restarted])
+    for v, w in zip(sortedNodes, sortedNodes[1:]):
+        assert v.succ == w.reference and w.pred == v.reference
+    assert len(restarted.localHashTable) > 0
+    for key in keys:
+        result = yield factory.nodes[0].lookup(key)
+        assert result.key == key
+
+    yield restartedFactory.shutdown()
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_restart_from_log(tmpdir):
+    factory = HashNodeFactory(36400, storageDirectory=str(tmpdir))
+
+    for _ in range(5):
+        factory.newNode()
+
+    yield sleep(5)
+
+    keys = ["key" + str(i) for i in range(100)]
+    for key in keys:
+        factory.nodes[0].insert(key, "value")
+
+    yield sleep(1)
+
+    # the log of a drained node is kept
+    node = sorted(factory.nodes)[2]
+    nodeKeys = sorted(node.localHashTable.keys())
+    assert len(nodeKeys) >= 2
+    yield factory.shutdownNode(node)
+    log = LogStore(str(tmpdir.join("node-{}.log".format(node.port))), Entry)
+    assert sorted(log.keys()) == nodeKeys and log.markedKeys == set(nodeKeys)
+    log.close()
+
+    # the entries written and deleted while the node is away are not recovered
+    updatedKey, deletedKey = nodeKeys[:2]
+    factory.nodes[0].insert(updatedKey, "updated")
+    factory.nodes[0].remove(deletedKey)
+    yield sleep(1)
+
+    restartedFactory = HashNodeFactory(node.port, factory.nodes[0].host, factory.nodes[0].port, storageDirectory=str(tmpdir))
+    restarted = restartedFactory.newNode()
+    # before they have been reconciled, the recovered entries are not served
+    result = yield restarted.lookup(nodeKeys[-1])
+    assert result is None or len(restarted._handedOverKeys) == 0
+
+    yield sleep(6)
+
+    assert len(restarted._handedOverKeys) == 0
+    assert deletedKey not in restarted.localHashTable
+    assert restarted.localHashTable[updatedKey].value == "updated"
+    result = yield factory.nodes[0].lookup(updatedKey)
+    assert result.value == "updated"
+    result = yield factory.nodes[0].lookup(deletedKey)
+    assert result is None
+    for key in set(keys) - {updatedKey, deletedKey}:
+        result = yield factory.nodes[0].lookup(key)
+        assert result.value == "value"
+
+    yield restartedFactory.shutdown()
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_fast_join():
+    factory = HashNodeFactory(33500, fastJoin=True)
+
+    for _ in range(4):
+        factory.newNode()
+    
+    yield sleep(5)
+
+    keys = ["key" + str(i) for i in range(100)]
+    for key in keys:
+        factory.nodes[0].insert(key, "value")
+    
+    yield sleep(1)
+
+    node = factory.newNode()
+    yield sleep(0.5)
+
+    # the new node has received the entries of its slice from its predecessor right away
+    sortedNodes = sorted(factory.nodes)
+    index = sortedNodes.index(node)
+    if index > 0:
+        assert node.pred == sortedNodes[index-1].reference
+    assert sum(len(n.localHashTable) for n in factory.nodes) == len(keys)
+    for key in keys:
+        result = yield node.lookup(key)
+        assert result.key == key
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_coalesced_lookups(mocker):
+    factory = HashNodeFactory(33600)
+
+    for _ in range(4):
+        factory.newNode()
+    
+    yield sleep(4)
+
+    factory.nodes[0].insert("key", "value")
+    yield sleep(1)
+
+    owner = next(n for n in factory.nodes if "key" in n.localHashTable)
+    requester = next(n for n in factory.nodes if n is not owner)
+    spy = mocker.spy(owner, "_lookup")
+
+    # concurrent lookups of the same key result in a single request
+    results = yield defer.gatherResults([requester.lookup("key") for _ in range(5)])
+    assert all(result.value == "value" for result in results)
+    assert spy.call_count == 1
+    assert len(requester._inFlightLookups) == 0
+
+    # a write in between is not answered by a lookup that started before it
+    first = requester.lookup("key")
+    requester.insert("key", "other")
+    second = yield requester.lookup("key")
+    yield first
+    assert second.value == "other"
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_direct_reply(mocker):
+    factory = HashNodeFactory(33700, nodeOptions={"directReply": True, "replyTimeout": 2})
+
+    for _ in range(6):
+        factory.newNode()
+    
+    yield sleep(5)
+
+    keys = ["key" + str(i) for i in range(30)]
+    for key in keys:
+        factory.nodes[0].insert(key, "value" + key)
+    
+    yield sleep(1)
+    # entries stored by a former owner while the overlay converges are relocated to their owners
+    yield converged(factory.nodes)
+
+    assert sum(len(n.localHashTable) for n in factory.nodes) == len(keys)
+    for node in factory.nodes:
+        routeSpy = mocker.spy(node, "_routeTo")
+        for key in keys:
+            result = yield node.lookup(key)
+            assert result.value == "value" + key
+        # only the lookups of other nodes' keys are routed
+        assert routeSpy.call_count == len(keys) - len(node.localHashTable)
+        assert all(len(n._pendingReplies) == 0 for n in factory.nodes)
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_iterative_search(mocker):
+    factory = HashNodeFactory(33800, nodeOptions={"iterative": True, "hopTimeout": 0.5})
+
+    for _ in range(6):
+        factory.newNode()
+    
+    yield sleep(5)
+
+    keys = ["key" + str(i) for i in range(30)]
+    for key in keys:
+        factory.nodes[0].insert(key, "value" + key)
+    
+    yield sleep(1)
+
+    assert sum(len(n.localHashTable) for n in factory.nodes) == len(keys)
+
+    # a node that stops answering routeSteps is skipped by the other nodes' searches
+    slow = factory.nodes[2]
+    def routeStep(unitKey, count):
+        return defer.Deferred()
+    routeStep.is_remote_method = True
+    slow.routeStep = routeStep
+
+    for node in factory.nodes:
+        if node is slow:
+            continue
+        for key in keys:
+            if key in slow.localHashTable:
+                continue
+            result = yield node.lookup(key)
+            assert result.value == "value" + key
+        assert len(node.ownerCache) > 0
+
+    # non-idempotent operations are executed once, by the responsible node only
+    key = next(key for key in keys if key not in slow.localHashTable)
+    updateSpies = [mocker.spy(node, "_update") for node in factory.nodes]
+    appenders = [node for node in factory.nodes if node is not slow]
+    yield defer.gatherResults([node.append(key, "x") for node in appenders for _ in range(5)])
+    result = yield factory.nodes[0].lookup(key)
+    assert result.value == "value" + key + "x" * (5 * len(appenders))
+    assert sum(spy.call_count for spy in updateSpies) == 5 * len(appenders)
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_buffered_writes(mocker):
+    factory = HashNodeFactory(33900, nodeOptions={"bufferWrites": True, "writeBufferInterval": 0.2,
+                                                  "writeBufferSize": 50})
+
+    for _ in range(4):
+        factory.newNode()
+    
+    yield sleep(4)
+
+    node = factory.nodes[0]
+    spy = mocker.spy(node, "searchBatch")
+    keys = ["key" + str(i) for i in range(120)]
+    for key in keys:
+        node.insert(key, "value" + key)
+    # the writes are sent once writeBufferSize are buffered or writeBufferInterval has passed
+    assert spy.call_count == 2
+    yield sleep(0.5)
+    assert spy.call_count == 3
+    assert sum(len(n.localHashTable) for n in factory.nodes) == len(keys)
+
+    # writes of the same key are executed in order, and lookups flush them first
+    for key in keys[:10]:
+        node.remove(key)
+        node.insert(key, "other")
+        node.remove(key)
+        node.insert(key, "last")
+    for key in keys[:10]:
+        result = yield node.lookup(key)
+        assert result.value == "last"
+    yield sleep(0.5)
+    for key in keys:
+        result = yield factory.nodes[1].lookup(key)
+        assert result.value == ("last" if key in keys[:10] else "value" + key)
+
+    yield factory.shutdown()
+
+    # batches are not searched iteratively
+    with pytest.raises(ValueError):
+        HashNode(33999, bufferWrites=True, iterative=True)
+
+@pytest_twisted.inlineCallbacks
+def test_expiry():
+    factory = HashNodeFactory(34100)
+
+    for _ in range(5):
+        factory.newNode()
+    
+    # the entries must not expire while the overlay converges
+    yield converged(factory.nodes)
+
+    keys = ["key" + str(i) for i in range(40)]
+    for i, key in enumerate(keys):
+        factory.nodes[0].insert(key, "value", ttl=4 if i % 2 == 0 else None)
+    
+    yield sleep(0.5)
+
+    # the expiry times travel with the entries when a node leaves
+    yield factory.shutdownNode(factory.nodes[1])
+    for key in keys:
+        result = yield factory.nodes[0].lookup(key)
+        assert result.value == "value"
+    
+    yield sleep(4)
+
+    # expired entries have been evicted without being looked up
+    remaining = set().union(*(n.localHashTable.keys() for n in factory.nodes))
+    assert remaining == set(keys[1::2])
+    for i, key in enumerate(keys):
+        result = yield factory.nodes[2].lookup(key)
+        assert (result is None) == (i % 2 == 0)
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_atomic_operations():
+    factory = HashNodeFactory(34200)
+
+    for _ in range(4):
+        factory.newNode()
+    
+    yield sleep(4)
+
+    nodes = factory.nodes
+
+    # concurrent increments are not lost
+    results = yield defer.gatherResults([node.increment("counter") for node in nodes for _ in range(25)])
+    assert sorted(results) == list(range(1, 101))
+    result = yield nodes[0].increment("counter", -10)
+    assert result == 90
+    nodes[0].insert("text", "a")
+    yield sleep(0.5)
+    result = yield nodes[1].increment("text")
+    assert result is None
+
+    result = yield nodes[2].append("text", "b")
+    assert result.value == "ab"
+    result = yield nodes[3].getAndSet("text", "c")
+    assert result.value == "ab"
+
+    # a compare-and-set fails if the entry has been written since it was read
+    entry = yield nodes[1].lookup("text")
+    assert entry.value == "c"
+    swapped, current = yield nodes[2].compareAndSet("text", "d", entry.version)
+    assert swapped and current.value == "d" and current.version > entry.version
+    swapped, current = yield nodes[3].compareAndSet("text", "e", entry.version)
+    assert not swapped and current.value == "d"
+    swapped, current = yield nodes[0].compareAndSet("new", "value", 0)
+    assert swapped and current.version > 0
+    swapped, current = yield nodes[1].compareAndSet("new", "other", 0)
+    assert not swapped
+
+    # plain inserts are versioned too, so stale compare-and-sets fail after them
+    stale = yield nodes[3].lookup("new")
+    nodes[2].insert("new", "plain")
+    yield sleep(0.5)
+    entry = yield nodes[3].lookup("new")
+    assert entry.value == "plain" and entry.version > stale.version
+    swapped, current = yield nodes[0].compareAndSet("new", "stale", stale.version)
+    assert not swapped and current.value == "plain"
+
+    # ... and after the key has been deleted and inserted again
+    nodes[1].remove("new")
+    yield sleep(0.5)
+    nodes[1].insert("new", entry.value)
+    yield sleep(0.5)
+    swapped, current = yield nodes[0].compareAndSet("new", "stale", entry.version)
+    assert not swapped and current.value == "plain" and current.version > entry.version
+    swapped, current = yield nodes[0].compareAndSet("new", "swapped", current.version)
+    assert swapped and current.value == "swapped"
+
+    yield factory.shutdown()
@@ -0,0 +1,104 @@
+import pytest
+
+from skiphash.drawing import ElementDrawer
+
+
+class FakeContext:
+    """
+    Stands in for a cairo context: the visible area is given by clip, and
+    the device pixels per unit by scale. Texts are 0.6 by 1 font size per character.
+    Drawing calls do nothing.
+    """
+
+    def __init__(self, clip, scale: float = 1.0):
+        self.clip = clip
+        self.scale = scale
+        self.fontSize = 1
+
+    def clip_extents(self):
+        return self.clip
+
+    def user_to_device_distance(self, x, y):
+        return x*self.scale, y*self.scale
+
+    def set_font_size(self, size):
+        self.fontSize = size
+
+    def text_extents(self, text):
+        return 0, -self.fontSize, 0.6*self.fontSize*len(text), self.fontSize, 0, 0
+
+    def __getattr__(self, name):
+        return lambda *args: None
+
+def prepareDrawer(topology, left: float, right: float, scale: float = 1.0) -> ElementDrawer:
+    """Returns a drawer for the topology prepared for the visible area from left to right."""
+    drawer = ElementDrawer(1920, 1080, topology)
+    drawer.prepare(FakeContext((0, 0, 1, 1)))
+    drawer.cr = FakeContext((left, 0, right, drawer.canvasHeight), scale)
+    drawer.calculateLevelOfDetail()
+    drawer.calculateEdgeSpans()
+    return drawer
+
+def test_culled_edges(topology):
+    drawer = prepareDrawer(topology, 0, 1)
+    nodeX = drawer.calculateHorizontalPositionOfNode
+    drawer = prepareDrawer(topology, nodeX(30), nodeX(33))
+    nodes = drawer.analyzer.nodes
+    culled = drawer.calculateNodesWithVisibleEdges(0)
+    assert nodes[31] in culled and nodes[0] not in culled and nodes[-1] not in culled
+
+    # a long edge of a topology that has not converged yet is not culled,
+    # although both of its nodes are outside of the visible area
+    nodes[0].ranges[0].add(nodes[-1].reference)
+    drawer = prepareDrawer(topology, nodeX(30), nodeX(33))
+    assert nodes[0] in drawer.calculateNodesWithVisibleEdges(0)
+    assert nodes[0] not in drawer.calculateNodesWithVisibleEdges(1)
+
+def test_visibility(topology):
+    drawer = prepareDrawer(topology, 100, 200)
+    assert drawer.isVisible(150, 10, 160, 20)
+    assert drawer.isVisible(50, 10, 100, 20) # touching
+    assert drawer.isVisible(0, 10, 1000, 20) # covering
+    assert not drawer.isVisible(0, 10, 99, 20)
+    assert not drawer.isVisible(201, 10, 300, 20)
+    assert not drawer.isVisible(150, -20, 160, -10)
+
+def test_visible_index_range(topology):
+    drawer = prepareDrawer(topology, 0, 1)
+    nodeX = drawer.calculateHorizontalPositionOfNode
+    drawer = prepareDrawer(topology, nodeX(10), nodeX(20))
+    visibleIndices = drawer.calculateVisibleIndexRange()
+    # the neighbors of the visible nodes might be partially visible
+    assert visibleIndices.start in (9, 10) and visibleIndices.stop in (21, 22)
+    assert prepareDrawer(topology, -1000, nodeX(0) - 1000).calculateVisibleIndexRange() == range(0, 0)
+    assert prepareDrawer(topology, -1000, 100000).calculateVisibleIndexRange() == range(64)
+
+def test_level_of_detail(topology):
+    drawer = prepareDrawer(topology, 0, 1, scale=4)
+    assert not drawer.aggregateNodes and drawer.drawRsTexts
+    # the nodes can be told apart, but their texts would be too small
+    drawer = prepareDrawer(topology, 0, 1)
+    assert not drawer.aggregateNodes and not drawer.drawRsTexts
+    # zoomed out, the nodes are too close to each other
+    drawer = prepareDrawer(topology, 0, 1, scale=0.1)
+    assert drawer.aggregateNodes and not drawer.drawRsTexts
+
+def test_clusters(topology):
+    drawer = prepareDrawer(topology, -1000, 100000, scale=0.001)
+    rectangles = []
+    drawer.cr.rectangle = lambda *rectangle: rectangles.append(rectangle)
+    drawer.drawClusters()
+    # all nodes of an rs layer are drawn as a single cluster
+    assert len(rectangles) == len(drawer.analyzer.prefixes)
+    nodeX = drawer.calculateHorizontalPositionOfNode
+    for rsPrefix, (x, _, width, _) in zip(drawer.analyzer.prefixes, rectangles):
+        indices = drawer.analyzer.prefixToIndicesMap[rsPrefix]
+        assert x == pytest.approx(nodeX(indices[0]) - drawer.nodeSize/2.0)
+        assert x + width == pytest.approx(nodeX(indices[-1]) + drawer.nodeSize/2.0)
+
+    # zoomed in further, the clusters are smaller
+    rectangles.clear()
+    drawer = prepareDrawer(topology, -1000, 100000, scale=0.1)
+    drawer.cr.rectangle = lambda *rectangle: rectangles.append(rectangle)
+    drawer.drawClusters()
+    assert len(rectangles) > len(drawer.analyzer.prefixes)
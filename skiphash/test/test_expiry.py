@@ -0,0 +1,25 @@
+import random
+
+from skiphash.expiry import TimingWheel
+
+
+def test_timing_wheel():
+    random.seed(42)
+    # small wheels, so that cascading and postponed deadlines are covered
+    for slotBits, levels in ((6, 4), (2, 3), (3, 1)):
+        wheel = TimingWheel(1000, slotBits=slotBits, levels=levels)
+        deadlines = dict((i, 1000 + random.choice((random.uniform(-5, 10), random.uniform(0, 5000))))
+                         for i in range(1000))
+        for item, deadline in deadlines.items():
+            wheel.add(item, deadline)
+        assert len(wheel) == len(deadlines)
+
+        previous, now = 0, 1000
+        while len(wheel) > 0:
+            now += random.choice((0.5, 1, 1, 7))
+            for item in wheel.advance(now):
+                # items are returned by the first advance after their deadline
+                assert previous - wheel.resolution < deadlines[item] <= now
+                del deadlines[item]
+            previous = now
+        assert len(deadlines) == 0
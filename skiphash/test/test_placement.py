@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from skiphash.placement import HashPlacement, PrefixPlacement
+
+
+@pytest.fixture
+def keys():
+    random.seed(7)
+    # skewed keys, e.g. time series names
+    return ["sensor{}/{:05d}".format(random.randint(0, 3), random.randint(0, 99999)) for _ in range(2000)] + \
+            ["zz" + str(i) for i in range(20)]
+
+def test_prefix_placement_is_monotone(keys):
+    for placement in (PrefixPlacement(), PrefixPlacement.fromSample(keys, segments=16)):
+        positions = [placement.position(k) for k in sorted(keys)]
+        assert positions == sorted(positions)
+        assert all(0.0 <= p < 1.0 for p in positions)
+
+def test_prefix_placement_balances_sample(keys):
+    placement = PrefixPlacement.fromSample(keys, segments=8)
+    # the segments holding the sample are equally sized parts of the key space
+    # and receive about an eighth of the keys each
+    segmentCount = len(placement.boundaries)
+    counts = [0] * segmentCount
+    for key in keys:
+        counts[int(placement.position(key) * segmentCount)] += 1
+    assert max(counts) < 2 * len(keys) / 8
+
+@pytest.mark.parametrize("prefix", ["sensor1", "sensor2/0", "s", "zz", "￿"])
+def test_prefix_range(keys, prefix):
+    placement = PrefixPlacement.fromSample(keys, segments=16)
+    a, b = placement.prefixRange(prefix)
+    for key in keys + [prefix, prefix + "￿"]:
+        if key.startswith(prefix):
+            assert a <= placement.position(key) < b
+    assert HashPlacement().prefixRange(prefix) == (0.0, 1.0)
+
+def test_invalid_boundaries():
+    with pytest.raises(ValueError):
+        PrefixPlacement([b"", b"b", b"a"])
+    with pytest.raises(ValueError):
+        PrefixPlacement([b"a", b"b"])
@@ -0,0 +1,61 @@
+import math
+import os
+import struct
+
+import pytest
+import pytest_twisted
+
+pytest.importorskip("cairo")
+
+from skiphash.core import sleep
+from skiphash.render import HeadlessRenderer
+
+
+def pngSize(path: str):
+    """Returns the width and height of the PNG image at path, read from its header."""
+    with open(path, "rb") as file:
+        header = file.read(24)
+    assert header[:8] == b"\x89PNG\r\n\x1a\n"
+    return struct.unpack(">II", header[16:24])
+
+def test_render_png(topology, tmp_path):
+    renderer = HeadlessRenderer(topology)
+    path = str(tmp_path / "graph.png")
+    renderer.render(path)
+    assert pngSize(path) == renderer.canvasSize()
+
+    renderer.render(path, scale=0.5)
+    assert pngSize(path) == renderer.canvasSize(0.5)
+
+def test_render_svg(topology, tmp_path):
+    renderer = HeadlessRenderer(topology)
+    path = str(tmp_path / "graph.svg")
+    renderer.render(path)
+    with open(path) as file:
+        svg = file.read()
+    width, height = renderer.canvasSize()
+    assert 'width="{}'.format(width) in svg and 'height="{}'.format(height) in svg
+
+    with pytest.raises(ValueError):
+        renderer.render(str(tmp_path / "graph.gif"))
+
+def test_render_tiles(topology, tmp_path):
+    renderer = HeadlessRenderer(topology)
+    width, height = renderer.canvasSize()
+    paths = renderer.renderTiles(str(tmp_path / "tile-{row}-{column}.png"), 500, 400)
+    rows, columns = math.ceil(height / 400), math.ceil(width / 500)
+    assert len(paths) == rows * columns
+    assert paths[0].endswith("tile-0-0.png") and paths[-1].endswith("tile-{}-{}.png".format(rows-1, columns-1))
+    # the tiles at the right and at the bottom get the rest of the rendering
+    assert pngSize(paths[0]) == (500, 400)
+    assert pngSize(paths[-1]) == (width - (columns-1)*500, height - (rows-1)*400)
+
+@pytest_twisted.inlineCallbacks
+def test_snapshots(topology, tmp_path):
+    renderer = HeadlessRenderer(topology)
+    renderer.startSnapshots(str(tmp_path / "graph-{counter}.png"), 0.2)
+    yield sleep(0.5)
+    yield renderer.stopSnapshots()
+    files = sorted(os.listdir(str(tmp_path)))
+    assert files[:2] == ["graph-0.png", "graph-1.png"]
+    assert pngSize(str(tmp_path / "graph-0.png")) == renderer.canvasSize()
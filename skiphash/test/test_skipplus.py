@@ -4,11 +4,13 @@ import time
 import pytest
 import pytest_twisted
 from pytest_mock import mocker
-from twisted.internet import defer, reactor
 from twisted.python import log
 
-from skiphash.core import sleep
-from skiphash.skipplus import SkipNode, SkipNodeFactory, SkipNodeReference
+from skiphash.core import CopyableBitArray, randomBitArray, sleep
+from skiphash.skipplus import (RS_BYTE_LENGTH, SkipNodeFactory,
+                               SkipNodeReference, commonPrefixLength,
+                               computeRanges, idealNeighborhoods,
+                               rsByteLengthFor, succ)
 
 observer = log.PythonLoggingObserver()
 observer.start()
@@ -32,3 +34,164 @@ def test_local_graph(caplog, mocker):
     yield sleep(5)
 
     yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_offloaded_computation():
+    factory = SkipNodeFactory(36000, nodeOptions={"offloadComputation": True})
+
+    for _ in range(10):
+        factory.newNode()
+    
+    yield sleep(10)
+
+    sortedNodes = sorted(factory.nodes)
+    for node, nextNode in zip(sortedNodes, sortedNodes[1:]):
+        assert succ(node.reference, node.N) == nextNode.reference
+    for node in factory.nodes:
+        # ranges computed in a thread equal those computed in the reactor thread
+        if node._rangeComputation is None:
+            assert node.ranges == computeRanges(node.reference, node.N)[0]
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_vectorized_computation():
+    pytest.importorskip("numpy")
+    factory = SkipNodeFactory(36500, nodeOptions={"vectorized": True})
+
+    for _ in range(10):
+        factory.newNode()
+    
+    yield sleep(10)
+
+    sortedNodes = sorted(factory.nodes)
+    for node, nextNode in zip(sortedNodes, sortedNodes[1:]):
+        assert succ(node.reference, node.N) == nextNode.reference
+    for node in factory.nodes:
+        # ranges computed on the kept arrays equal those computed from scratch
+        assert node.ranges == computeRanges(node.reference, node.N)[0]
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_fast_join():
+    factory = SkipNodeFactory(36100)
+
+    for _ in range(16):
+        factory.newNode()
+    
+    yield sleep(8)
+
+    factory.fastJoin = True
+    for _ in range(2):
+        node = factory.newNode()
+        # a few round trips, not timeouts
+        yield sleep(0.5)
+
+        references = set(n.reference for n in factory.nodes)
+        # the joined node's neighbors are those of the ideal Skip+ topology
+        assert node.N == computeRanges(node.reference, references - {node.reference})[1]
+        # and it has been introduced to them
+        for neighbor in node.N:
+            assert node.reference in factory.getLocalNodeByReference(neighbor).N
+
+    yield factory.shutdown()
+
+def test_ideal_neighborhoods():
+    references = [SkipNodeReference("192.0.2.1", port, CopyableBitArray(randomBitArray(RS_BYTE_LENGTH)))
+                    for port in range(40000, 40200)]
+    # nodes with longer random bit strings may join
+    references += [SkipNodeReference("192.0.2.1", port, CopyableBitArray(randomBitArray(3)))
+                    for port in range(40200, 40250)]
+    neighborhoods = idealNeighborhoods(references)
+    for v in references:
+        assert neighborhoods[v] == computeRanges(v, set(references) - {v})[1]
+
+def test_active_levels():
+    references = [SkipNodeReference("192.0.2.1", port, CopyableBitArray(randomBitArray(RS_BYTE_LENGTH)))
+                    for port in range(40000, 40008)]
+    for v in references:
+        N = set(references) - {v}
+        ranges, _ = computeRanges(v, N)
+        # the levels end where v is alone
+        assert len(ranges) == min(max(commonPrefixLength(v.rs, w.rs) for w in N) + 1, len(v.rs) - 1)
+        assert all(len(levelRange) > 0 for levelRange in ranges.values())
+
+    assert computeRanges(references[0], set()) == ({}, set())
+    assert rsByteLengthFor(8) == RS_BYTE_LENGTH
+    assert rsByteLengthFor(2**20) == 4
+
+@pytest_twisted.inlineCallbacks
+def test_new_nodes():
+    factory = SkipNodeFactory(36200)
+    nodes = factory.newNodes(20)
+    references = set(n.reference for n in nodes)
+
+    # the ideal topology is in place right away and is kept by the timeouts
+    for _ in range(2):
+        for node in nodes:
+            assert node.N == computeRanges(node.reference, references - {node.reference})[1]
+        yield sleep(3)
+
+    # later nodes introduce themselves to their ideal neighbors
+    node = factory.newNodes(1)[0]
+    yield sleep(0.5)
+    for neighbor in node.N:
+        assert node.reference in factory.getLocalNodeByReference(neighbor).N
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_forget(mocker):
+    mocker.patch("skiphash.skipplus.FORGET_GRACE_PERIOD", 0.5)
+    factory = SkipNodeFactory(36300)
+    a, b = factory.newNode(), factory.newNode()
+
+    yield sleep(1)
+    assert a.reference in b.N
+
+    # introductions of a forgotten node are ignored during the grace period
+    b.forget(a.reference)
+    assert a.reference not in b.N
+    b.linearise(a.reference)
+    assert a.reference not in b.N
+
+    # then the node is probed and re-added, as it still answers under its id
+    yield sleep(0.6)
+    b.linearise(a.reference)
+    yield sleep(0.5)
+    assert a.reference in b.N
+
+    # a node that has moved is not re-added under its former id
+    former = a.reference
+    b.forget(former)
+    a.changeId(former.id + 1)
+    yield sleep(0.6)
+    b.linearise(former)
+    yield sleep(0.5)
+    assert former not in b.N
+    assert former.id in b._forgottenIds
+
+    yield factory.shutdown()
+
+@pytest_twisted.inlineCallbacks
+def test_moved_neighbor():
+    factory = SkipNodeFactory(36600)
+    nodes = [factory.newNode() for _ in range(4)]
+
+    yield sleep(3)
+    a = nodes[0]
+    holders = [node for node in nodes[1:] if a.reference in node.N]
+    assert len(holders) > 0
+
+    # none of the nodes is told to forget the former reference,
+    # they replace it once they have probed the moved node
+    former = a.reference
+    a.changeId(former.id + 1)
+    factory.reindexNode(a, former.id)
+    yield sleep(len(nodes) + 2)
+    for node in holders:
+        assert all(w.id != former.id for w in node.N)
+    assert any(a.reference in node.N for node in nodes[1:])
+
+    yield factory.shutdown()
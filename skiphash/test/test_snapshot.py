@@ -0,0 +1,56 @@
+import io
+import logging
+
+import pytest
+import pytest_twisted
+from twisted.python import log
+
+from skiphash.core import sleep
+from skiphash.distrhash import HashNodeFactory
+from skiphash.snapshot import loadSnapshot, readSnapshotStates
+
+observer = log.PythonLoggingObserver()
+observer.start()
+
+# pylint: disable=maybe-no-member
+
+@pytest_twisted.inlineCallbacks
+def test_export_and_restore(caplog):
+    caplog.set_level(logging.WARN, logger='twisted')
+
+    factory = HashNodeFactory(34000)
+    for _ in range(5):
+        factory.newNode()
+
+    yield sleep(3)
+
+    file = io.StringIO()
+    yield factory.exportSnapshot(file)
+
+    # offline model
+    file.seek(0)
+    topology = loadSnapshot(file)
+    assert len(topology.nodes) == 5
+    for node, snapshot in zip(factory.nodes, topology.nodes):
+        assert snapshot == node
+        assert snapshot.rs == node.rs
+        assert snapshot.N == node.N
+        assert snapshot.pred == node.pred
+        assert snapshot.succ == node.succ
+        for i in node.ranges:
+            assert snapshot.ranges[i] == node.ranges[i]
+        assert topology.getLocalNodeByReference(node.reference) is snapshot
+
+    neighborhoods = [(node.rs, set(node.N)) for node in factory.nodes]
+    yield factory.shutdown()
+
+    # warm start
+    file.seek(0)
+    restoredFactory = HashNodeFactory(34000)
+    restoredNodes = restoredFactory.restoreSnapshot(readSnapshotStates(file))
+    for node, (rs, N) in zip(restoredNodes, neighborhoods):
+        assert node.rs == rs
+        assert node.reference.rs == rs
+        assert node.N == N
+
+    yield restoredFactory.shutdown()
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from skiphash.distrhash import Entry
+from skiphash.storage import ArenaStore, LogStore
+
+
+@pytest.fixture(params=["arena", "log"])
+def store(request, tmpdir):
+    if request.param == "arena":
+        yield ArenaStore(Entry)
+    else:
+        logStore = LogStore(str(tmpdir.join("node.log")), Entry)
+        yield logStore
+        logStore.close()
+
+def test_store_operations(store):
+
+    for i in range(10):
+        store["key" + str(i)] = Entry("key" + str(i), "value" + str(i))
+    store["key0"] = Entry("key0", "updated")
+    del store["key1"]
+
+    assert len(store) == 9
+    assert "key1" not in store
+    assert store.get("key1", None) is None
+    assert store["key0"].value == "updated"
+    assert store["key9"].value == "value9"
+    assert sorted(store.keys()) == sorted("key" + str(i) for i in range(10) if i != 1)
+
+    with pytest.raises(KeyError):
+        del store["key1"]
+
+    assert store.pop("key2").value == "value2"
+    store.update({"key10": Entry("key10", "value10")})
+    assert store["key10"].value == "value10"
+    assert store["key10"].expiresAt is None
+    store["key11"] = Entry("key11", "value11", 1234.5)
+    assert store["key11"].expiresAt == 1234.5
+
+def test_arena_store_compaction():
+    store = ArenaStore(Entry)
+    for i in range(1000):
+        store["key" + str(i)] = Entry("key" + str(i), "x" * 100)
+    for i in range(900):
+        del store["key" + str(i)]
+
+    # the arena has been compacted automatically
+    entryLength = len('["' + "x" * 100 + '"]')
+    assert len(store._arena) < 1000 * entryLength
+    store.compact()
+    assert len(store._arena) == 100 * entryLength
+    assert len(store) == 100
+    for i in range(900, 1000):
+        assert store["key" + str(i)].value == "x" * 100
+
+def test_log_store_recovery(tmpdir):
+    path = str(tmpdir.join("node.log"))
+    store = LogStore(path, Entry)
+    for i in range(5):
+        store["key" + str(i)] = Entry("key" + str(i), "value" + str(i))
+    store["key0"] = Entry("key0", "updated")
+    del store["key4"]
+    store.close()
+
+    # simulate a crash during a write
+    with open(path, "ab") as file:
+        file.write(LogStore.HEADER.pack(LogStore.PUT, 4, 100) + b"key5")
+
+    store = LogStore(path, Entry)
+    assert len(store) == 4
+    assert store["key0"].value == "updated"
+    assert store["key3"].value == "value3"
+    assert "key4" not in store
+
+    # the incomplete record has been removed, so appending works again
+    store["key5"] = Entry("key5", "value5")
+    store.close()
+    store = LogStore(path, Entry)
+    assert store["key5"].value == "value5"
+
+    sizeBefore = os.path.getsize(path)
+    store.compact()
+    assert os.path.getsize(path) < sizeBefore
+    assert sorted(store.keys()) == ["key0", "key1", "key2", "key3", "key5"]
+    assert store["key0"].value == "updated"
+
+    store.clear()
+    assert len(store) == 0
+    store.close()
+    assert len(LogStore(path, Entry)) == 0
+
+def test_log_store_mark(tmpdir):
+    path = str(tmpdir.join("node.log"))
+    store = LogStore(path, Entry)
+    for i in range(4):
+        store["key" + str(i)] = Entry("key" + str(i), "value" + str(i))
+    store.mark()
+    assert store.markedKeys == {"key0", "key1", "key2", "key3"}
+    # written entries are not marked anymore
+    store["key0"] = Entry("key0", "updated")
+    del store["key1"]
+    store["key4"] = Entry("key4", "value4")
+    assert store.markedKeys == {"key2", "key3"}
+    store.close()
+
+    store = LogStore(path, Entry)
+    assert store.markedKeys == {"key2", "key3"}
+    store.compact()
+    store.close()
+    store = LogStore(path, Entry)
+    assert store.markedKeys == {"key2", "key3"}
+    assert sorted(store.keys()) == ["key0", "key2", "key3", "key4"]
+    assert store["key0"].value == "updated"
+    store.close()
@@ -0,0 +1,102 @@
+import random
+import time
+
+import numpy as np
+import pytest
+
+from skiphash.core import CopyableBitArray, randomBitArray
+from skiphash.skipplus import (RS_BIT_LENGTH, SkipNodeReference, computeRanges,
+                               highest, levelPred, levelSucc, lowest)
+from skiphash.vectorized import (NeighborhoodArrays, RangeComputer,
+                                 computeAllRanges, levelNeighborIndices,
+                                 rsValue)
+from skiphash.vectorized import computeRanges as vectorizedComputeRanges
+
+
+@pytest.fixture
+def references():
+    random.seed(42)
+    return [SkipNodeReference("192.0.2.{}".format(i % 250), 40000 + i, CopyableBitArray(randomBitArray(2)))
+            for i in range(200)]
+
+def test_ranges_match(references):
+    for _ in range(20):
+        v = random.choice(references)
+        N = set(random.sample(references, random.randint(0, 50))) - {v}
+        assert vectorizedComputeRanges(v, N) == computeRanges(v, N)
+
+def test_level_neighbors_match(references):
+    v = references[0]
+    N = set(references[1:60])
+    neighborhood = NeighborhoodArrays(N)
+    preds, succs = levelNeighborIndices(np.array([v.id], dtype=np.uint64), np.array([rsValue(v.rs)], dtype=np.uint64),
+                                        neighborhood.ids, neighborhood.rs)
+    for i in range(RS_BIT_LENGTH-1):
+        for x in (0, 1):
+            for indices, expected, none in ((preds, levelPred(i, v, bool(x), N), lowest),
+                                            (succs, levelSucc(i, v, bool(x), N), highest)):
+                index = indices[0, i, x]
+                assert expected == (none if index == -1 else neighborhood.references[index])
+
+def test_all_ranges_match(references):
+    allRanges = computeAllRanges(references, chunkSize=64)
+    for v, ranges in zip(sorted(references), allRanges):
+        assert ranges == computeRanges(v, set(references) - {v})[0]
+
+def test_longer_random_bit_strings():
+    random.seed(43)
+    references = [SkipNodeReference("192.0.2.{}".format(i % 250), 41000 + i, CopyableBitArray(randomBitArray(5)))
+                    for i in range(100)]
+    for v in references[:20]:
+        N = set(references) - {v}
+        assert vectorizedComputeRanges(v, N) == computeRanges(v, N)
+    allRanges = computeAllRanges(references)
+    for v, ranges in zip(sorted(references), allRanges):
+        assert ranges == computeRanges(v, set(references) - {v})[0]
+
+def test_neighborhood_update(references):
+    neighborhood = NeighborhoodArrays(set())
+    N = set()
+    for _ in range(30):
+        N = (N - set(random.sample(sorted(N), random.randint(0, len(N)//2)))) | set(random.sample(references, random.randint(0, 10)))
+        neighborhood.update(N)
+        expected = NeighborhoodArrays(N)
+        assert neighborhood.references == expected.references
+        assert (neighborhood.ids == expected.ids).all() and (neighborhood.rs == expected.rs).all()
+    with pytest.raises(ValueError):
+        neighborhood.update(N | {SkipNodeReference("192.0.2.1", 42000, CopyableBitArray(randomBitArray(5)))})
+
+def test_range_computer(references):
+    computeIncrementally = RangeComputer()
+    v = references[0]
+    N = set()
+    for w in references[1:80]:
+        N.add(w)
+        ranges, nodesInRanges = computeIncrementally(v, N)
+        assert (ranges, nodesInRanges) == computeRanges(v, N)
+        # like a node, keeping only the nodes in its ranges
+        N = set(nodesInRanges)
+    # nodes with longer rs are computed one at a time
+    longer = SkipNodeReference("192.0.2.1", 42000, CopyableBitArray(randomBitArray(5)))
+    assert computeIncrementally(v, N | {longer}) == computeRanges(v, N | {longer})
+    assert computeIncrementally(v, N) == computeRanges(v, N)
+
+def test_range_computer_speedup():
+    """
+    A benchmark of the computations made on linearise: a node with a large neighborhood
+    being introduced to one node after another. Keeping the arrays has to beat rebuilding them.
+    """
+    random.seed(44)
+    references = [SkipNodeReference("192.0.2.{}".format(i % 250), 43000 + i, CopyableBitArray(randomBitArray(2)))
+                    for i in range(2100)]
+    v, N, introduced = references[0], set(references[1:2001]), references[2001:]
+    computeIncrementally = RangeComputer()
+    computeIncrementally(v, N)
+    durations = []
+    for compute in (vectorizedComputeRanges, computeIncrementally):
+        start = time.perf_counter()
+        for u in introduced:
+            compute(v, N | {u})
+        durations.append(time.perf_counter() - start)
+    rebuilding, incremental = durations
+    assert incremental * 2 < rebuilding
@@ -0,0 +1,277 @@
+# Vectorized Skip+ computations on NumPy arrays.
+# Instead of comparing reference objects one at a time, neighborhoods are
+# represented by parallel arrays of ids and random bit strings (both uint64),
+# so that the level predecessors, level successors and ranges of all levels
+# (and of many nodes at once) are computed in a few batched array operations.
+
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+from bitarray import bitarray
+
+import skiphash.skipplus as skip
+from skiphash.skipplus import RS_BIT_LENGTH, SkipNodeReference
+
+MAXIMUM_RS_BIT_LENGTH = 64 # the random bit strings have to fit into uint64 values
+
+def rsValue(rs: bitarray) -> int:
+    """Returns the random bit string rs as an integer, its first bit being the most significant one."""
+    return int(rs.to01(), 2)
+
+def prefixMasks(rsBitLength: int, levels: int) -> np.ndarray:
+    """
+    Returns an array holding, for each level i < levels, the mask that
+    selects the first i bits of an rs value of rsBitLength bits.
+    """
+    return np.array([((1 << i) - 1) << (rsBitLength - i) for i in range(levels)], dtype=np.uint64)
+
+def levelBits(rs: np.ndarray, rsBitLength: int, levels: int) -> np.ndarray:
+    """
+    Returns the bits of the rs values (of rsBitLength bits) at the positions 0 to levels - 1,
+    as an array of shape rs.shape + (levels,).
+    """
+    shifts = np.array([rsBitLength - 1 - i for i in range(levels)], dtype=np.uint64)
+    return ((rs[..., np.newaxis] >> shifts) & np.uint64(1)).astype(bool)
+
+def activeLevels(vRs: int, rs: np.ndarray, rsBitLength: int) -> int:
+    """
+    Returns the number of levels at which a node with the rs value vRs is not alone among
+    the nodes with the rs values rs, i.e. their longest common prefix's length plus one,
+    but at most rsBitLength - 1.
+    """
+    if len(rs) == 0:
+        return 0
+    # the longest common prefix is the one with the smallest difference
+    smallestDifference = int((rs ^ np.uint64(vRs)).min())
+    return min(rsBitLength - smallestDifference.bit_length() + 1, rsBitLength - 1)
+
+class NeighborhoodArrays:
+    """
+    The parallel array representation of a set of SkipNodeReferences.
+    `references` is the list of references sorted by id, `ids` and `rs` hold
+    their ids and rs values at the same indices. All rs have to be of the same
+    length, `rsBitLength`, which is at most MAXIMUM_RS_BIT_LENGTH.
+    """
+
+    def __init__(self, references: Iterable[SkipNodeReference]):
+        self.references = sorted(references)
+        self.rsBitLength = self._checkedRsBitLength(self.references, None)
+        self.ids = np.array([r.id for r in self.references], dtype=np.uint64)
+        self.rs = np.array([rsValue(r.rs) for r in self.references], dtype=np.uint64)
+        self._referenceSet = set(self.references)
+
+    @staticmethod
+    def _checkedRsBitLength(references: List[SkipNodeReference], rsBitLength: int = None) -> int:
+        """Returns the common rs length of the references and rsBitLength (if given), RS_BIT_LENGTH if there are none."""
+        lengths = set(len(r.rs) for r in references)
+        if rsBitLength is not None:
+            lengths.add(rsBitLength)
+        if len(lengths) > 1:
+            raise ValueError("The random bit strings have to be of the same length.")
+        rsBitLength = lengths.pop() if len(lengths) > 0 else RS_BIT_LENGTH
+        if rsBitLength > MAXIMUM_RS_BIT_LENGTH:
+            raise ValueError("Random bit strings of more than {} bits are not supported.".format(MAXIMUM_RS_BIT_LENGTH))
+        return rsBitLength
+
+    def __len__(self):
+        return len(self.references)
+
+    def update(self, references: Set[SkipNodeReference]) -> None:
+        """
+        Makes the arrays represent the provided set of references. Only the references
+        added and removed since the last update are inserted resp. deleted, which is much
+        cheaper than rebuilding the arrays if the set changes by a few nodes.
+        Raises a ValueError if an added reference's rs is of another length.
+        """
+        added = sorted(references.difference(self._referenceSet))
+        removed = self._referenceSet.difference(references)
+        if len(self) == 0:
+            self.__init__(added)
+            return
+        self._checkedRsBitLength(added, self.rsBitLength)
+        if len(removed) > 0:
+            indices = np.searchsorted(self.ids, np.array([r.id for r in removed], dtype=np.uint64))
+            self.ids = np.delete(self.ids, indices)
+            self.rs = np.delete(self.rs, indices)
+            for index in sorted(indices.tolist(), reverse=True):
+                del self.references[index]
+        if len(added) > 0:
+            addedIds = np.array([r.id for r in added], dtype=np.uint64)
+            indices = np.searchsorted(self.ids, addedIds)
+            self.ids = np.insert(self.ids, indices, addedIds)
+            self.rs = np.insert(self.rs, indices, np.array([rsValue(r.rs) for r in added], dtype=np.uint64))
+            # the positions of the added references after the insertion
+            for offset, (index, reference) in enumerate(zip(indices.tolist(), added)):
+                self.references.insert(index + offset, reference)
+        self._referenceSet.difference_update(removed)
+        self._referenceSet.update(added)
+
+    def select(self, mask: np.ndarray) -> Set[SkipNodeReference]:
+        """Returns the set of references selected by the boolean mask."""
+        return set(self.references[index] for index in np.flatnonzero(mask))
+
+def _levelCandidates(vIds: np.ndarray, vRs: np.ndarray, ids: np.ndarray, rs: np.ndarray, rsBitLength: int, levels: int):
+    """
+    Returns the boolean arrays (of shape (m, levels, n) for m nodes v and n neighbors w)
+    needed by the level computations: whether prefix(i, w) = prefix(i, v), whether
+    prefix(i+1, w) = prefix(i, v)◦1, and whether w is left resp. right of v.
+    """
+    vIds = vIds[:, np.newaxis, np.newaxis]
+    matchesPrefix = ((vRs[:, np.newaxis, np.newaxis] ^ rs[np.newaxis, np.newaxis, :])
+                        & prefixMasks(rsBitLength, levels)[np.newaxis, :, np.newaxis]) == 0
+    nextBitIsOne = levelBits(rs, rsBitLength, levels).T[np.newaxis, :, :]
+    left = ids[np.newaxis, np.newaxis, :] < vIds
+    right = ids[np.newaxis, np.newaxis, :] > vIds
+    return matchesPrefix, nextBitIsOne, left, right
+
+def _lastIndices(mask: np.ndarray) -> np.ndarray:
+    """The index of the last True value along the last axis, -1 if there is none."""
+    n = mask.shape[-1]
+    indices = n - 1 - np.argmax(mask[..., ::-1], axis=-1)
+    return np.where(mask.any(axis=-1), indices, -1)
+
+def _firstIndices(mask: np.ndarray) -> np.ndarray:
+    """The index of the first True value along the last axis, -1 if there is none."""
+    return np.where(mask.any(axis=-1), np.argmax(mask, axis=-1), -1)
+
+def levelNeighborIndices(vIds: np.ndarray, vRs: np.ndarray, ids: np.ndarray, rs: np.ndarray,
+                         rsBitLength: int = RS_BIT_LENGTH, levels: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes levelPred(i, v, x, N) and levelSucc(i, v, x, N) for m nodes v (given by
+    the arrays vIds and vRs) and the levels i < levels (all levels of rsBitLength bit rs
+    values by default) at once, N being the n nodes given by the arrays ids and rs,
+    which have to be sorted by id.
+    Returns two int arrays of shape (m, levels, 2), indexed by v, i and x,
+    holding indices into ids or -1 for lowest resp. highest.
+    """
+    if levels is None:
+        levels = rsBitLength - 1
+    matchesPrefix, nextBitIsOne, left, right = _levelCandidates(vIds, vRs, ids, rs, rsBitLength, levels)
+    preds = []
+    succs = []
+    for x in (False, True):
+        levelNodes = matchesPrefix & (nextBitIsOne == x)
+        preds.append(_lastIndices(levelNodes & left))
+        succs.append(_firstIndices(levelNodes & right))
+    return np.stack(preds, axis=-1), np.stack(succs, axis=-1)
+
+def rangeMasks(vIds: np.ndarray, vRs: np.ndarray, ids: np.ndarray, rs: np.ndarray,
+               rsBitLength: int = RS_BIT_LENGTH, levels: int = None) -> np.ndarray:
+    """
+    Computes range(i, v, N) for m nodes v (given by the arrays vIds and vRs) and the
+    levels i < levels (all levels by default) at once, N being the n nodes given by the
+    arrays ids and rs, which have to be sorted by id. A node v that is contained in N
+    is not considered to be in its own ranges.
+    Returns a boolean array of shape (m, levels, n) telling whether N's n-th
+    node is in the i-th range of the m-th node v.
+    """
+    if levels is None:
+        levels = rsBitLength - 1
+    preds, succs = levelNeighborIndices(vIds, vRs, ids, rs, rsBitLength, levels)
+    matchesPrefix, _, left, right = _levelCandidates(vIds, vRs, ids, rs, rsBitLength, levels)
+    positions = np.arange(len(ids))
+
+    # low(i, v, N) is lowest if one of the level predecessors is lowest
+    lowIsLowest = (preds == -1).any(axis=-1)
+    low = preds.min(axis=-1)
+    # high(i, v, N) is highest if one of the level successors is highest
+    highIsHighest = (succs == -1).any(axis=-1)
+    high = succs.max(axis=-1)
+
+    # as ids are sorted, comparing ids is comparing positions
+    aboveLow = lowIsLowest[..., np.newaxis] | (positions >= low[..., np.newaxis])
+    belowHigh = highIsHighest[..., np.newaxis] | (positions <= high[..., np.newaxis])
+    return matchesPrefix & (left | right) & aboveLow & belowHigh
+
+def _rangesFromMasks(neighborhood: NeighborhoodArrays, masks: np.ndarray) -> Dict[int, Set[SkipNodeReference]]:
+    """Returns the ranges selected by the masks of one node, up to its first empty range."""
+    ranges = {}
+    for i in range(len(masks)):
+        if not masks[i].any():
+            break
+        ranges[i] = neighborhood.select(masks[i])
+    return ranges
+
+def computeRanges(v: SkipNodeReference, N: Set[SkipNodeReference]) -> Tuple[Dict[int, Set[SkipNodeReference]], Set[SkipNodeReference]]:
+    """
+    A vectorized replacement for skiphash.skipplus.computeRanges.
+    Only the levels at which v is not alone are computed. If the nodes' rs
+    differ in length, skiphash.skipplus.computeRanges is used instead.
+    """
+    if any(len(w.rs) != len(v.rs) for w in N) or len(v.rs) > MAXIMUM_RS_BIT_LENGTH:
+        return skip.computeRanges(v, N)
+    return _computeRanges(v, NeighborhoodArrays(N))
+
+def _computeRanges(v: SkipNodeReference, neighborhood: NeighborhoodArrays) -> Tuple[Dict[int, Set[SkipNodeReference]], Set[SkipNodeReference]]:
+    """Like computeRanges, the neighborhood being given by arrays whose rs are as long as v's."""
+    vRs = rsValue(v.rs)
+    levels = activeLevels(vRs, neighborhood.rs, len(v.rs))
+    if levels == 0:
+        return {}, set()
+    masks = rangeMasks(np.array([v.id], dtype=np.uint64), np.array([vRs], dtype=np.uint64),
+                        neighborhood.ids, neighborhood.rs, len(v.rs), levels)[0]
+    ranges = _rangesFromMasks(neighborhood, masks)
+    return ranges, set().union(*ranges.values())
+
+class RangeComputer:
+    """
+    A replacement for skiphash.skipplus.computeRanges for the computations of a single
+    node, as called on each linearise. As the node's neighborhood changes by a few nodes
+    between them, the arrays of the previous neighborhood are updated (see
+    NeighborhoodArrays.update) instead of being rebuilt for each computation.
+    Calls from multiple threads (see SkipNode's offloadComputation) are serialized.
+    """
+
+    def __init__(self):
+        self._neighborhood = None
+        self._lock = threading.Lock()
+
+    def __call__(self, v: SkipNodeReference, N: Set[SkipNodeReference]) -> Tuple[Dict[int, Set[SkipNodeReference]], Set[SkipNodeReference]]:
+        if len(v.rs) > MAXIMUM_RS_BIT_LENGTH:
+            return skip.computeRanges(v, N)
+        with self._lock:
+            try:
+                if self._neighborhood is None:
+                    self._neighborhood = NeighborhoodArrays(N)
+                else:
+                    self._neighborhood.update(N)
+            except ValueError:
+                # the nodes' rs differ in length
+                self._neighborhood = None
+                return skip.computeRanges(v, N)
+            if len(self._neighborhood) > 0 and self._neighborhood.rsBitLength != len(v.rs):
+                return skip.computeRanges(v, N)
+            return _computeRanges(v, self._neighborhood)
+
+def computeAllRanges(references: Iterable[SkipNodeReference], chunkSize: int = 256) -> List[Dict[int, Set[SkipNodeReference]]]:
+    """
+    Computes the ranges each of the provided nodes has in a Skip+ graph consisting
+    of exactly these nodes, i.e. the ranges of the ideal Skip+ topology.
+    The rs of the nodes have to be of the same length.
+    Returns a list of range dicts in the order of the references sorted by id.
+    The nodes are processed in chunks of chunkSize nodes to limit memory usage.
+    """
+    nodes = NeighborhoodArrays(references)
+    # the number of levels at which any two nodes share their prefix
+    sortedRs = np.sort(nodes.rs)
+    levels = 0
+    if len(nodes) > 1:
+        levels = min(nodes.rsBitLength - int((sortedRs[1:] ^ sortedRs[:-1]).min()).bit_length() + 1, nodes.rsBitLength - 1)
+    result = []
+    for start in range(0, len(nodes), chunkSize):
+        masks = rangeMasks(nodes.ids[start:start+chunkSize], nodes.rs[start:start+chunkSize], nodes.ids, nodes.rs,
+                            nodes.rsBitLength, levels)
+        result.extend(_rangesFromMasks(nodes, chunkMasks) for chunkMasks in masks)
+    return result
+
+def prefixGroups(rs: np.ndarray, prefixLength: int, rsBitLength: int = RS_BIT_LENGTH) -> Dict[int, np.ndarray]:
+    """
+    Groups the indices of the rs values (of rsBitLength bits) by their first prefixLength bits.
+    Returns a dict mapping each prefix (as an integer) to the ascending indices
+    of the rs values starting with it.
+    """
+    prefixes = rs >> np.uint64(rsBitLength - prefixLength)
+    order = np.argsort(prefixes, kind="stable")
+    uniquePrefixes, starts = np.unique(prefixes[order], return_index=True)
+    return dict(zip(uniquePrefixes.tolist(), np.split(order, starts[1:])))